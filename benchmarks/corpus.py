@@ -0,0 +1,105 @@
+"""
+Deterministic synthetic corpus for the benchmarks: the same seed always gives the same documents.
+"""
+from hashlib import sha256
+
+import cv2
+import numpy as np
+import pymupdf
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Pages A4 rendues à 100, 150 et 300 dpi
+RESOLUTIONS = {
+    "a4_100dpi": (827, 1169),
+    "a4_150dpi": (1240, 1754),
+    "a4_300dpi": (2480, 3508),
+}
+BLUR_KERNEL_SIZE = 9
+PDF_PAGE_COUNTS = (1, 5, 20)
+ENCRYPTION_KEY = bytes(range(32))
+
+
+class CorpusImage:
+    def __init__(self, name: str, gray: np.ndarray, kind: str):
+        self.name = name
+        self.gray = gray
+        self.kind = kind
+
+
+class CorpusDocument:
+    def __init__(self, name: str, content: bytes, page_count: int):
+        self.name = name
+        self.content = content
+        self.page_count = page_count
+
+
+class CorpusEncryptedFile:
+    def __init__(self, name: str, path: str, encrypted_content: bytes):
+        self.name = name
+        self.path = path
+        self.encrypted_content = encrypted_content
+
+
+def text_page(width: int, height: int, random: np.random.RandomState) -> np.ndarray:
+    """
+    A white page with lines of random words, in the layout of a scanned document.
+    """
+    page = np.full((height, width), 255, dtype=np.uint8)
+    font_scale = width / 1000
+    thickness = max(1, round(width / 800))
+    line_height = int(40 * font_scale) + 10
+    alphabet = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"))
+    margin = width // 10
+    for y in range(margin, height - margin, line_height):
+        words = [''.join(random.choice(alphabet, size=random.randint(2, 10))) for _ in range(8)]
+        cv2.putText(page, ' '.join(words), (margin, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 0, thickness,
+                    cv2.LINE_AA)
+    return page
+
+
+def build_images(seed: int = 0) -> list[CorpusImage]:
+    random = np.random.RandomState(seed)
+    images = []
+    for resolution, (width, height) in RESOLUTIONS.items():
+        sharp = text_page(width, height, random)
+        images.append(CorpusImage(f"sharp_{resolution}", sharp, "sharp"))
+        images.append(CorpusImage(f"blurred_{resolution}",
+                                  cv2.GaussianBlur(sharp, (BLUR_KERNEL_SIZE, BLUR_KERNEL_SIZE), 0), "blurred"))
+        images.append(CorpusImage(f"blank_{resolution}", np.full((height, width), 255, dtype=np.uint8), "blank"))
+    return images
+
+
+def build_pdfs(seed: int = 0) -> list[CorpusDocument]:
+    """
+    Multi-page PDFs of scanned pages (one image per page), alternating sharp and blurred pages.
+    """
+    random = np.random.RandomState(seed)
+    width, height = RESOLUTIONS["a4_150dpi"]
+    sharp = text_page(width, height, random)
+    blurred = cv2.GaussianBlur(sharp, (BLUR_KERNEL_SIZE, BLUR_KERNEL_SIZE), 0)
+    page_images = [cv2.imencode(".png", image)[1].tobytes() for image in (sharp, blurred)]
+
+    documents = []
+    for page_count in PDF_PAGE_COUNTS:
+        doc = pymupdf.open()
+        for index in range(page_count):
+            page = doc.new_page(width=595, height=842)
+            page.insert_image(page.rect, stream=page_images[index % 2])
+        documents.append(CorpusDocument(f"scan_{page_count}_pages", doc.tobytes(), page_count))
+        doc.close()
+    return documents
+
+
+def encrypt(content: bytes, path: str, key: bytes = ENCRYPTION_KEY) -> bytes:
+    """
+    Encrypt like the storage does for key version 2: AES-GCM, IV derived from the path, tag appended.
+    """
+    return AESGCM(key).encrypt(sha256(path.encode()).digest(), content, None)
+
+
+def build_encrypted_files(documents: list[CorpusDocument]) -> list[CorpusEncryptedFile]:
+    files = []
+    for document in documents:
+        path = f"benchmark/{document.name}.pdf"
+        files.append(CorpusEncryptedFile(document.name, path, encrypt(document.content, path)))
+    return files
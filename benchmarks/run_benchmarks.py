@@ -0,0 +1,313 @@
+"""
+Per-stage micro-benchmarks of the analysis hot path on the synthetic corpus.
+
+    poetry run python -m benchmarks.run_benchmarks --output results.json
+    poetry run python -m benchmarks.run_benchmarks --baseline results.json
+
+Each stage is timed separately on every item of the corpus and reported as JSON: latency percentiles,
+throughput and peak memory. With --baseline, the median latency and the throughput of each stage are compared
+with a previous run.
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Le logger du service ne configure pas Logstash quand un handler existe déjà : les benchmarks tournent hors
+# production et ne doivent pas être ralentis par les logs ni par l'agent APM
+logging.basicConfig(level=logging.WARNING)
+os.environ.setdefault("ELASTIC_APM_ENABLED", "false")
+
+import cv2
+import numpy as np
+import pymupdf
+
+from benchmarks import corpus
+
+# Les messages affichés à l'import de la configuration de logs ne doivent pas se mêler au JSON sur stdout
+with contextlib.redirect_stdout(sys.stderr):
+    from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.data.file_dto import FileDto
+from dossierfacile_file_analysis.executor.tasks.analyse_files import AnalyseFiles
+from dossierfacile_file_analysis.executor.tasks.prepare_data_for_analysis import PrepareDataForAnalysis
+from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
+from dossierfacile_file_analysis.services.blur_statistics_engine import BlurStatisticsEngine
+from dossierfacile_file_analysis.services.file_downloader.file_downloader import FileDownloader
+
+logger.setLevel(logging.WARNING)
+
+
+class BenchmarkItem:
+    """
+    One call of a stage: its input, and the units (pages, bytes) it processes for the throughput.
+    """
+
+    def __init__(self, name: str, run, units: float = 1, unit: str = "items"):
+        self.name = name
+        self.run = run
+        self.units = units
+        self.unit = unit
+
+
+class StageUnavailable(Exception):
+    pass
+
+
+class BenchmarkFileDownloader(FileDownloader):
+    """
+    Serves the encrypted corpus files like the storage downloaders once the file is downloaded: the encrypted file
+    written in work_directory is memory-mapped and streamed to LOCAL_FILE_PATH, or the encrypted buffer is
+    decrypted in memory (IN_MEMORY_PIPELINE).
+    """
+
+    def __init__(self, encrypted_files: list[corpus.CorpusEncryptedFile], work_directory: str, in_memory: bool):
+        super().__init__()
+        self.local_file_path = f"{work_directory}/decrypted/"
+        self.in_memory = in_memory
+        self.encrypted_contents = {encrypted.path: encrypted.encrypted_content for encrypted in encrypted_files}
+        self.encrypted_paths = {}
+        for encrypted in encrypted_files:
+            self.encrypted_paths[encrypted.path] = os.path.join(work_directory, f"{encrypted.name}.encrypted")
+            with open(self.encrypted_paths[encrypted.path], "wb") as encrypted_file:
+                encrypted_file.write(encrypted.encrypted_content)
+            # Le fichier déchiffré reprend le chemin du fichier dans le stockage
+            os.makedirs(os.path.dirname(f"{self.local_file_path}{encrypted.path}"), exist_ok=True)
+
+    def download_file(self, file_dto: FileDto) -> DownloadedFile:
+        if self.in_memory:
+            return self.decrypt_data_with_key(self.encrypted_contents[file_dto.path], file_dto)
+        return self.decrypt_file_with_key(self.encrypted_paths[file_dto.path], file_dto)
+
+
+def _file_dto(encrypted: corpus.CorpusEncryptedFile) -> FileDto:
+    return FileDto(id=0, path=encrypted.path, content_type="application/pdf", encryption_key=corpus.ENCRYPTION_KEY,
+                   encryption_key_version=2, provider="BENCHMARK")
+
+
+def build_stages(seed: int) -> dict[str, list[BenchmarkItem]]:
+    images = corpus.build_images(seed)
+    documents = corpus.build_pdfs(seed)
+    encrypted_files = corpus.build_encrypted_files(documents)
+    analyse_files = AnalyseFiles()
+    # Même analyse avec le moteur de statistiques fusionné (BLUR_FUSED_STATS_ENABLED)
+    fused_analyse_files = AnalyseFiles()
+    fused_analyse_files.blur_statistics = BlurStatisticsEngine()
+    prepare_data = PrepareDataForAnalysis()
+    # Même rendu en deux temps : vignette, puis bande de texte seule (PDF_TWO_PHASE_RENDER_ENABLED)
+    two_phase_prepare_data = PrepareDataForAnalysis()
+    two_phase_prepare_data.two_phase_render = True
+    text_images = [image for image in images if image.kind != "blank"]
+    # Fichiers chiffrés et déchiffrés sur disque, supprimés à la fin du run
+    work_directory = tempfile.mkdtemp(prefix="blurry-benchmarks-")
+    atexit.register(shutil.rmtree, work_directory, ignore_errors=True)
+    disk_downloader = BenchmarkFileDownloader(encrypted_files, work_directory, in_memory=False)
+    memory_downloader = BenchmarkFileDownloader(encrypted_files, work_directory, in_memory=True)
+
+    def _is_readable(gray):
+        try:
+            return analyse_files.is_readable(gray)
+        except Exception as e:
+            # Tesseract absent de la machine : l'étape est ignorée
+            raise StageUnavailable(str(e)) from e
+
+    return {
+        "decrypt_stream[disk]": [
+            BenchmarkItem(encrypted.name,
+                          lambda encrypted=encrypted: disk_downloader.download_file(_file_dto(encrypted)),
+                          units=len(encrypted.encrypted_content), unit="bytes")
+            for encrypted in encrypted_files
+        ],
+        "decrypt_stream[memory]": [
+            BenchmarkItem(encrypted.name,
+                          lambda encrypted=encrypted: memory_downloader.download_file(_file_dto(encrypted)),
+                          units=len(encrypted.encrypted_content), unit="bytes")
+            for encrypted in encrypted_files
+        ],
+        "_pdf_to_images": [
+            BenchmarkItem(document.name,
+                          lambda document=document: prepare_data._pdf_to_images(
+                              DownloadedFile(file_name=document.name, file_path=None, file_type="application/pdf",
+                                             file_content=document.content)),
+                          units=document.page_count, unit="pages")
+            for document in documents
+        ],
+        "_pdf_to_images[two_phase]": [
+            BenchmarkItem(document.name,
+                          lambda document=document: two_phase_prepare_data._pdf_to_images(
+                              DownloadedFile(file_name=document.name, file_path=None, file_type="application/pdf",
+                                             file_content=document.content)),
+                          units=document.page_count, unit="pages")
+            for document in documents
+        ],
+        "_extract_text_band": [
+            BenchmarkItem(image.name, lambda image=image: analyse_files._extract_text_band(image.gray))
+            for image in text_images
+        ],
+        "_detect_blur_laplacian": [
+            BenchmarkItem(image.name, lambda image=image: analyse_files._detect_blur_laplacian(image.gray, True))
+            for image in images
+        ],
+        "_detect_blur_laplacian[fused]": [
+            BenchmarkItem(image.name, lambda image=image: fused_analyse_files._detect_blur_laplacian(image.gray, True))
+            for image in images
+        ],
+        "_tile_statistics": [
+            BenchmarkItem(image.name, lambda image=image: analyse_files._tile_statistics(image.gray))
+            for image in text_images
+        ],
+        "is_readable": [
+            BenchmarkItem(image.name, lambda image=image: _is_readable(image.gray))
+            for image in text_images
+        ],
+    }
+
+
+def _percentiles(latencies_ms: list[float]) -> dict:
+    values = np.array(latencies_ms)
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def run_stage(items: list[BenchmarkItem], repeat: int) -> dict:
+    # Échauffement : imports paresseux, caches OpenCV, première ouverture des documents
+    for item in items:
+        item.run()
+
+    latencies_ms = []
+    by_item = {}
+    total_units = 0
+    total_seconds = 0.0
+    for item in items:
+        item_latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            item.run()
+            elapsed = time.perf_counter() - start
+            item_latencies.append(elapsed * 1000)
+            total_units += item.units
+            total_seconds += elapsed
+        latencies_ms.extend(item_latencies)
+        by_item[item.name] = round(float(np.median(item_latencies)), 3)
+
+    # Passe séparée pour la mémoire : tracemalloc ralentit les allocations et fausserait les temps
+    peak_bytes = 0
+    for item in items:
+        tracemalloc.start()
+        try:
+            item.run()
+            peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "calls": len(latencies_ms),
+        "latencyMs": _percentiles(latencies_ms),
+        "throughput": {
+            "callsPerSecond": round(len(latencies_ms) / total_seconds, 3),
+            f"{items[0].unit}PerSecond": round(total_units / total_seconds, 3),
+        },
+        "peakTracedMemoryMb": round(peak_bytes / (1024 * 1024), 3),
+        "medianLatencyMsByItem": by_item,
+    }
+
+
+def run(seed: int, repeat: int, stage_names: list[str] | None = None) -> dict:
+    stages = build_stages(seed)
+    results = {}
+    for name, items in stages.items():
+        if stage_names and name not in stage_names:
+            continue
+        try:
+            results[name] = run_stage(items, repeat)
+        except StageUnavailable as e:
+            results[name] = {"skipped": str(e)}
+        print(f"{name}: {json.dumps(results[name].get('latencyMs', results[name]))}", file=sys.stderr)
+    return {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "seed": seed,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "pymupdf": pymupdf.VersionBind,
+        },
+        "stages": results,
+        # ru_maxrss est en kio sous Linux
+        "peakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> tuple[dict, bool]:
+    """
+    Ratio current / baseline of the median latency and of the throughput of every stage present in both runs.
+    The latency ratio is the geometric mean of the ratios of the median latency of each corpus item, so that the
+    large items do not hide the small ones. A stage regresses when it grew by more than max_regression.
+    """
+    comparison = {}
+    regressed = False
+    for name, stage in current["stages"].items():
+        baseline_stage = baseline.get("stages", {}).get(name)
+        if not baseline_stage or "latencyMs" not in stage or "latencyMs" not in baseline_stage:
+            continue
+        items = stage["medianLatencyMsByItem"]
+        baseline_items = baseline_stage["medianLatencyMsByItem"]
+        ratios = [items[item] / baseline_items[item] for item in items if baseline_items.get(item)]
+        latency_ratio = float(np.exp(np.mean(np.log(ratios)))) if ratios else \
+            stage["latencyMs"]["p50"] / baseline_stage["latencyMs"]["p50"]
+        throughput_ratio = stage["throughput"]["callsPerSecond"] / baseline_stage["throughput"]["callsPerSecond"]
+        stage_regressed = latency_ratio > 1 + max_regression
+        regressed = regressed or stage_regressed
+        comparison[name] = {
+            "medianLatencyRatio": round(latency_ratio, 3),
+            "throughputRatio": round(throughput_ratio, 3),
+            "regressed": stage_regressed,
+        }
+    return comparison, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Tolerated growth of the median latency before a stage is reported as regressed")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per corpus item")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    parser.add_argument("--stage", action="append", dest="stages", help="Only run this stage (repeatable)")
+    args = parser.parse_args(argv)
+
+    results = run(args.seed, args.repeat, args.stages)
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            results["comparison"], regressed = compare(results, json.load(baseline_file), args.max_regression)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
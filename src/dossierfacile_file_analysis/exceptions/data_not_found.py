@@ -4,4 +4,9 @@ from dossierfacile_file_analysis.exceptions.retryable_exception import Retryable
 class DataNotFoundException(RetryableException):
     
     def __init__(self, file_id: int):
-        super().__init__(f"Data not found for file_id: {file_id}")
\ No newline at end of file
+        super().__init__(f"Data not found for file_id: {file_id}")
+        self.file_id = file_id
+
+    def __reduce__(self):
+        # Permet de renvoyer l'exception depuis un worker process sans altérer le message
+        return self.__class__, (self.file_id,)
@@ -2,3 +2,7 @@ class EncryptionKeyIsMissingException(Exception):
 
     def __init__(self, file_id: int):
         super().__init__(f"Encryption key is missing for : {file_id}")
+        self.file_id = file_id
+
+    def __reduce__(self):
+        return self.__class__, (self.file_id,)
@@ -2,3 +2,7 @@ class InvalidMimeTypeException(Exception):
 
     def __init__(self, file_id: int):
         super().__init__(f"Invalid mime type for : {file_id}")
+        self.file_id = file_id
+
+    def __reduce__(self):
+        return self.__class__, (self.file_id,)
@@ -1,13 +1,18 @@
+import time
+
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.executor.tasks.analyse_files import AnalyseFiles
+from dossierfacile_file_analysis.executor.tasks.check_blurry_result_cache import CheckBlurryResultCache
 from dossierfacile_file_analysis.executor.tasks.clean_data import CleanData
 from dossierfacile_file_analysis.executor.tasks.download_file import DownloadFile
 from dossierfacile_file_analysis.executor.tasks.get_data_from_db import GetDataFromDB
 from dossierfacile_file_analysis.executor.tasks.prepare_data_for_analysis import PrepareDataForAnalysis
 from dossierfacile_file_analysis.executor.tasks.save_blurry_result_to_db import SaveBlurryResultToDB
+from dossierfacile_file_analysis.executor.tasks.store_blurry_result_in_cache import StoreBlurryResultInCache
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
 from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
+from dossierfacile_file_analysis.services.metrics_registry import MetricsRegistry
 
 
 class BlurryExecutor:
@@ -18,36 +23,78 @@ class BlurryExecutor:
 
     def __init__(self, queue_message: BlurryQueueMessage):
         self.blurry_execution_context = BlurryExecutionContext(queue_message)
-        self.blurry_tasks: list[AbstractBlurryTask] = [
+        # Les tâches sont regroupées par étape : I/O de lecture, calcul, I/O d'écriture (voir BlurryPipeline)
+        self.fetch_tasks: list[AbstractBlurryTask] = [
             GetDataFromDB(),
             DownloadFile(),
+            CheckBlurryResultCache()
+        ]
+        self.analysis_tasks: list[AbstractBlurryTask] = [
             PrepareDataForAnalysis(),
-            AnalyseFiles(),
-            SaveBlurryResultToDB()
+            AnalyseFiles()
         ]
+        self.save_tasks: list[AbstractBlurryTask] = [
+            SaveBlurryResultToDB(),
+            StoreBlurryResultInCache()
+        ]
+        self.blurry_tasks: list[AbstractBlurryTask] = self.fetch_tasks + self.analysis_tasks + self.save_tasks
         self.cleanTask = CleanData()
 
+    def run_tasks(self, tasks: list[AbstractBlurryTask]):
+        """
+        Run the given tasks on the execution context, skipping those that do not apply.
+        """
+        for task in tasks:
+            if task.has_to_apply(self.blurry_execution_context):
+                task.run(self.blurry_execution_context)
+            else:
+                logger.info(f"Skipping task: {task.task_name} for file_id: {self.blurry_execution_context.file_id}")
+                MetricsRegistry().tasks.inc(task=task.task_name,
+                                            content_type=self.blurry_execution_context.content_type(),
+                                            outcome="skipped")
+
+    def log_completion(self):
+        logger.info(
+            f"Blurry file analysis completed for file_id: {self.blurry_execution_context.file_id} with execution_id: {self.blurry_execution_context.execution_id}"
+        )
+        logger.info(
+            f"Blurry result: {self.blurry_execution_context.blurry_result if self.blurry_execution_context.blurry_result else 'No result'}"
+        )
+
+    def record_metrics(self, outcome: str, duration: float):
+        """
+        Record the metrics of the message. Must be called before clean, which removes the downloaded file.
+        """
+        context = self.blurry_execution_context
+        metrics = MetricsRegistry()
+        content_type = context.content_type()
+        metrics.message_duration.observe(duration, content_type=content_type, outcome=outcome)
+        metrics.messages.inc(content_type=content_type, outcome=outcome)
+        if context.analysed_page_count:
+            metrics.pages.inc(context.analysed_page_count, content_type=content_type)
+        if context.downloaded_file is not None:
+            metrics.downloaded_bytes.inc(context.downloaded_file.size(), content_type=content_type,
+                                         provider=context.file_dto.provider if context.file_dto else "unknown")
+
+    def clean(self):
+        if self.cleanTask:
+            self.cleanTask.run(self.blurry_execution_context)
+        else:
+            logger.info("No clean task defined, skipping cleanup.")
+
     def execute(self):
         """
-        Execute the analysis of the blurry file.
+        Execute the analysis of the blurry file and return its result.
         """
+        start_time = time.perf_counter()
+        outcome = "failure"
         try:
-            for task in self.blurry_tasks:
-                if task.has_to_apply(self.blurry_execution_context):
-                    task.run(self.blurry_execution_context)
-                else:
-                    logger.info(f"Skipping task: {task.task_name} for file_id: {self.blurry_execution_context.file_id}")
-            logger.info(
-                f"Blurry file analysis completed for file_id: {self.blurry_execution_context.file_id} with execution_id: {self.blurry_execution_context.execution_id}"
-            )
-            logger.info(
-                f"Blurry result: {self.blurry_execution_context.blurry_result if self.blurry_execution_context.blurry_result else 'No result'}"
-            )
+            self.run_tasks(self.blurry_tasks)
+            outcome = "success"
+            self.log_completion()
+            return self.blurry_execution_context.blurry_result
         except Exception as e:
             raise e
         finally:
-            if self.cleanTask:
-                self.cleanTask.run(self.blurry_execution_context)
-            else:
-                logger.info("No clean task defined, skipping cleanup.")
-
+            self.record_metrics(outcome, time.perf_counter() - start_time)
+            self.clean()
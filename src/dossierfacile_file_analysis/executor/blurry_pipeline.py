@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.thread import ThreadPoolExecutor
+from typing import Callable
+
+import elasticapm
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.executor.blurry_executor import BlurryExecutor
+from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
+from dossierfacile_file_analysis.services.blurry_message_processor import BlurryMessageProcessor
+
+
+class _PipelineStage:
+    def __init__(self, name: str, concurrency: int, executor: ThreadPoolExecutor,
+                 get_tasks: Callable[[BlurryExecutor], list[AbstractBlurryTask]]):
+        self.name = name
+        self.concurrency = concurrency
+        self.executor = executor
+        self.get_tasks = get_tasks
+
+
+class _PipelineItem:
+    def __init__(self, body, retry_count: int, future: Future):
+        self.body = body
+        self.retry_count = retry_count
+        self.future = future
+        self.started_at = time.perf_counter()
+        self.blurry_queue_message = None
+        self.blurry_executor: BlurryExecutor | None = None
+        # Contexte du message (transaction APM), réutilisé par chaque étape
+        self.context: contextvars.Context | None = None
+
+
+class BlurryPipeline:
+    """
+    Staged execution of the BlurryExecutor tasks, shared by all the messages of the process.
+    Each stage (fetch: database and object storage, analysis: rendering and blur detection, save: database) has its
+    own number of workers and is fed by a bounded asyncio queue, so that the downloads of the next messages are in
+    flight while the CPUs analyse the current ones, and a slow stage applies back-pressure to the previous one.
+    The stage tasks run in thread pools (the database and S3 clients are blocking), driven by an event loop
+    running in a dedicated thread.
+    """
+
+    @staticmethod
+    def _settings() -> dict:
+        return {
+            "fetch": int(os.getenv("PIPELINE_FETCH_CONCURRENCY") or 8),
+            "analysis": int(os.getenv("PIPELINE_ANALYSIS_CONCURRENCY") or 0) or os.cpu_count() or 1,
+            "save": int(os.getenv("PIPELINE_SAVE_CONCURRENCY") or 4),
+            "queue_size": int(os.getenv("PIPELINE_QUEUE_SIZE") or 4)
+        }
+
+    @staticmethod
+    def default_capacity() -> int:
+        """
+        Number of messages needed to keep every stage and queue busy, used as the default prefetch.
+        """
+        settings = BlurryPipeline._settings()
+        return settings["fetch"] + settings["analysis"] + settings["save"] + 3 * settings["queue_size"]
+
+    def __init__(self):
+        settings = self._settings()
+        self.queue_size = settings["queue_size"]
+        self._io_executor = ThreadPoolExecutor(max_workers=settings["fetch"] + settings["save"],
+                                               thread_name_prefix="pipeline-io")
+        self._cpu_executor = ThreadPoolExecutor(max_workers=settings["analysis"], thread_name_prefix="pipeline-cpu")
+        self.stages = [
+            _PipelineStage("fetch", settings["fetch"], self._io_executor, lambda executor: executor.fetch_tasks),
+            _PipelineStage("analysis", settings["analysis"], self._cpu_executor,
+                           lambda executor: executor.analysis_tasks),
+            _PipelineStage("save", settings["save"], self._io_executor, lambda executor: executor.save_tasks)
+        ]
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="blurry-pipeline", daemon=True)
+        self._thread.start()
+        self._queues = asyncio.run_coroutine_threadsafe(self._start_stages(), self._loop).result()
+        logger.info("Blurry pipeline started with stages " +
+                    ", ".join(f"{stage.name}={stage.concurrency}" for stage in self.stages))
+
+    async def _start_stages(self) -> list[asyncio.Queue]:
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._workers = []
+        for index, stage in enumerate(self.stages):
+            outbound = queues[index + 1] if index + 1 < len(queues) else None
+            for _ in range(stage.concurrency):
+                self._workers.append(asyncio.create_task(self._stage_worker(stage, queues[index], outbound)))
+        return queues
+
+    def submit_message(self, body, retry_count: int) -> Future:
+        """
+        Queue a message in the pipeline. The returned future gives the outcome of the message (see
+        BlurryMessageProcessor.process) or its exception.
+        """
+        item = _PipelineItem(body, retry_count, Future())
+        asyncio.run_coroutine_threadsafe(self._enqueue(item), self._loop)
+        return item.future
+
+    async def _enqueue(self, item: _PipelineItem):
+        client = elasticapm.get_client()
+        client.begin_transaction("task")
+        try:
+            item.blurry_queue_message = BlurryMessageProcessor.parse_message(item.body)
+            elasticapm.set_custom_context({"blurry_queue_message": item.blurry_queue_message.to_dict()})
+            item.blurry_executor = BlurryExecutor(item.blurry_queue_message)
+            # La transaction APM suit le message d'une étape à l'autre
+            item.context = contextvars.copy_context()
+        except Exception as e:
+            client.capture_exception()
+            client.end_transaction("message_processing", "failure")
+            item.future.set_exception(e)
+            return
+        await self._queues[0].put(item)
+
+    async def _run_in(self, executor: ThreadPoolExecutor, item: _PipelineItem, function, *args):
+        return await self._loop.run_in_executor(executor, functools.partial(item.context.run, function, *args))
+
+    async def _stage_worker(self, stage: _PipelineStage, inbound: asyncio.Queue, outbound: asyncio.Queue | None):
+        while True:
+            item = await inbound.get()
+            try:
+                await self._run_in(stage.executor, item, item.blurry_executor.run_tasks,
+                                   stage.get_tasks(item.blurry_executor))
+            except Exception as e:
+                logger.error(f"Pipeline stage {stage.name} failed for file_id: {item.blurry_queue_message.file_id}")
+                await self._fail(item, e)
+                continue
+            if outbound is not None:
+                # Attend une place dans la file suivante : contre-pression sur cette étape
+                await outbound.put(item)
+            else:
+                await self._complete(item)
+
+    async def _complete(self, item: _PipelineItem):
+        try:
+            await self._run_in(self._io_executor, item, self._record_metrics_and_clean, item, "success")
+        except Exception as e:
+            logger.error(f"Error while cleaning file_id: {item.blurry_queue_message.file_id}: {e}")
+        item.blurry_executor.log_completion()
+        item.context.run(elasticapm.get_client().end_transaction, "message_processing", "success")
+        item.future.set_result(BlurryMessageProcessor.to_outcome(item.blurry_queue_message,
+                                                                 item.blurry_executor.blurry_execution_context.blurry_result))
+
+    @staticmethod
+    def _record_metrics_and_clean(item: _PipelineItem, outcome: str):
+        try:
+            item.blurry_executor.record_metrics(outcome, time.perf_counter() - item.started_at)
+        finally:
+            item.blurry_executor.clean()
+
+    async def _fail(self, item: _PipelineItem, exception: Exception):
+        client = elasticapm.get_client()
+        item.context.run(client.capture_exception, exc_info=(type(exception), exception, exception.__traceback__))
+        item.context.run(client.end_transaction, "message_processing", "failure")
+        try:
+            await self._run_in(self._io_executor, item, self._record_metrics_and_clean, item, "failure")
+        except Exception as e:
+            logger.error(f"Error while cleaning file_id: {item.blurry_queue_message.file_id}: {e}")
+        try:
+            await self._run_in(self._io_executor, item, BlurryMessageProcessor.save_failed_analysis_if_needed,
+                               item.blurry_queue_message, exception, item.retry_count)
+        except Exception as e:
+            logger.error(f"Error while handling the failure of file_id: {item.blurry_queue_message.file_id}: {e}")
+        item.future.set_exception(exception)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """
+        Stop the stages. Same signature as Executor.shutdown so that the consumer can stop any executor.
+        """
+        async def _cancel_workers():
+            for worker in self._workers:
+                worker.cancel()
+
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(_cancel_workers(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if wait:
+            self._thread.join()
+        self._io_executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+        self._cpu_executor.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -1,7 +1,9 @@
+import time
 from abc import ABC, abstractmethod
 
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.services.metrics_registry import MetricsRegistry
 
 
 class AbstractBlurryTask(ABC):
@@ -26,7 +28,20 @@ class AbstractBlurryTask(ABC):
         """
         self.prepare_task_data(context)
         logger.info(f"Running task: {self.task_name} with context: {context.execution_id}")
-        self._internal_run(context)
+        metrics = MetricsRegistry()
+        start_time = time.perf_counter()
+        # Temps CPU du thread courant : n'inclut pas les pages analysées par le PageAnalysisPool
+        start_cpu_time = time.thread_time()
+        outcome = "failure"
+        try:
+            self._internal_run(context)
+            outcome = "success"
+        finally:
+            content_type = context.content_type()
+            metrics.task_duration.observe(time.perf_counter() - start_time, task=self.task_name,
+                                          content_type=content_type)
+            metrics.task_cpu.inc(time.thread_time() - start_cpu_time, task=self.task_name, content_type=content_type)
+            metrics.tasks.inc(task=self.task_name, content_type=content_type, outcome=outcome)
 
     @abstractmethod
     def _internal_run(self, context: BlurryExecutionContext):
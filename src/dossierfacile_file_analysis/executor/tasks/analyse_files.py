@@ -1,6 +1,6 @@
+import os
 import time
 
-from pytesseract import image_to_data
 import cv2
 import numpy as np
 
@@ -8,7 +8,14 @@ from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
 from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.models.decision_stage import DecisionStage
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 from dossierfacile_file_analysis.models.supported_content_type import SupportedContentType
+from dossierfacile_file_analysis.services.blur_statistics_engine import BlurStatisticsEngine
+from dossierfacile_file_analysis.services.image_decoder import ImageDecoder
+from dossierfacile_file_analysis.services.page_analysis_pool import PageAnalysisPool
+from dossierfacile_file_analysis.services.tesseract_engine import TesseractEngine
+from dossierfacile_file_analysis.services.text_band_locator import DEFAULT_PROJ_THRESHOLD, TextBandLocator
 
 
 class AnalyseFiles(AbstractBlurryTask):
@@ -17,38 +24,133 @@ class AnalyseFiles(AbstractBlurryTask):
         super().__init__(task_name="AnalyseFiles")
         self.laplacian_variance_threshold = 250
         self.mean_gray_threshold = 245
-        self.proj_threshold = 0.6
+        self.proj_threshold = DEFAULT_PROJ_THRESHOLD
         self.average_confidence_threshold = 40
+        self.page_analysis_pool = PageAnalysisPool()
+        self.tesseract_engine = TesseractEngine()
+        # Arrêt anticipé : en dessous de ce plancher, une page est forcément floue et le verdict ne peut plus changer
+        self.early_exit_variance_floor = float(os.getenv("BLUR_EARLY_EXIT_VARIANCE") or 0)
+        if self.early_exit_variance_floor > self.laplacian_variance_threshold:
+            logger.warning("BLUR_EARLY_EXIT_VARIANCE is above the blur threshold, using the threshold instead")
+            self.early_exit_variance_floor = self.laplacian_variance_threshold
+        # Cascade : les étapes peu coûteuses décident avant l'OCR, qui n'est lancé qu'en cas de doute
+        self.ocr_cascade_enabled = os.getenv("OCR_CASCADE_ENABLED", "false").lower() == "true"
+        self.cascade_thumbnail_max_side = int(os.getenv("OCR_CASCADE_THUMBNAIL_MAX_SIDE") or 1000)
+        self.cascade_blurry_ratio = float(os.getenv("OCR_CASCADE_BLURRY_RATIO") or 0.5)
+        self.cascade_sharp_ratio = float(os.getenv("OCR_CASCADE_SHARP_RATIO") or 2.0)
+        # Les grandes photos sont décodées à résolution réduite, le seuil de flou est ajusté à l'échelle
+        self.image_decoder = ImageDecoder() if ImageDecoder.is_enabled() else None
+        self.reduced_threshold_exponent = float(os.getenv("IMAGE_REDUCED_THRESHOLD_EXPONENT") or 1.5)
+        # Statistiques calculées en un minimum de passes, avec des tampons réutilisés d'une page à l'autre
+        self.blur_statistics = BlurStatisticsEngine() if BlurStatisticsEngine.is_enabled() else None
+        # Toutes les bandes de texte sont mesurées : la moins nette décide (documents partiellement flous)
+        self.multi_band_enabled = os.getenv("BLUR_MULTI_BAND_ENABLED", "false").lower() == "true"
+        self.band_min_height = int(os.getenv("BLUR_BAND_MIN_HEIGHT") or 10)
+        self.band_max_height = int(os.getenv("BLUR_BAND_MAX_HEIGHT") or 256)
+        self.band_min_contrast = float(os.getenv("BLUR_BAND_MIN_CONTRAST") or 8)
+        self.band_margin = 10
+        # Carte de netteté par tuiles : part des tuiles de texte floues (photo nette dans un coin seulement)
+        self.tiled_sharpness_enabled = os.getenv("BLUR_TILED_SHARPNESS_ENABLED", "false").lower() == "true"
+        self.tile_size = int(os.getenv("BLUR_TILE_SIZE") or 128)
+        self.tile_min_contrast = float(os.getenv("BLUR_TILE_MIN_CONTRAST") or 8)
+        self.max_blurred_tile_fraction = float(os.getenv("BLUR_MAX_BLURRED_TILE_FRACTION") or 0)
 
     def has_to_apply(self, context: BlurryExecutionContext) -> bool:
         if context.file_dto is None and context.downloaded_file is None and context.input_analysis_data is None:
             return False
+        # Résultat déjà connu (cache) : rien à préparer ni à analyser
+        if context.cache_hit:
+            return False
         return True
 
     def _internal_run(self, context: BlurryExecutionContext):
         logger.info("Processing input analysis data...")
         list_of_results: list[BlurryResult] = []
         if context.input_analysis_data.type == SupportedContentType.PDF:
-            # Process each image in the list of images
-            for image_path in context.input_analysis_data.list_of_images:
-                list_of_results.append(self._is_blurry(image_path))
+            # Process each page as it comes, concurrently when the page pool allows it
+            list_of_results.extend(self._analyse_pages(context.input_analysis_data.iter_pages()))
         else:
             # Process the single image file
-            list_of_results.append(self._is_blurry(context.input_analysis_data.initial_file))
+            list_of_results.append(self._is_blurry(context.input_analysis_data.get_initial_source()))
 
+        context.analysed_page_count = len(list_of_results)
         if list_of_results:
-            # filter result to remove blank images
-            filtered_list_of_result = [result for result in list_of_results if not result.is_blank]
-            if not filtered_list_of_result:
-                most_blurry = list_of_results[0]
-            else :
-                most_blurry = min(filtered_list_of_result, key=lambda r: r.laplacian_variance)
-            context.blurry_result = most_blurry
-
-    def _is_blurry(self, file_path: str):
-        gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            context.blurry_result = self._reduce_results(list_of_results)
+
+    def _analyse_pages(self, pages) -> list[BlurryResult]:
+        results = self.page_analysis_pool.imap(self._is_blurry, pages)
+        list_of_results: list[BlurryResult] = []
+        try:
+            for result in results:
+                list_of_results.append(result)
+                if self._is_definitely_blurry(result):
+                    logger.info(f"Page {len(list_of_results)} is definitely blurry, skipping the remaining pages")
+                    break
+        finally:
+            # Annule les pages en attente et ferme le document si les pages sont rendues au fil de l'eau
+            results.close()
+            if hasattr(pages, "close"):
+                pages.close()
+        return list_of_results
+
+    def _is_definitely_blurry(self, result: BlurryResult) -> bool:
+        return self.early_exit_variance_floor > 0 and not result.is_blank \
+            and result.decision_stage != DecisionStage.NATIVE_TEXT \
+            and result.sharpness_score() < self.early_exit_variance_floor
+
+    @staticmethod
+    def _reduce_results(list_of_results: list[BlurryResult]) -> BlurryResult:
+        """
+        Return the most blurry analysed page, or a native text page if no page was analysed, or the first page if
+        every page is blank.
+        """
+        # filter result to remove blank images and native text pages (no Laplacian variance)
+        filtered_list_of_result = [result for result in list_of_results
+                                   if not result.is_blank and result.decision_stage != DecisionStage.NATIVE_TEXT]
+        if not filtered_list_of_result:
+            native_text_results = [result for result in list_of_results
+                                   if result.decision_stage == DecisionStage.NATIVE_TEXT]
+            return native_text_results[0] if native_text_results else list_of_results[0]
+        return min(filtered_list_of_result, key=lambda r: r.sharpness_score())
+
+    @staticmethod
+    def _load_gray(image):
+        """
+        Load an image as a grayscale array from a file path, an encoded in-memory buffer or an already decoded array.
+        """
+        if isinstance(image, np.ndarray):
+            return image
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        return cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+
+    def _load_gray_scaled(self, image):
+        """
+        Load an image as a grayscale array, reduced for large photos when IMAGE_REDUCED_DECODE_ENABLED is true.
+        Return the array and its scale (analysed size / original size).
+        """
+        if self.image_decoder is None or isinstance(image, np.ndarray):
+            return self._load_gray(image), 1.0
+        return self.image_decoder.decode_gray(image)
+
+    def _scaled_threshold(self, scale: float) -> float:
+        """
+        Blur threshold for an image reduced by the given scale: reducing an image concentrates its edges on fewer
+        pixels, which increases the Laplacian variance by about (1 / scale) ** IMAGE_REDUCED_THRESHOLD_EXPONENT.
+        """
+        return self.laplacian_variance_threshold * (1 / scale) ** self.reduced_threshold_exponent
+
+    def _is_blurry(self, image):
+        if isinstance(image, BlurryResult):
+            # Page décidée sans analyse d'image (texte natif)
+            return image
+        page_mean_gray = None
+        if isinstance(image, RenderedBand):
+            # Seule la bande de texte a été rendue : le test de page blanche porte sur la page entière
+            image, page_mean_gray = image.image, image.page_mean_gray
+        gray, scale = self._load_gray_scaled(image)
         if gray is None:
-            logger.error(f"Failed to load image: {file_path}")
+            logger.error(f"Failed to load image: {image if isinstance(image, str) else type(image).__name__}")
             return BlurryResult(
                 laplacian_variance=-1,
                 is_blurry=True,
@@ -57,33 +159,28 @@ class AnalyseFiles(AbstractBlurryTask):
             )
 
         try:
-            result = self._detect_blur_laplacian(gray, self.is_readable(gray))
+            threshold = self._scaled_threshold(scale)
+            if self.ocr_cascade_enabled:
+                result = self._detect_blur_cascade(gray, threshold, page_mean_gray)
+            else:
+                result = self._detect_blur_laplacian(gray, self.is_readable(gray), threshold, page_mean_gray)
+            if self.tiled_sharpness_enabled and not result.is_blank:
+                self._apply_tiled_sharpness(gray, result, threshold)
             return result
         finally:
             # Libérer explicitement la mémoire OpenCV
             del gray
 
     def is_readable(self, gray) -> bool:
-        data = None
-        try:
-            data = image_to_data(gray, output_type='dict')
-            confidences = [int(conf) for conf in data['conf'] if conf != '-1']
-            if confidences:
-                avg_conf = sum(confidences) / len(confidences)
-            else:
-                avg_conf = 0
-            return avg_conf > self.average_confidence_threshold
-        finally:
-            # Libérer les données Tesseract qui peuvent être volumineuses
-            if data is not None:
-                del data
-
+        return self.tesseract_engine.average_confidence(gray) > self.average_confidence_threshold
 
-    def _detect_blur_laplacian(self, gray, is_readable: bool):
+    def _detect_blur_laplacian(self, gray, is_readable: bool, threshold: float | None = None,
+                               page_mean_gray: float | None = None):
+        threshold = threshold or self.laplacian_variance_threshold
         # Calculate variance of Laplacian
         start_time = time.time()
 
-        if np.mean(gray) > self.mean_gray_threshold:  # seuil à ajuster selon les cas
+        if self._mean_gray(gray, page_mean_gray) > self.mean_gray_threshold:  # seuil à ajuster selon les cas
             return BlurryResult(
                 laplacian_variance=-1,
                 is_blurry=False,
@@ -91,6 +188,20 @@ class AnalyseFiles(AbstractBlurryTask):
                 is_readable=is_readable
             )
 
+        if self.multi_band_enabled:
+            bands, tallest = self._extract_text_bands(gray)
+            if not bands:
+                return BlurryResult(laplacian_variance=-1, is_blurry=True, is_blank=False, is_readable=is_readable)
+            laplacian_var, band_variances, worst_band_variance = self._score_text_bands(gray, bands, tallest)
+            return BlurryResult(
+                laplacian_variance=laplacian_var,
+                is_blurry=worst_band_variance < threshold,
+                is_blank=False,
+                is_readable=is_readable,
+                band_variances=band_variances,
+                worst_band_variance=worst_band_variance
+            )
+
         y0, y1 = self._extract_text_band(gray)
         if y0 is None:
             return BlurryResult(
@@ -100,68 +211,224 @@ class AnalyseFiles(AbstractBlurryTask):
                 is_readable=is_readable
             )
 
-        # Créer la matrice Laplacienne et la libérer explicitement
-        laplacian = None
-        try:
-            laplacian = cv2.Laplacian(gray[y0:y1], cv2.CV_64F)
-            laplacian_var = float(laplacian.var())
-        finally:
-            if laplacian is not None:
-                del laplacian
+        laplacian_var = self._band_laplacian_variance(gray, y0, y1)
 
         end_time = time.time()
         logger.info(f"Laplacian variance calculation took: {end_time - start_time:.2f} seconds")
         return BlurryResult(
             laplacian_variance=laplacian_var,
-            is_blurry=laplacian_var < self.laplacian_variance_threshold,
+            is_blurry=laplacian_var < threshold,
             is_blank=False,
             is_readable=is_readable
         )
 
-    def _extract_text_band(self, gray):
-        bw = None
-        kernel = None
-        proj = None
+    def _mean_gray(self, gray, page_mean_gray: float | None = None) -> float:
+        if page_mean_gray is not None:
+            return page_mean_gray
+        if self.blur_statistics is not None:
+            return self.blur_statistics.mean(gray)
+        return np.mean(gray)
 
+    def _band_laplacian_variance(self, gray, y0, y1) -> float:
+        if self.blur_statistics is not None:
+            return self.blur_statistics.laplacian_variance(gray[y0:y1])
+        # Créer la matrice Laplacienne et la libérer explicitement
+        laplacian = None
         try:
-            bw = cv2.adaptiveThreshold(
-                gray, 255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY,
-                blockSize=25, C=10
-            )
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 3))
-            bw = cv2.morphologyEx(bw, cv2.MORPH_OPEN, kernel)
-            proj = np.sum(bw // 255, axis=1)
-            th = proj.max() * self.proj_threshold
-            rows = np.where(proj > th)[0]
-
-            if rows.size == 0:
-                return None, None
-
-            # Trouver la plus grande bande continue
-            bands = []
-            start = rows[0]
-            for i in range(1, len(rows)):
-                if rows[i] > rows[i - 1] + 5:
-                    bands.append((start, rows[i - 1]))
-                    start = rows[i]
-            bands.append((start, rows[-1]))
-
-            # Prendre la bande la plus haute
-            best_band = max(bands, key=lambda band: band[1] - band[0])
-
-            # On élargit un peu la bande pour être robuste (optionnel)
-            margin = 10
-            y0 = max(0, best_band[0] - margin)
-            y1 = min(gray.shape[0], best_band[1] + margin)
-            return y0, y1
+            laplacian = cv2.Laplacian(gray[y0:y1], cv2.CV_64F)
+            return float(laplacian.var())
+        finally:
+            if laplacian is not None:
+                del laplacian
+
+    def _score_text_bands(self, gray, bands: list[tuple[int, int]], tallest: int) \
+            -> tuple[float, list[tuple[int, int, float]], float]:
+        """
+        Measure the text bands in one pass. The bands taller than band_max_height rows are cut into strips, so that
+        a blurry area is not averaged with the sharp rest of the page, and the strips without contrast (margins,
+        background) are left out. The variance of each strip is normalised by its gray level contrast relative to
+        the tallest band, so that a strip with little text is not taken for a blurry one. Return the variance of
+        the tallest band, the normalised variance of each strip and the lowest one.
+        """
+        strips = []
+        for y0, y1 in bands:
+            count = max(1, -(-(y1 - y0) // self.band_max_height))
+            bounds = np.linspace(y0, y1, count + 1).astype(int)
+            strips.extend(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        variances, contrasts = self._rows_statistics(gray, strips + [bands[tallest]])
+        laplacian_var, reference_contrast = variances[-1], contrasts[-1]
+        # La variance du Laplacien croît avec la quantité d'encre : chaque bande est ramenée au contraste de la
+        # bande la plus haute (celle de la mesure historique) avant d'être comparée au seuil
+        band_variances = [(y0, y1, variance * (reference_contrast / contrast) ** 2)
+                          for (y0, y1), variance, contrast in zip(strips, variances, contrasts)
+                          if contrast >= self.band_min_contrast]
+        worst_band_variance = min((variance for _, _, variance in band_variances), default=laplacian_var)
+        return laplacian_var, band_variances, worst_band_variance
+
+    @staticmethod
+    def _rows_statistics(gray, ranges: list[tuple[int, int]]) -> tuple[list[float], list[float]]:
+        """
+        Laplacian variance and gray level standard deviation of every range of rows: the Laplacian of the rows
+        covering the ranges is reduced to per-row sums of values and squares, whose cumulative sums give the
+        statistics of any range. The Laplacian of a range is computed with its actual neighbour rows, not a
+        reflected border.
+        """
+        top = min(y0 for y0, _ in ranges)
+        bottom = max(y1 for _, y1 in ranges)
+        rows = gray[top:bottom]
+        # Valeurs entières inférieures à 2 ** 24 (carrés compris) : exactes en float32
+        buffer = cv2.Laplacian(rows, cv2.CV_32F)
+        laplacian_sums = cv2.reduce(buffer, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)[:, 0]
+        cv2.multiply(buffer, buffer, dst=buffer)
+        laplacian_squares = cv2.reduce(buffer, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)[:, 0]
+        gray_sums = cv2.reduce(rows, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)[:, 0]
+        cv2.multiply(rows, rows, dst=buffer, dtype=cv2.CV_32F)
+        gray_squares = cv2.reduce(buffer, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)[:, 0]
+        del buffer
+
+        starts = np.array([y0 for y0, _ in ranges]) - top
+        ends = np.array([y1 for _, y1 in ranges]) - top
+        counts = (ends - starts) * gray.shape[1]
+
+        def variance(sums, squares):
+            cumulative_sums = np.concatenate(([0.0], np.cumsum(sums)))
+            cumulative_squares = np.concatenate(([0.0], np.cumsum(squares)))
+            means = (cumulative_sums[ends] - cumulative_sums[starts]) / counts
+            return np.maximum((cumulative_squares[ends] - cumulative_squares[starts]) / counts - means ** 2, 0.0)
+
+        return variance(laplacian_sums, laplacian_squares).tolist(), \
+            np.sqrt(variance(gray_sums, gray_squares)).tolist()
+
+    def _detect_blur_cascade(self, gray, threshold: float | None = None, page_mean_gray: float | None = None):
+        """
+        Decide with the cheapest stage able to: blank detection and text band location on a thumbnail, then the
+        Laplacian variance of the full resolution band. Tesseract runs when the variance is close to the threshold,
+        and on pages without a variance (blank or without text band) so that their readability is the one of the
+        path without the cascade. Far from the threshold, readability follows the verdict of the variance.
+        """
+        threshold = threshold or self.laplacian_variance_threshold
+        thumbnail, scale = self._thumbnail(gray)
+        try:
+            if self._mean_gray(thumbnail, page_mean_gray) > self.mean_gray_threshold:
+                return BlurryResult(laplacian_variance=-1, is_blurry=False, is_blank=True,
+                                    is_readable=self.is_readable(gray), decision_stage=DecisionStage.BLANK)
 
+            if self.multi_band_enabled:
+                bands, tallest = self._extract_text_bands(thumbnail)
+            else:
+                y0, y1 = self._extract_text_band(thumbnail)
+                bands, tallest = ([(y0, y1)], 0) if y0 is not None else ([], None)
         finally:
-            # Libération explicite de toutes les matrices temporaires
-            if bw is not None:
-                del bw
-            if kernel is not None:
-                del kernel
-            if proj is not None:
-                del proj
+            del thumbnail
+        if not bands:
+            return BlurryResult(laplacian_variance=-1, is_blurry=True, is_blank=False,
+                                is_readable=self.is_readable(gray), decision_stage=DecisionStage.NO_TEXT_BAND)
+
+        # Les bandes sont localisées sur la vignette, la variance est mesurée en pleine résolution
+        bands = [(int(y0 * scale), min(gray.shape[0], int(y1 * scale) + 1)) for y0, y1 in bands]
+        band_variances, worst_band_variance = None, None
+        if self.multi_band_enabled:
+            laplacian_var, band_variances, worst_band_variance = self._score_text_bands(gray, bands, tallest)
+        else:
+            laplacian_var = self._band_laplacian_variance(gray, *bands[0])
+        # La bande la moins nette décide en mode multi-bandes
+        score = worst_band_variance if worst_band_variance is not None else laplacian_var
+        is_blurry = score < threshold
+        if score < threshold * self.cascade_blurry_ratio:
+            is_readable = False
+            decision_stage = DecisionStage.LAPLACIAN_BLURRY
+        elif score > threshold * self.cascade_sharp_ratio:
+            is_readable = True
+            decision_stage = DecisionStage.LAPLACIAN_SHARP
+        else:
+            is_readable = self.is_readable(gray)
+            decision_stage = DecisionStage.OCR
+        return BlurryResult(laplacian_variance=laplacian_var, is_blurry=is_blurry, is_blank=False,
+                            is_readable=is_readable, decision_stage=decision_stage, band_variances=band_variances,
+                            worst_band_variance=worst_band_variance)
+
+    def _apply_tiled_sharpness(self, gray, result: BlurryResult, threshold: float):
+        """
+        Set the fraction of blurred text tiles of the page, and mark the page as blurry when it is above
+        max_blurred_tile_fraction (when set).
+        """
+        variances, contrasts = self._tile_statistics(gray)
+        text_tiles = contrasts >= self.tile_min_contrast
+        if not text_tiles.any():
+            return
+        result.blurred_tile_fraction = float(np.count_nonzero(variances[text_tiles] < threshold) /
+                                             np.count_nonzero(text_tiles))
+        if 0 < self.max_blurred_tile_fraction < result.blurred_tile_fraction:
+            result.is_blurry = True
+
+    def _tile_statistics(self, gray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Laplacian variance and gray level standard deviation of every tile of tile_size pixels (the last row and
+        column of tiles take the remaining pixels), in O(pixels): the Laplacian, its square, the gray levels and
+        their square are summed by column for each row of tiles with cv2.reduce, then by tile with np.add.reduceat,
+        without a loop over the tiles.
+        """
+        height, width = gray.shape[:2]
+        # Un reste inférieur à une demi-tuile est rattaché à la dernière tuile
+        ys = np.arange(0, max(1, round(height / self.tile_size))) * self.tile_size
+        xs = np.arange(0, max(1, round(width / self.tile_size))) * self.tile_size
+        counts = np.outer(np.diff(np.append(ys, height)), np.diff(np.append(xs, width)))
+
+        def tile_sums(values):
+            # Sommes des colonnes par rangée de tuiles (cv2.reduce, sans copie en float64), puis par tuile
+            column_sums = np.stack([cv2.reduce(values[y0:y1], 0, cv2.REDUCE_SUM, dtype=cv2.CV_64F)[0]
+                                    for y0, y1 in zip(ys, np.append(ys[1:], height))])
+            return np.add.reduceat(column_sums, xs, axis=1)
+
+        def variance(sums, squares):
+            means = sums / counts
+            return np.maximum(squares / counts - means ** 2, 0.0)
+
+        # Valeurs entières inférieures à 2 ** 24 (carrés compris) : exactes en float32
+        buffer = cv2.Laplacian(gray, cv2.CV_32F)
+        laplacian_sums = tile_sums(buffer)
+        cv2.multiply(buffer, buffer, dst=buffer)
+        laplacian_squares = tile_sums(buffer)
+        cv2.multiply(gray, gray, dst=buffer, dtype=cv2.CV_32F)
+        gray_squares = tile_sums(buffer)
+        del buffer
+        return variance(laplacian_sums, laplacian_squares), np.sqrt(variance(tile_sums(gray), gray_squares))
+
+    def _thumbnail(self, gray):
+        """
+        Return a downscaled copy of the image whose longest side is at most cascade_thumbnail_max_side, and the
+        factor to apply to its coordinates to go back to the full resolution.
+        """
+        scale = max(gray.shape[:2]) / self.cascade_thumbnail_max_side
+        if scale <= 1:
+            return gray, 1.0
+        size = (max(1, round(gray.shape[1] / scale)), max(1, round(gray.shape[0] / scale)))
+        thumbnail = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return thumbnail, gray.shape[0] / thumbnail.shape[0]
+
+    def _extract_text_band(self, gray):
+        starts, ends = self._find_text_bands(gray)
+        if starts is None:
+            return None, None
+        # On élargit un peu la bande la plus haute pour être robuste
+        return TextBandLocator.tallest_band(starts, ends, gray.shape[0], self.band_margin)
+
+    def _extract_text_bands(self, gray) -> tuple[list[tuple[int, int]], int | None]:
+        """
+        Return every text band of at least band_min_height rows (the tallest one always included), widened by the
+        band margin, and the index of the tallest band.
+        """
+        starts, ends = self._find_text_bands(gray)
+        if starts is None:
+            return [], None
+        heights = ends - starts
+        best = int(np.argmax(heights))
+        kept = np.flatnonzero(heights >= self.band_min_height)
+        if best not in kept:
+            kept = np.sort(np.append(kept, best))
+        bands = [(max(0, int(starts[index]) - self.band_margin), min(gray.shape[0], int(ends[index]) + self.band_margin))
+                 for index in kept]
+        return bands, int(np.flatnonzero(kept == best)[0])
+
+    def _find_text_bands(self, gray) -> tuple[np.ndarray | None, np.ndarray | None]:
+        return TextBandLocator.find_bands(gray, self.proj_threshold, self.blur_statistics)
@@ -0,0 +1,40 @@
+import hashlib
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
+from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
+from dossierfacile_file_analysis.services.blurry_result_cache import BlurryResultCache
+
+
+class CheckBlurryResultCache(AbstractBlurryTask):
+    """
+    Hash the decrypted content and look for a previous result of the same file.
+    On a hit, the preparation and the analysis are skipped and the cached result is saved as is.
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self):
+        super().__init__(task_name="CheckBlurryResultCache")
+        self.blurry_result_cache = BlurryResultCache()
+
+    def has_to_apply(self, context: BlurryExecutionContext) -> bool:
+        return self.blurry_result_cache.enabled and context.downloaded_file is not None
+
+    def _internal_run(self, context: BlurryExecutionContext):
+        context.content_hash = self._compute_content_hash(context.downloaded_file)
+        cached_result = self.blurry_result_cache.get(context.content_hash)
+        if cached_result is not None:
+            logger.info(f"Blurry result found in cache for file_id: {context.file_id}")
+            context.blurry_result = cached_result
+            context.cache_hit = True
+
+    def _compute_content_hash(self, downloaded_file: DownloadedFile) -> str:
+        if downloaded_file.is_in_memory():
+            return hashlib.sha256(downloaded_file.file_content).hexdigest()
+        content_hash = hashlib.sha256()
+        with open(downloaded_file.file_path, "rb") as file:
+            while chunk := file.read(self.HASH_CHUNK_SIZE):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
@@ -2,6 +2,7 @@ import os.path
 
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 
 
 class CleanData(AbstractBlurryTask):
@@ -9,9 +10,16 @@ class CleanData(AbstractBlurryTask):
         super().__init__(task_name="CleanData")
 
     def _internal_run(self, context: BlurryExecutionContext):
-        if context.downloaded_file is not None and os.path.exists(context.downloaded_file.file_path):
-            os.remove(context.downloaded_file.file_path)
+        downloaded_file = context.downloaded_file
+        if downloaded_file is not None and downloaded_file.file_path is not None \
+                and os.path.exists(downloaded_file.file_path):
+            os.remove(downloaded_file.file_path)
         if context.input_analysis_data is not None:
+            # Ferme le flux de pages s'il n'a pas été consommé jusqu'au bout (document PDF encore ouvert)
+            if context.input_analysis_data.pages is not None and hasattr(context.input_analysis_data.pages, "close"):
+                context.input_analysis_data.pages.close()
             for image in context.input_analysis_data.list_of_images:
-                if os.path.exists(image):
-                    os.remove(image)
+                # En mode mémoire les images sont des tableaux NumPy, rien à supprimer
+                path = RenderedBand.file_path(image)
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
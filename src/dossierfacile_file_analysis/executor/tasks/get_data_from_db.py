@@ -2,6 +2,7 @@ from dossierfacile_file_analysis.exceptions.data_not_found import DataNotFoundEx
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
 from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+from dossierfacile_file_analysis.services.file_metadata_batch_loader import FileMetadataBatchLoader
 
 
 class GetDataFromDB(AbstractBlurryTask):
@@ -13,11 +14,14 @@ class GetDataFromDB(AbstractBlurryTask):
     def __init__(self):
         super().__init__(task_name="GetDataFromDB")
         self.database_service = DossierFacileDatabaseService()
+        # Lecture groupée avec les autres messages prefetchés
+        self.batch_loader = FileMetadataBatchLoader() if FileMetadataBatchLoader.is_enabled() else None
 
     def _internal_run(self, context: BlurryExecutionContext):
-        data = self.database_service.get_file_by_id(context.file_id)
+        if self.batch_loader is not None:
+            data = self.batch_loader.get(context.file_id)
+        else:
+            data = self.database_service.get_file_by_id(context.file_id)
         if data is None:
             raise DataNotFoundException(file_id=context.file_id)
         context.file_dto = data
-
-
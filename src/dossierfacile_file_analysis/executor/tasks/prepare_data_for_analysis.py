@@ -1,49 +1,274 @@
 import os
 
+import cv2
+import numpy as np
 import pymupdf
 
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.exceptions.invalid_mime_type import InvalidMimeTypeException
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.models.decision_stage import DecisionStage
+from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
 from dossierfacile_file_analysis.models.input_analysis_data import InputAnalysisData
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 from dossierfacile_file_analysis.models.supported_content_type import SupportedContentType
+from dossierfacile_file_analysis.services.blur_statistics_engine import BlurStatisticsEngine
+from dossierfacile_file_analysis.services.image_decoder import REDUCED_GRAYSCALE_MODES
+from dossierfacile_file_analysis.services.text_band_locator import TextBandLocator
+
+# Résolution historique du rendu (zoom 2)
+LEGACY_RENDER_DPI = 144
+# Part minimale de la page couverte par l'image pour la considérer comme un scan pleine page
+SCAN_PAGE_COVERAGE = 0.9
+# Marge (lignes de la vignette) ajoutée autour de la bande localisée avant le rendu
+TWO_PHASE_BAND_MARGIN = 10
 
 
 class PrepareDataForAnalysis(AbstractBlurryTask):
+    # L'incompatibilité du rendu en deux temps n'est signalée qu'une fois par processus
+    _two_phase_conflict_logged = False
 
     def __init__(self):
         super().__init__(task_name="PrepareDataForAnalysis")
         self.local_file_path = os.getenv("LOCAL_FILE_PATH")
+        # Les pages sont rendues au fil de l'analyse au lieu d'être toutes rendues à l'avance
+        self.page_streaming = os.getenv("PDF_PAGE_STREAMING", "false").lower() == "true"
+        # Rendu direct en niveaux de gris (un canal au lieu de trois) des pages sans image couleur
+        self.render_grayscale = os.getenv("PDF_RENDER_GRAYSCALE", "false").lower() == "true"
+        # Résolution de rendu déduite des images de la page au lieu du zoom fixe
+        self.adaptive_dpi = os.getenv("PDF_RENDER_ADAPTIVE_DPI", "false").lower() == "true"
+        self.min_dpi = int(os.getenv("PDF_RENDER_MIN_DPI") or 72)
+        self.max_dpi = int(os.getenv("PDF_RENDER_MAX_DPI") or LEGACY_RENDER_DPI)
+        self.default_dpi = int(os.getenv("PDF_RENDER_DEFAULT_DPI") or LEGACY_RENDER_DPI)
+        # Part minimale de la page couverte par l'image dont la résolution est reprise (un logo ne compte pas)
+        self.dpi_image_min_coverage = float(os.getenv("PDF_RENDER_IMAGE_MIN_COVERAGE") or 0.5)
+        # Pages constituées d'un seul scan : l'image embarquée est décodée au lieu de rastériser la page
+        self.embedded_scan_fast_path = os.getenv("PDF_EMBEDDED_SCAN_FAST_PATH", "false").lower() == "true"
+        # Pages au texte natif (PDF générés numériquement) : nettes et lisibles par construction
+        self.native_text_fast_path = os.getenv("PDF_NATIVE_TEXT_FAST_PATH", "false").lower() == "true"
+        self.native_text_min_chars = int(os.getenv("PDF_NATIVE_TEXT_MIN_CHARS") or 50)
+        self.native_text_max_image_coverage = float(os.getenv("PDF_NATIVE_TEXT_MAX_IMAGE_COVERAGE") or 0.5)
+        # Rendu en deux temps : vignette pour localiser la bande de texte, puis rendu de cette seule bande
+        self.two_phase_render = os.getenv("PDF_TWO_PHASE_RENDER_ENABLED", "false").lower() == "true"
+        if self.two_phase_render and (os.getenv("BLUR_MULTI_BAND_ENABLED", "false").lower() == "true"
+                                      or os.getenv("BLUR_TILED_SHARPNESS_ENABLED", "false").lower() == "true"):
+            # Les mesures multi-bandes et par tuiles portent sur la page entière
+            if not PrepareDataForAnalysis._two_phase_conflict_logged:
+                logger.warning("PDF_TWO_PHASE_RENDER_ENABLED is ignored: BLUR_MULTI_BAND_ENABLED and "
+                               "BLUR_TILED_SHARPNESS_ENABLED need the whole page")
+                PrepareDataForAnalysis._two_phase_conflict_logged = True
+            self.two_phase_render = False
+        self.locate_dpi = int(os.getenv("PDF_TWO_PHASE_LOCATE_DPI") or 72)
+        self.blur_statistics = BlurStatisticsEngine() if BlurStatisticsEngine.is_enabled() else None
 
     def has_to_apply(self, context: BlurryExecutionContext) -> bool:
         if context.file_dto is None and context.downloaded_file is None:
             return False
+        # Résultat déjà connu (cache) : rien à préparer ni à analyser
+        if context.cache_hit:
+            return False
         return True
 
     def _internal_run(self, context: BlurryExecutionContext):
         if context.downloaded_file.file_type is None:
             raise InvalidMimeTypeException(context.file_dto.id)
         if context.downloaded_file.file_type == SupportedContentType.PDF:
-            list_of_images = self._pdf_to_images(context.downloaded_file.file_name, context.downloaded_file.file_path)
-            context.input_analysis_data = InputAnalysisData(downloaded_file=context.downloaded_file,
-                                                            list_of_images=list_of_images)
+            if self.page_streaming:
+                input_analysis_data = InputAnalysisData(downloaded_file=context.downloaded_file)
+                # Les PNG créés au fil de l'eau sont référencés pour être supprimés par CleanData
+                input_analysis_data.pages = self._iter_pdf_pages(
+                    context.downloaded_file, on_file_created=input_analysis_data.list_of_images.append)
+                context.input_analysis_data = input_analysis_data
+            else:
+                context.input_analysis_data = InputAnalysisData(downloaded_file=context.downloaded_file,
+                                                                list_of_images=self._pdf_to_images(
+                                                                    context.downloaded_file))
         else:
             context.input_analysis_data = InputAnalysisData(downloaded_file=context.downloaded_file)
 
-    def _pdf_to_images(self, pdf_file_name: str, pdf_path: str) -> list:
-        zoom_x = 2.0
-        zoom_y = 2.0
-        mat = pymupdf.Matrix(zoom_x, zoom_y)
+    def _pdf_to_images(self, downloaded_file: DownloadedFile) -> list:
+        """
+        Render every page of the PDF up front: PNG paths on disk, or grayscale arrays in memory mode.
+        """
+        return list(self._iter_pdf_pages(downloaded_file))
+
+    def _iter_pdf_pages(self, downloaded_file: DownloadedFile, on_file_created=None):
+        """
+        Render the pages of the PDF one at a time.
+        Yields the PNG path of each page, or a grayscale array when the file is in memory. The document is only
+        opened when the first page is requested and is closed once the generator is exhausted or closed.
+        Born-digital pages are not rendered: their BlurryResult is yielded instead (PDF_NATIVE_TEXT_FAST_PATH).
+        With PDF_TWO_PHASE_RENDER_ENABLED, only the text band of the page is rendered at the analysis resolution,
+        and a RenderedBand holding the PNG path or the array is yielded.
+        """
+        if downloaded_file.is_in_memory():
+            logger.info(f"Converting in-memory PDF to arrays for file: {downloaded_file.file_name}")
+            doc = pymupdf.open(stream=downloaded_file.file_content, filetype="pdf")
+        else:
+            logger.info(f"Converting PDF to images for file: {downloaded_file.file_name}")
+            doc = pymupdf.open(filename=downloaded_file.file_path)
+
+        try:
+            for page in doc:
+                if self.native_text_fast_path and self._is_native_text_page(page):
+                    yield BlurryResult(laplacian_variance=-1, is_blurry=False, is_blank=False, is_readable=True,
+                                       decision_stage=DecisionStage.NATIVE_TEXT)
+                    continue
+                if self.embedded_scan_fast_path:
+                    scan = self._decode_embedded_scan(doc, page)
+                    if scan is not None:
+                        yield scan
+                        continue
+                dpi, colorspace = self._render_settings(page)
+                zoom = dpi / 72
+                clip, page_mean_gray = None, None
+                if self.two_phase_render:
+                    clip, page_mean_gray = self._locate_text_band(page)
+                pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=colorspace, clip=clip)
+                if downloaded_file.is_in_memory():
+                    image = self._pixmap_to_gray(pix)
+                else:
+                    image = os.path.join(self.local_file_path or "",
+                                         f"{downloaded_file.file_name}_{page.number}.png")
+                    pix.save(image)
+                    if on_file_created is not None:
+                        on_file_created(image)
+                # Libérer le pixmap avant de rendre la page suivante
+                del pix
+                yield RenderedBand(image, page_mean_gray) if clip is not None else image
+        finally:
+            doc.close()
+
+    def _render_settings(self, page) -> tuple[float, pymupdf.Colorspace]:
+        """
+        Resolution and colorspace to render the page with.
+        With PDF_RENDER_ADAPTIVE_DPI, the resolution is the one of the largest embedded image when it covers at
+        least PDF_RENDER_IMAGE_MIN_COVERAGE of the page (a scan is rendered at its native resolution), or
+        PDF_RENDER_DEFAULT_DPI for other pages (text with a logo, no image), within
+        [PDF_RENDER_MIN_DPI, PDF_RENDER_MAX_DPI].
+        With PDF_RENDER_GRAYSCALE, pages whose largest image is grayscale, or without images, are rendered in
+        grayscale. Converting a color image to gray is slower in MuPDF than with OpenCV after an RGB render.
+        """
+        if not self.adaptive_dpi and not self.render_grayscale:
+            return LEGACY_RENDER_DPI, pymupdf.csRGB
+        image = self._largest_image(page)
+        dpi = LEGACY_RENDER_DPI
+        if self.adaptive_dpi:
+            covering = image is not None and image["coverage"] >= self.dpi_image_min_coverage
+            dpi = min(self.max_dpi, max(self.min_dpi, image["dpi"]) if covering else self.default_dpi)
+        gray = self.render_grayscale and (image is None or image["colorspace"] == 1)
+        return dpi, pymupdf.csGRAY if gray else pymupdf.csRGB
+
+    def _locate_text_band(self, page) -> tuple[pymupdf.Rect | None, float | None]:
+        """
+        Render a grayscale thumbnail at PDF_TWO_PHASE_LOCATE_DPI, locate its tallest text band as the analysis
+        does, and return the area of the page to render (the full width of the band) and the mean gray level of
+        the page. The area is None when the whole page has to be rendered: rotated page, no band, or a band
+        covering the page.
+        """
+        if page.rotation != 0:
+            return None, None
+        zoom = self.locate_dpi / 72
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csGRAY)
+        thumbnail = self._pixmap_to_gray(pix)
+        del pix
+        starts, ends = TextBandLocator.find_bands(thumbnail, blur_statistics=self.blur_statistics)
+        if starts is None:
+            return None, None
+        y0, y1 = TextBandLocator.tallest_band(starts, ends, thumbnail.shape[0], TWO_PHASE_BAND_MARGIN)
+        if y0 == 0 and y1 == thumbnail.shape[0]:
+            return None, None
+        rect = page.rect
+        # Lignes de la vignette ramenées en points, arrondies vers l'extérieur de la bande
+        clip = pymupdf.Rect(rect.x0, rect.y0 + y0 / zoom, rect.x1, min(rect.y1, rect.y0 + (y1 + 1) / zoom))
+        return clip, float(cv2.mean(thumbnail)[0])
+
+    @staticmethod
+    def _largest_image(page) -> dict | None:
+        largest, largest_area = None, 0
+        page_area = page.rect.width * page.rect.height
+        for info in page.get_image_info():
+            bbox = pymupdf.Rect(info["bbox"])
+            area = bbox.width * bbox.height
+            if area <= largest_area or info["width"] <= 0 or info["height"] <= 0:
+                continue
+            # Pixels par pouce affiché (72 points), indépendant d'une rotation de l'image
+            largest = {"dpi": 72 * ((info["width"] * info["height"]) / area) ** 0.5,
+                       "colorspace": info["colorspace"],
+                       "coverage": area / page_area if page_area else 0}
+            largest_area = area
+        return largest
+
+    def _is_native_text_page(self, page) -> bool:
+        """
+        A page is born-digital when it has at least PDF_NATIVE_TEXT_MIN_CHARS visible characters of text and its
+        images cover at most PDF_NATIVE_TEXT_MAX_IMAGE_COVERAGE of its area. The invisible text layer added by an
+        OCR over a scan is not counted.
+        """
+        visible_chars = 0
+        for span in page.get_texttrace():
+            if span["type"] != 3 and span["opacity"] > 0:
+                visible_chars += sum(1 for char in span["chars"] if not chr(char[0]).isspace())
+        if visible_chars < self.native_text_min_chars:
+            return False
+        page_area = page.rect.width * page.rect.height
+        image_area = 0
+        for info in page.get_image_info():
+            bbox = pymupdf.Rect(info["bbox"]) & page.rect
+            image_area += bbox.width * bbox.height
+        return image_area <= self.native_text_max_image_coverage * page_area
 
-        logger.info(f"Converting PDF to images for file: {pdf_file_name}")
-        image_paths = []
+    def _decode_embedded_scan(self, doc, page) -> np.ndarray | None:
+        """
+        Decode the image of a page made of a single upright scan (one image covering the page, no visible text
+        nor drawing) straight to a grayscale array, at its native resolution reduced to PDF_RENDER_MAX_DPI.
+        Return None when the page has to be rendered.
+        """
+        if page.rotation != 0:
+            return None
+        # get_image_info(xrefs=True) décode les images pour les identifier : le xref est lu dans les ressources
+        placements = page.get_image_info()
+        images = page.get_images()
+        if len(placements) != 1 or len(images) != 1:
+            return None
+        info = placements[0]
+        xref = images[0][0]
+        a, b, c, d, _, _ = info["transform"]
+        bbox = pymupdf.Rect(info["bbox"])
+        if xref <= 0 or info["has-mask"] or info["colorspace"] not in (1, 3) \
+                or b != 0 or c != 0 or a <= 0 or d <= 0 \
+                or bbox.width * bbox.height < SCAN_PAGE_COVERAGE * page.rect.width * page.rect.height:
+            return None
+        # Couche texte d'un OCR (invisible) acceptée, tout autre contenu impose le rendu de la page
+        if any(span["type"] != 3 for span in page.get_texttrace()) or page.get_cdrawings():
+            return None
 
-        doc = pymupdf.open(filename=pdf_path)
-        for page in doc:
-            pix = page.get_pixmap(matrix=mat)
-            image_path = os.path.join(self.local_file_path or "", f"{pdf_file_name}_{page.number}.png")
-            pix.save(image_path)
-            image_paths.append(image_path)
+        extracted = doc.extract_image(xref)
+        # Un JPEG plus grand que nécessaire est réduit par la libjpeg pendant la décompression
+        target_width = self.max_dpi * bbox.width / 72
+        reduction = max((factor for factor in REDUCED_GRAYSCALE_MODES if info["width"] / factor >= target_width),
+                        default=1) if extracted["ext"] == "jpeg" else 1
+        # Le PDF ignore l'orientation EXIF du flux, le décodage aussi
+        gray = cv2.imdecode(np.frombuffer(extracted["image"], dtype=np.uint8),
+                            REDUCED_GRAYSCALE_MODES.get(reduction, cv2.IMREAD_GRAYSCALE) | cv2.IMREAD_IGNORE_ORIENTATION)
+        del extracted
+        if gray is None:
+            return None
+        # Même résolution maximale que le rendu, à laquelle le seuil de flou est calibré
+        scale = self.max_dpi / (72 * gray.shape[1] / bbox.width)
+        if scale < 1:
+            gray = cv2.resize(gray, (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        return gray
 
-        return image_paths
+    @staticmethod
+    def _pixmap_to_gray(pix) -> np.ndarray:
+        # Vue sans copie sur les échantillons du pixmap : seule la conversion en gris alloue
+        samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 1:
+            return samples[:, :, 0].copy()
+        if pix.n == 4:
+            return cv2.cvtColor(samples, cv2.COLOR_RGBA2GRAY)
+        return cv2.cvtColor(samples, cv2.COLOR_RGB2GRAY)
@@ -1,5 +1,6 @@
 from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.services.blurry_result_writer import BlurryResultWriter
 from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
 
 
@@ -7,8 +8,12 @@ class SaveBlurryResultToDB(AbstractBlurryTask):
     def __init__(self):
         super().__init__(task_name="SaveBlurryResultToDB")
         self.database_service = DossierFacileDatabaseService()
+        # En write-behind, le résultat est enregistré par lot côté consommateur AMQP
+        self.write_behind = BlurryResultWriter.is_enabled()
 
     def has_to_apply(self, context: BlurryExecutionContext) -> bool:
+        if self.write_behind:
+            return False
         if context.file_dto is None and context.blurry_result is None:
             return False
         return True
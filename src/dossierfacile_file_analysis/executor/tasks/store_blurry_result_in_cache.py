@@ -0,0 +1,16 @@
+from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
+from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.services.blurry_result_cache import BlurryResultCache
+
+
+class StoreBlurryResultInCache(AbstractBlurryTask):
+    def __init__(self):
+        super().__init__(task_name="StoreBlurryResultInCache")
+        self.blurry_result_cache = BlurryResultCache()
+
+    def has_to_apply(self, context: BlurryExecutionContext) -> bool:
+        return (self.blurry_result_cache.enabled and context.content_hash is not None
+                and context.blurry_result is not None and not context.cache_hit)
+
+    def _internal_run(self, context: BlurryExecutionContext):
+        self.blurry_result_cache.put(context.content_hash, context.blurry_result)
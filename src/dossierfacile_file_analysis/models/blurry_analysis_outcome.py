@@ -0,0 +1,25 @@
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+
+
+class BlurryAnalysisOutcome:
+    """
+    Result of the processing of a message, returned to the consumer so that it can be persisted there.
+    """
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+    def __init__(self, file_id: int, blurry_result: BlurryResult | None, analysis_status: str):
+        self.file_id = file_id
+        self.blurry_result = blurry_result
+        self.analysis_status = analysis_status
+
+    def __repr__(self):
+        return f"BlurryAnalysisOutcome(file_id={self.file_id}, analysis_status={self.analysis_status}, blurry_result={self.blurry_result})"
+
+    @staticmethod
+    def completed(file_id: int, blurry_result: BlurryResult) -> 'BlurryAnalysisOutcome':
+        return BlurryAnalysisOutcome(file_id, blurry_result, BlurryAnalysisOutcome.COMPLETED)
+
+    @staticmethod
+    def failed(file_id: int) -> 'BlurryAnalysisOutcome':
+        return BlurryAnalysisOutcome(file_id, None, BlurryAnalysisOutcome.FAILED)
@@ -17,3 +17,15 @@ class BlurryExecutionContext:
         self.downloaded_file: Optional[DownloadedFile] = None
         self.input_analysis_data: Optional[InputAnalysisData] = None
         self.blurry_result: Optional[BlurryResult] = None
+        # Empreinte du contenu déchiffré, utilisée comme clé du cache de résultats
+        self.content_hash: Optional[str] = None
+        self.cache_hit = False
+        self.analysed_page_count = 0
+
+    def content_type(self) -> str:
+        """
+        Content type of the file, used as metrics label ("unknown" before the file is read from the database).
+        """
+        if self.file_dto is None or not self.file_dto.content_type:
+            return "unknown"
+        return self.file_dto.content_type
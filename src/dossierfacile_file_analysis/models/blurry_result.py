@@ -1,18 +1,61 @@
+from dossierfacile_file_analysis.models.decision_stage import DecisionStage
+
+
 class BlurryResult:
 
-    def __init__(self, laplacian_variance: float, is_blurry: bool, is_blank: bool, is_readable: bool):
+    def __init__(self, laplacian_variance: float, is_blurry: bool, is_blank: bool, is_readable: bool,
+                 decision_stage: DecisionStage | None = None,
+                 band_variances: list[tuple[int, int, float]] | None = None,
+                 worst_band_variance: float | None = None, blurred_tile_fraction: float | None = None):
         self.laplacian_variance = laplacian_variance
         self.is_blurry = is_blurry
         self.is_blank = is_blank
         self.is_readable = is_readable
+        self.decision_stage = decision_stage
+        # Variance de chaque bande de texte (y0, y1, variance) et de la moins nette, en mode multi-bandes
+        self.band_variances = band_variances
+        self.worst_band_variance = worst_band_variance
+        # Part des tuiles de texte sous le seuil, avec la carte de netteté par tuiles
+        self.blurred_tile_fraction = blurred_tile_fraction
 
     def __repr__(self):
-        return f"BlurryResult(laplacian_variance={self.laplacian_variance}, is_blurry={self.is_blurry}, is_blank={self.is_blank}, is_readable={self.is_readable})"
+        return f"BlurryResult(laplacian_variance={self.laplacian_variance}, is_blurry={self.is_blurry}, is_blank={self.is_blank}, is_readable={self.is_readable}, decision_stage={self.decision_stage}, worst_band_variance={self.worst_band_variance}, blurred_tile_fraction={self.blurred_tile_fraction})"
+
+    def sharpness_score(self) -> float:
+        """
+        Variance used to compare pages: the one of the least sharp band when the bands were measured.
+        """
+        return self.worst_band_variance if self.worst_band_variance is not None else self.laplacian_variance
 
     def to_dict(self):
-        return {
+        result = {
             "laplacianVariance": self.laplacian_variance,
             "isBlurry": self.is_blurry,
             "isBlank": self.is_blank,
             "isReadable": self.is_readable
-        }
\ No newline at end of file
+        }
+        if self.decision_stage is not None:
+            result["decisionStage"] = self.decision_stage.value
+        if self.band_variances is not None:
+            result["bands"] = [{"y0": y0, "y1": y1, "laplacianVariance": variance}
+                               for y0, y1, variance in self.band_variances]
+            result["worstBandVariance"] = self.worst_band_variance
+        if self.blurred_tile_fraction is not None:
+            result["blurredTileFraction"] = self.blurred_tile_fraction
+        return result
+
+    @staticmethod
+    def from_dict(data: dict) -> 'BlurryResult':
+        decision_stage = data.get("decisionStage")
+        bands = data.get("bands")
+        return BlurryResult(
+            laplacian_variance=data.get("laplacianVariance"),
+            is_blurry=data.get("isBlurry"),
+            is_blank=data.get("isBlank"),
+            is_readable=data.get("isReadable"),
+            decision_stage=DecisionStage(decision_stage) if decision_stage else None,
+            band_variances=[(band["y0"], band["y1"], band["laplacianVariance"]) for band in bands]
+            if bands is not None else None,
+            worst_band_variance=data.get("worstBandVariance"),
+            blurred_tile_fraction=data.get("blurredTileFraction")
+        )
@@ -0,0 +1,14 @@
+from enum import Enum
+
+
+class DecisionStage(Enum):
+    """
+    Stage of the analysis cascade that decided the result of a page.
+    """
+    BLANK = "BLANK"
+    NO_TEXT_BAND = "NO_TEXT_BAND"
+    LAPLACIAN_BLURRY = "LAPLACIAN_BLURRY"
+    LAPLACIAN_SHARP = "LAPLACIAN_SHARP"
+    OCR = "OCR"
+    # Page au texte natif (PDF généré numériquement) : ni rendue ni analysée
+    NATIVE_TEXT = "NATIVE_TEXT"
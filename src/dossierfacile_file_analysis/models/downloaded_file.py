@@ -1,8 +1,22 @@
+import os
+
 from dossierfacile_file_analysis.models.supported_content_type import SupportedContentType
 
 
 class DownloadedFile:
-    def __init__(self, file_name: str, file_path: str, file_type: str):
+    def __init__(self, file_name: str, file_path: str | None, file_type: str, file_content: bytes | None = None):
         self.file_name = file_name
+        # En mode mémoire, le fichier n'est jamais écrit sur disque : file_path est None et file_content contient les octets
         self.file_path = file_path
+        self.file_content = file_content
         self.file_type = SupportedContentType.get_supported_content_type(file_type)
+
+    def is_in_memory(self) -> bool:
+        return self.file_content is not None
+
+    def size(self) -> int:
+        if self.is_in_memory():
+            return memoryview(self.file_content).nbytes
+        if self.file_path and os.path.exists(self.file_path):
+            return os.path.getsize(self.file_path)
+        return 0
@@ -1,6 +1,7 @@
 import os
 
 from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 
 
 class InputAnalysisData:
@@ -9,16 +10,33 @@ class InputAnalysisData:
             list_of_images = []
         self.type = downloaded_file.file_type
         self.initial_file = downloaded_file.file_path
-        self.list_of_images = list_of_images if list_of_images is not None else []
+        self.initial_content = downloaded_file.file_content
+        # Chemins des images sur disque, ou tableaux NumPy en niveaux de gris en mode mémoire
+        self.list_of_images = list_of_images
+        # Itérable paresseux de pages (générateur) lorsque le rendu est fait au fil de l'analyse
+        self.pages = None
+
+    def iter_pages(self):
+        """
+        Return the pages to analyse: the lazy page stream if any, the list of images otherwise.
+        """
+        return self.pages if self.pages is not None else self.list_of_images
+
+    def get_initial_source(self):
+        """
+        Return the in-memory content of the initial file if available, its path otherwise.
+        """
+        return self.initial_content if self.initial_content is not None else self.initial_file
 
     def clean_files(self):
         """
         Clean up the files created during the analysis.
         :return:
         """
-        if os.path.exists(self.initial_file):
+        if self.initial_file is not None and os.path.exists(self.initial_file):
             os.remove(self.initial_file)
 
         for image in self.list_of_images:
-            if os.path.exists(image):
-                os.remove(image)
+            path = RenderedBand.file_path(image)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
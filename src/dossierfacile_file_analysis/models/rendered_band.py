@@ -0,0 +1,22 @@
+import numpy as np
+
+
+class RenderedBand:
+    """
+    Text band of a PDF page rendered alone by the two-phase rendering (PDF_TWO_PHASE_RENDER_ENABLED), with the
+    mean gray level of the whole page measured on the thumbnail, for the blank page detection.
+    """
+
+    def __init__(self, image: str | np.ndarray, page_mean_gray: float):
+        # Chemin du PNG sur disque, ou tableau en niveaux de gris en mode mémoire
+        self.image = image
+        self.page_mean_gray = page_mean_gray
+
+    @staticmethod
+    def file_path(image) -> str | None:
+        """
+        Path of the PNG of a rendered page (RenderedBand or path), None for in-memory pages.
+        """
+        if isinstance(image, RenderedBand):
+            image = image.image
+        return image if isinstance(image, str) else None
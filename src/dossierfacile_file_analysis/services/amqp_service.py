@@ -1,6 +1,9 @@
+import json
+import multiprocessing
 import os
 import time
 
+from concurrent.futures.process import ProcessPoolExecutor
 from concurrent.futures.thread import ThreadPoolExecutor
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 
@@ -8,8 +11,16 @@ import pika
 from pika.exceptions import AMQPConnectionError
 
 from dossierfacile_file_analysis.exceptions.retryable_exception import RetryableException
+from dossierfacile_file_analysis.executor.blurry_pipeline import BlurryPipeline
+from dossierfacile_file_analysis.models.blurry_analysis_outcome import BlurryAnalysisOutcome
+from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
 from dossierfacile_file_analysis.services.blurry_message_processor import BlurryMessageProcessor
+from dossierfacile_file_analysis.services.blurry_result_writer import BlurryResultWriter
+from dossierfacile_file_analysis.services.concurrency_controller import ConcurrencyController
 from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+from dossierfacile_file_analysis.services.file_metadata_batch_loader import FileMetadataBatchLoader
+from dossierfacile_file_analysis.services.memory_governor import MemoryGovernor
+from dossierfacile_file_analysis.services.metrics_registry import MetricsRegistry
 
 
 class AmqpService:
@@ -19,10 +30,148 @@ class AmqpService:
         self.queue_name = os.getenv("AMQP_QUEUE_NAME")
         self.amqp_login = os.getenv("AMQP_LOGIN")
         self.amqp_password = os.getenv("AMQP_PASSWORD")
+        # "thread" (par défaut) ou "process" pour contourner le GIL sur l'analyse CPU
+        self.executor_mode = os.getenv("EXECUTOR_MODE") or "thread"
+        self.max_workers = int(os.getenv("EXECUTOR_MAX_WORKERS") or 0) or self._default_max_workers()
         self.executor = None
         self.connection = None
         self.channel = None
+        self.consumer_tag = None
         self.database_service = DossierFacileDatabaseService()
+        # Écriture différée et groupée des résultats, l'ack n'est envoyé qu'après le commit du lot
+        self.result_writer = BlurryResultWriter() if BlurryResultWriter.is_enabled() else None
+        # Métadonnées des messages prefetchés lues en une seule requête
+        self.metadata_loader = FileMetadataBatchLoader() if FileMetadataBatchLoader.is_enabled() else None
+        self.prefetch_count = int(os.getenv("AMQP_PREFETCH_COUNT") or 0) or self.max_workers
+        # Ajuste le nombre de messages traités en parallèle (prefetch) selon la charge CPU et mémoire
+        self.concurrency_controller = None
+        if ConcurrencyController.is_enabled():
+            self.concurrency_controller = ConcurrencyController(on_change=self._apply_prefetch_count)
+            if self.executor_mode == "process":
+                # Des processus CPU au-delà du nombre de cœurs ne font que se disputer le CPU
+                self.concurrency_controller.cap(os.cpu_count() or 1)
+            if self.executor_mode != "pipeline":
+                # Le pool est dimensionné pour la borne haute, le prefetch limite les messages en cours
+                self.max_workers = self.concurrency_controller.max_limit
+            self.prefetch_count = self.concurrency_controller.limit
+        self.metrics = MetricsRegistry()
+        self.metrics.worker_utilisation.set_function(self._worker_utilisation)
+        # Suspend la consommation au-dessus d'un seuil de RSS et recycle les workers au lieu de subir un OOM kill
+        self.memory_governor = None
+        self._draining = False
+        if MemoryGovernor.is_enabled():
+            self.memory_governor = MemoryGovernor(on_pause=self._pause_consumption,
+                                                  on_resume=self._resume_consumption,
+                                                  on_recycle=self._recycle_workers,
+                                                  worker_processes=self.executor_mode == "process")
+
+    def _default_max_workers(self) -> int:
+        if self.executor_mode == "process":
+            return os.cpu_count() or 1
+        if self.executor_mode == "pipeline":
+            return BlurryPipeline.default_capacity()
+        return 4
+
+    def _effective_workers(self) -> int:
+        # Le prefetch borne le nombre de messages en cours, donc de workers occupés
+        return max(1, min(self.max_workers, self.prefetch_count))
+
+    def _worker_utilisation(self) -> float:
+        return min(1.0, self.metrics.messages_in_flight.get() / self._effective_workers())
+
+    def _apply_prefetch_count(self, prefetch_count: int):
+        """
+        Change the prefetch count at runtime. Called from the controller thread: basic_qos is run by the
+        connection thread.
+        """
+        self.prefetch_count = prefetch_count
+        if self.connection and not self.connection.is_closed:
+            self.connection.add_callback_threadsafe(lambda: self.channel.basic_qos(prefetch_count=prefetch_count))
+
+    def _pause_consumption(self):
+        """
+        Stop receiving messages, the messages in flight go on. Called from the memory governor thread.
+        """
+        def _cancel():
+            if self.consumer_tag is None:
+                return
+            # Messages reçus mais pas encore distribués au callback : remis en file
+            for method_frame, _, _ in self.channel.basic_cancel(self.consumer_tag):
+                self.channel.basic_nack(delivery_tag=method_frame.delivery_tag, requeue=True)
+            self.consumer_tag = None
+            self.metrics.consumption_paused.set(1)
+
+        if self.connection and not self.connection.is_closed:
+            self.connection.add_callback_threadsafe(_cancel)
+
+    def _resume_consumption(self):
+        def _consume():
+            if self.consumer_tag is not None or self._draining:
+                return
+            self.consumer_tag = self.channel.basic_consume(queue=self.queue_name,
+                                                           on_message_callback=self._message_callback,
+                                                           auto_ack=False)
+            self.metrics.consumption_paused.set(0)
+
+        if self.connection and not self.connection.is_closed:
+            self.connection.add_callback_threadsafe(_consume)
+
+    def _recycle_workers(self, reason: str):
+        """
+        In process mode, replace the worker pool: the new messages go to new processes while the old ones finish
+        their messages and exit. In thread and pipeline modes the consumer is the worker: it stops receiving
+        messages, finishes the messages in flight and stops, to be restarted by the orchestrator.
+        """
+        self.metrics.worker_recycles.inc(reason=reason)
+        if self.executor_mode == "process":
+            def _replace_pool():
+                previous_executor = self.executor
+                self.executor = self._create_executor()
+                previous_executor.shutdown(wait=False)
+                self.memory_governor.reset_workers()
+
+            # Remplacé sur le thread de la connexion, qui soumet les messages : aucun envoi vers l'ancien pool fermé
+            if self.connection and not self.connection.is_closed:
+                self.connection.add_callback_threadsafe(_replace_pool)
+            return
+        self._draining = True
+        self._pause_consumption()
+        self._stop_if_drained()
+
+    def _stop_if_drained(self):
+        if self._draining and self.memory_governor.in_flight() == 0 \
+                and self.connection and not self.connection.is_closed:
+            logger.info("All messages in flight processed, stopping the consumer")
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def _create_executor(self):
+        """
+        Creates the worker pool used to process messages.
+        In process mode, workers are long-lived spawned processes (no inherited DB connections)
+        warmed up once by BlurryMessageProcessor.warm_up.
+        In pipeline mode, the tasks of the messages are run by the stages of a shared BlurryPipeline.
+        """
+        if self.executor_mode == "process":
+            # Avec le gouverneur mémoire, chaque processus est remplacé après WORKER_MAX_MESSAGES messages
+            max_messages = self.memory_governor.max_messages if self.memory_governor else 0
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=BlurryMessageProcessor.warm_up,
+                max_tasks_per_child=max_messages or None
+            )
+            if not max_messages:
+                # Les processus sont créés à la demande : on les démarre tous dès maintenant. Avec une limite de
+                # messages, ces tâches seraient décomptées : les processus sont alors démarrés par les messages
+                for _ in range(self.max_workers):
+                    executor.submit(os.getpid)
+            return executor
+        if self.executor_mode == "pipeline":
+            # Les messages traversent des étapes (lecture, analyse, écriture) ayant chacune leurs workers
+            return BlurryPipeline()
+        if self.executor_mode != "thread":
+            raise ValueError(f"Unsupported EXECUTOR_MODE: {self.executor_mode}")
+        return ThreadPoolExecutor(max_workers=self.max_workers)
 
     def _connect(self):
         """Establishes a connection to the RabbitMQ server."""
@@ -51,9 +200,33 @@ class AmqpService:
         delivery_tag = method_frame.delivery_tag
         logger.info(f"📥 Received message from queue '{self.queue_name}': {body.decode()}; delivery_tag={delivery_tag}; header_frame={properties}")
 
+        prefetched = None
+        if self.metadata_loader is not None:
+            file_id = self._parse_file_id(body)
+            if file_id is not None:
+                prefetched = file_id, self.metadata_loader.prefetch(file_id)
+
         def _ack():
             channel.basic_ack(delivery_tag=delivery_tag)
 
+        def _retry_and_ack():
+            _retry_message()
+            _ack()
+
+        def _on_committed(error):
+            if error is None:
+                self.connection.add_callback_threadsafe(_ack)
+                return
+            # Retraité via la file de retry (x-retry-count) : un résultat impossible à enregistrer ne boucle pas
+            retry_count = properties.headers.get('x-retry-count', 0)
+            if retry_count < 3:
+                logger.error(f"❌ Failed to save the result, retrying message (attempt {retry_count + 1}): {error}")
+                self.connection.add_callback_threadsafe(_retry_and_ack)
+            else:
+                logger.error(f"❌ Failed to save the result, maximum retry attempts reached. Acknowledging message: "
+                             f"{error}")
+                self.connection.add_callback_threadsafe(_ack)
+
         def _retry_message():
             retry_delay_ms = 3000  # 3 secondes
             retry_queue = f"{self.queue_name}_retry"
@@ -77,9 +250,33 @@ class AmqpService:
                 properties=new_properties
             )
 
+        started_at = time.monotonic()
+        if self.concurrency_controller:
+            self.concurrency_controller.record_start()
+        memory_token = self.memory_governor.record_start() if self.memory_governor else None
+        self.metrics.messages_in_flight.inc()
+        if isinstance(properties.timestamp, int):
+            # Horodatage de publication (secondes), quand le producteur le renseigne
+            self.metrics.queue_lag.set(max(0.0, time.time() - properties.timestamp))
+
         def _on_done(future):
+            self.metrics.messages_in_flight.dec()
+            if self.concurrency_controller:
+                self.concurrency_controller.record_done(time.monotonic() - started_at)
+            if self.memory_governor:
+                self.metrics.message_peak_rss.observe(self.memory_governor.record_done(memory_token))
+            ack_deferred = False
             try:
-                future.result()
+                outcome = future.result()
+                if self.executor_mode == "process":
+                    # Les métriques des tâches sont enregistrées dans le processus worker
+                    outcome, error, observations = outcome
+                    self.metrics.merge(observations)
+                    if error is not None:
+                        raise error
+                if self.result_writer is not None and outcome is not None:
+                    self.result_writer.submit(outcome, on_committed=_on_committed)
+                    ack_deferred = True
             except RetryableException as e:
                 logger.warning(f"⚠️ Error processing message: {e}")
                 retry_count = properties.headers.get('x-retry-count', 0)
@@ -88,40 +285,101 @@ class AmqpService:
                     self.connection.add_callback_threadsafe(_retry_message)
                 else:
                     logger.error("❌ Maximum retry attempts reached. Acknowledging message.")
+                    ack_deferred = self._save_failed_analysis_behind(body, e, retry_count, _on_committed)
             except Exception as e:
                 logger.error(f"❌ Error processing message: {e}")
                 logger.error(f"Not retrying message due to non-retryable exception.")
+                ack_deferred = self._save_failed_analysis_behind(body, e, properties.headers.get('x-retry-count', 0),
+                                                                 _on_committed)
             finally:
-                self.connection.add_callback_threadsafe(_ack)
+                if prefetched is not None:
+                    # Un message redélivré (retry, requeue) relira son fichier au lieu de l'entrée préchargée
+                    self.metadata_loader.discard(*prefetched)
+                if not ack_deferred:
+                    self.connection.add_callback_threadsafe(_ack)
+                self._stop_if_drained()
 
-        futur = self.executor.submit(BlurryMessageProcessor.process, body, properties.headers.get('x-retry-count', 0))
+        if self.executor_mode == "pipeline":
+            futur = self.executor.submit_message(body, properties.headers.get('x-retry-count', 0))
+        elif self.executor_mode == "process":
+            futur = self.executor.submit(BlurryMessageProcessor.process_in_worker, body,
+                                         properties.headers.get('x-retry-count', 0))
+        else:
+            futur = self.executor.submit(BlurryMessageProcessor.process, body, properties.headers.get('x-retry-count', 0))
         futur.add_done_callback(_on_done)
 
+    @staticmethod
+    def _parse_file_id(body) -> int | None:
+        try:
+            return BlurryQueueMessage.from_dict(json.loads(body.decode())).file_id
+        except Exception:
+            return None
+
+    def _save_failed_analysis_behind(self, body, exception: Exception, retry_count: int, on_committed) -> bool:
+        """
+        With the write-behind writer, queue the failed analysis of the message.
+        Return True when the ack is deferred to the commit of the batch.
+        """
+        if self.result_writer is None or not BlurryMessageProcessor.should_save_failed_analysis(exception, retry_count):
+            return False
+        file_id = self._parse_file_id(body)
+        if file_id is None:
+            # Message illisible : aucun fichier auquel rattacher l'échec
+            return False
+        self.result_writer.submit(BlurryAnalysisOutcome.failed(file_id), on_committed=on_committed)
+        return True
+
     def start_listening(self):
         """Starts listening for messages on the configured queue."""
         self._connect()
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.executor = self._create_executor()
 
-        # Configure prefetch pour optimiser la distribution entre hosts et threads
-        # prefetch_count=4 permet à chaque host de traiter 4 messages simultanément
-        # tout en évitant qu'un même message soit traité par plusieurs hosts
-        self.channel.basic_qos(prefetch_count=4)  # 1 message par thread maximum
+        # Configure prefetch pour optimiser la distribution entre hosts et workers
+        # prefetch_count=max_workers (par défaut) permet à chaque host de traiter autant de messages que de workers
+        # tout en évitant qu'un même message soit traité par plusieurs hosts.
+        # Un prefetch plus grand regroupe davantage de lectures de métadonnées (METADATA_BATCH_ENABLED)
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        if self.concurrency_controller:
+            self.concurrency_controller.start()
+        if self.memory_governor:
+            self.memory_governor.start()
+        self.metrics.workers.set_function(self._effective_workers)
+        if MetricsRegistry.is_enabled():
+            self.metrics.start_server()
 
-        self.channel.basic_consume(
+        self.consumer_tag = self.channel.basic_consume(
             queue=self.queue_name,
             on_message_callback=self._message_callback,
             auto_ack=False  # Manual acknowledgment - CRITIQUE pour éviter la duplication
         )
 
-        logger.info(f"👂 Listening for messages on queue '{self.queue_name}' with {4} workers per host")
+        logger.info(
+            f"👂 Listening for messages on queue '{self.queue_name}' with {self.max_workers} {self.executor_mode} workers per host")
         try:
             self.channel.start_consuming()
         except KeyboardInterrupt:
             self.stop_listening()
+            return
+        if self._draining:
+            # Arrêt volontaire après recyclage : le conteneur est redémarré sans message perdu
+            self.stop_listening()
 
     def stop_listening(self):
         """Closes the connection to RabbitMQ."""
+        if self.concurrency_controller:
+            self.concurrency_controller.stop()
+        if self.memory_governor:
+            self.memory_governor.stop()
+        self.metrics.stop_server()
+        if self.result_writer:
+            # Enregistre les résultats en attente ; les messages non acquittés seront redistribués
+            self.result_writer.close()
         if self.connection and not self.connection.is_closed:
+            # La boucle de consommation est terminée : les acquittements du dernier lot, planifiés par
+            # add_callback_threadsafe, sont envoyés avant la fermeture
+            self.connection.process_data_events(time_limit=0)
             self.connection.close()
             self.database_service.close_all_connections()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
             logger.info("🔌 Connection to RabbitMQ closed.")
@@ -0,0 +1,93 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# Page A4 rendue jusqu'à 200 dpi : au-delà (photo), les tampons ne sont pas conservés entre deux pages
+MAX_BUFFER_PIXELS = 4_000_000
+
+
+class BlurStatisticsEngine:
+    """
+    Statistics of the blur detection computed by OpenCV kernels with as few passes and allocations as possible:
+    - the mean gray level with cv2.mean (blank detection);
+    - the row projection of the text mask: adaptive threshold and morphological opening written into reused
+      buffers, then the rows summed by cv2.reduce, without the intermediate 0/1 array;
+    - the Laplacian variance: Laplacian in int16 (2 bytes per pixel instead of 8, exact for 8-bit images) reduced
+      by cv2.meanStdDev in a single pass.
+    The buffers are reused from one page to the next through a pool shared by the threads, bounded to one set per
+    core (pages are analysed on CPU-bound workers) and to pages of MAX_BUFFER_PIXELS.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("BLUR_FUSED_STATS_ENABLED", "false").lower() == "true"
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.max_pooled_buffers = os.cpu_count() or 1
+            self._pool_lock = threading.Lock()
+            # Jeux de tampons libres, chaque calcul en emprunte un
+            self._pool: list[dict[str, np.ndarray]] = []
+            self._initialized = True
+
+    @contextmanager
+    def _borrow_buffers(self):
+        with self._pool_lock:
+            buffers = self._pool.pop() if self._pool else {}
+        try:
+            yield buffers
+        finally:
+            with self._pool_lock:
+                if len(self._pool) < self.max_pooled_buffers:
+                    self._pool.append(buffers)
+
+    @staticmethod
+    def _buffer(buffers: dict, name: str, shape: tuple, dtype) -> np.ndarray:
+        """
+        Return a buffer of the borrowed set with the given shape, reusing the memory of the previous pages.
+        """
+        size = shape[0] * shape[1]
+        if size > MAX_BUFFER_PIXELS:
+            return np.empty(shape, dtype=dtype)
+        buffer = buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    @staticmethod
+    def mean(gray: np.ndarray) -> float:
+        return cv2.mean(gray)[0]
+
+    def row_projection(self, gray: np.ndarray, block_size: int, c: int, kernel_size: tuple) -> np.ndarray:
+        """
+        Number of text mask pixels of each row: Gaussian adaptive threshold, then morphological opening.
+        """
+        with self._borrow_buffers() as buffers:
+            binary = self._buffer(buffers, "binary", gray.shape, np.uint8)
+            cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, c,
+                                  dst=binary)
+            opened = self._buffer(buffers, "opened", gray.shape, np.uint8)
+            cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size),
+                             dst=opened)
+            # Les pixels du masque valent 255 : la somme de la ligne divisée par 255 les compte
+            return cv2.reduce(opened, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0] // 255
+
+    def laplacian_variance(self, gray: np.ndarray) -> float:
+        with self._borrow_buffers() as buffers:
+            laplacian = self._buffer(buffers, "laplacian", gray.shape, np.int16)
+            # Noyau 3x3 sur des pixels 8 bits : |valeur| <= 4 * 255, exact en int16
+            cv2.Laplacian(gray, cv2.CV_16S, dst=laplacian)
+            _, stddev = cv2.meanStdDev(laplacian)
+            return float(stddev[0, 0]) ** 2
@@ -1,29 +1,74 @@
 import json
+import os
 import elasticapm
 
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.exceptions.invalid_message_body_format import InvalidMessageBodyFormat
 from dossierfacile_file_analysis.exceptions.retryable_exception import RetryableException
 from dossierfacile_file_analysis.executor.blurry_executor import BlurryExecutor
+from dossierfacile_file_analysis.models.blurry_analysis_outcome import BlurryAnalysisOutcome
 from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
+from dossierfacile_file_analysis.services.blurry_result_writer import BlurryResultWriter
 from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+from dossierfacile_file_analysis.services.metrics_registry import MetricsRegistry
 
 
 class BlurryMessageProcessor:
 
     @staticmethod
-    def process(body, retry_count: int):
-        database_service = DossierFacileDatabaseService()
-        client = elasticapm.get_client()
-        client.begin_transaction("task")
+    def warm_up():
+        """
+        Initializes the expensive per-worker resources once (DB connection pool, native modules
+        already imported with this module) so the first message does not pay for them.
+        """
+        DossierFacileDatabaseService()
+        logger.info(f"Worker process {os.getpid()} ready")
+
+    @staticmethod
+    def should_save_failed_analysis(exception: Exception, retry_count: int) -> bool:
+        # If the exception is not retryable we save in database the failed analysis
+        # or if exception is retryable and the retry count is greater than 3 we save the failed analysis
+        return not isinstance(exception, RetryableException) or retry_count >= 3
+
+    @staticmethod
+    def parse_message(body) -> BlurryQueueMessage:
         decoded_body = body.decode()
         logger.info(f"Received message: {decoded_body}")
         try:
-            blurry_queue_message = BlurryQueueMessage.from_dict(json.loads(decoded_body))
+            return BlurryQueueMessage.from_dict(json.loads(decoded_body))
         except Exception as e:
+            raise InvalidMessageBodyFormat(e)
+
+    @staticmethod
+    def to_outcome(blurry_queue_message: BlurryQueueMessage, blurry_result) -> BlurryAnalysisOutcome | None:
+        if blurry_result is None:
+            return None
+        return BlurryAnalysisOutcome.completed(blurry_queue_message.file_id, blurry_result)
+
+    @staticmethod
+    def save_failed_analysis_if_needed(blurry_queue_message: BlurryQueueMessage, exception: Exception,
+                                       retry_count: int):
+        """
+        Without the write-behind writer, save the failed analysis when the message will not be retried.
+        """
+        if not BlurryResultWriter.is_enabled() \
+                and BlurryMessageProcessor.should_save_failed_analysis(exception, retry_count):
+            DossierFacileDatabaseService().save_failed_analysis(blurry_queue_message.file_id)
+
+    @staticmethod
+    def process(body, retry_count: int) -> BlurryAnalysisOutcome | None:
+        """
+        Process a message and return its outcome. With the write-behind writer enabled, the result is not saved
+        here: the consumer saves the returned outcome (and the failed analyses) in batches.
+        """
+        client = elasticapm.get_client()
+        client.begin_transaction("task")
+        try:
+            blurry_queue_message = BlurryMessageProcessor.parse_message(body)
+        except InvalidMessageBodyFormat:
             client.capture_exception()
             client.end_transaction("message_processing", "failure")
-            raise InvalidMessageBodyFormat(e)
+            raise
         try:
             if blurry_queue_message is None:
                 client.end_transaction("message_processing", "failure")
@@ -31,15 +76,24 @@ class BlurryMessageProcessor:
 
             elasticapm.set_custom_context({"blurry_queue_message": blurry_queue_message.to_dict()})
             executor = BlurryExecutor(blurry_queue_message)
-            executor.execute()
+            blurry_result = executor.execute()
 
             client.end_transaction("message_processing", "success")
-            return True
+            return BlurryMessageProcessor.to_outcome(blurry_queue_message, blurry_result)
         except Exception as e:
             client.capture_exception()
             client.end_transaction("message_processing", "failure")
-            # If the exception is not retryable we save in database the failed analysis
-            # or if exception is retryable and the retry count is greater than 3 we save the failed analysis
-            if not isinstance(e, RetryableException) or (isinstance(e, RetryableException) and retry_count >= 3):
-                database_service.save_failed_analysis(blurry_queue_message.file_id)
+            BlurryMessageProcessor.save_failed_analysis_if_needed(blurry_queue_message, e, retry_count)
             raise e
+
+    @staticmethod
+    def process_in_worker(body, retry_count: int) -> tuple[BlurryAnalysisOutcome | None, Exception | None, dict]:
+        """
+        Process a message in a worker process. Return its outcome or its exception, with the metrics recorded by
+        the worker for the message so the consumer can export them.
+        """
+        try:
+            outcome, error = BlurryMessageProcessor.process(body, retry_count), None
+        except Exception as e:
+            outcome, error = None, e
+        return outcome, error, MetricsRegistry().drain()
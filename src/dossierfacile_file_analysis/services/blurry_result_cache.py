@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import OrderedDict
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+
+
+class BlurryResultCache:
+    """
+    Cache of analysis results keyed by the hash of the decrypted file content.
+    The first tier is a bounded in-process LRU, the optional second tier is the blurry_result_cache table.
+    The cache is best effort: a failure of the database tier is logged and treated as a miss.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.enabled = os.getenv("BLURRY_RESULT_CACHE_ENABLED", "false").lower() == "true"
+            self.max_entries = int(os.getenv("BLURRY_RESULT_CACHE_SIZE") or 1024)
+            self.database_enabled = os.getenv("BLURRY_RESULT_CACHE_DB_ENABLED", "false").lower() == "true"
+            # Change the namespace when the analysis changes, so that older results are not reused
+            self.namespace = os.getenv("BLURRY_RESULT_CACHE_NAMESPACE") or "v1"
+            self._entries: OrderedDict[str, dict] = OrderedDict()
+            self._entries_lock = threading.Lock()
+            self._initialized = True
+
+    def get(self, content_hash: str) -> BlurryResult | None:
+        key = self._key(content_hash)
+        with self._entries_lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is None and self.database_enabled:
+            try:
+                data = DossierFacileDatabaseService().get_cached_blurry_result(key)
+            except Exception as e:
+                logger.warning(f"Blurry result cache database lookup failed: {e}")
+            if data is not None:
+                self._put_in_memory(key, data)
+        # Un nouvel objet à chaque lecture : le résultat en cache ne peut pas être modifié par un appelant
+        return BlurryResult.from_dict(data) if data is not None else None
+
+    def put(self, content_hash: str, blurry_result: BlurryResult):
+        key = self._key(content_hash)
+        self._put_in_memory(key, blurry_result.to_dict())
+        if self.database_enabled:
+            try:
+                DossierFacileDatabaseService().save_cached_blurry_result(key, blurry_result)
+            except Exception as e:
+                logger.warning(f"Blurry result cache database write failed: {e}")
+
+    def _put_in_memory(self, key: str, data: dict):
+        with self._entries_lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _key(self, content_hash: str) -> str:
+        return f"{self.namespace}:{content_hash}"
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from typing import Callable
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.models.blurry_analysis_outcome import BlurryAnalysisOutcome
+from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+
+
+class _PendingWrite:
+    def __init__(self, outcome: BlurryAnalysisOutcome, on_committed: Callable[[Exception | None], None]):
+        self.outcome = outcome
+        self.on_committed = on_committed
+        self.enqueued_at = time.monotonic()
+
+
+class BlurryResultWriter:
+    """
+    Write-behind writer for analysis results.
+    Results are buffered and saved with one multi-row INSERT when RESULT_WRITER_BATCH_SIZE results are waiting
+    or when the oldest one has waited RESULT_WRITER_FLUSH_INTERVAL_MS. When the batch fails, its results are saved
+    one by one so that a faulty row does not fail the others. Once a result is committed (or has failed),
+    on_committed is called with None (or the error), which lets the caller acknowledge the message only after its
+    result is durable.
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("RESULT_WRITE_BEHIND_ENABLED", "false").lower() == "true"
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("RESULT_WRITER_BATCH_SIZE") or 50)
+        self.flush_interval = int(os.getenv("RESULT_WRITER_FLUSH_INTERVAL_MS") or 200) / 1000
+        self.database_service = DossierFacileDatabaseService()
+        self._pending: list[_PendingWrite] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="blurry-result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, outcome: BlurryAnalysisOutcome, on_committed: Callable[[Exception | None], None]):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BlurryResultWriter is closed")
+            self._pending.append(_PendingWrite(outcome, on_committed))
+            # Réveille le writer au premier résultat (démarrage du délai) et quand le lot est plein
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def close(self):
+        """
+        Flush the pending results and stop the writer thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if self._pending and not self._closed:
+                    # Attendre que le lot soit plein, au plus flush_interval après le plus ancien résultat
+                    deadline = self._pending[0].enqueued_at + self.flush_interval
+                    self._condition.wait_for(lambda: len(self._pending) >= self.batch_size or self._closed,
+                                             timeout=max(0.0, deadline - time.monotonic()))
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+                if not batch and self._closed:
+                    return
+            self._flush(batch)
+
+    def _flush(self, batch: list[_PendingWrite]):
+        try:
+            self.database_service.save_blurry_analysis_outcomes([pending.outcome for pending in batch])
+            logger.info(f"Saved a batch of {len(batch)} blurry results")
+            errors = [None] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                errors = [e]
+            else:
+                # Une seule ligne en erreur fait échouer le lot : les résultats sont réenregistrés un par un pour
+                # que seule cette ligne soit signalée en échec
+                logger.warning(f"Batch of {len(batch)} blurry results failed, saving them one by one: {e}")
+                errors = [self._save_one(pending) for pending in batch]
+        for pending, error in zip(batch, errors):
+            try:
+                pending.on_committed(error)
+            except Exception as e:
+                logger.error(f"Error in blurry result commit callback: {e}")
+
+    def _save_one(self, pending: _PendingWrite) -> Exception | None:
+        try:
+            self.database_service.save_blurry_analysis_outcomes([pending.outcome])
+            return None
+        except Exception as e:
+            return e
@@ -0,0 +1,154 @@
+import math
+import os
+import threading
+import time
+from typing import Callable
+
+import psutil
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+
+class ConcurrencyController:
+    """
+    AIMD controller of the number of messages processed at once by the consumer.
+    Every CONCURRENCY_SAMPLE_INTERVAL_S seconds it samples the CPU usage, the RSS of the worker processes and the
+    average service time of the messages:
+    - the limit is multiplied by CONCURRENCY_DECREASE_FACTOR when the CPU is above CONCURRENCY_TARGET_CPU_PERCENT,
+      the RSS above CONCURRENCY_MAX_RSS_MB or the service time has doubled since the last increase;
+    - it is increased by one when the CPU is below the target and every slot is busy;
+    - it is kept otherwise.
+    The limit stays between CONCURRENCY_MIN and CONCURRENCY_MAX and is applied as the AMQP prefetch count through
+    on_change, the worker pool being sized for CONCURRENCY_MAX (capped at the CPU count for worker processes).
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("CONCURRENCY_CONTROLLER_ENABLED", "false").lower() == "true"
+
+    def __init__(self, on_change: Callable[[int], None] | None = None):
+        self.min_limit = max(1, int(os.getenv("CONCURRENCY_MIN") or 1))
+        self.max_limit = max(self.min_limit, int(os.getenv("CONCURRENCY_MAX") or 0) or 2 * (os.cpu_count() or 1))
+        self.target_cpu_percent = float(os.getenv("CONCURRENCY_TARGET_CPU_PERCENT") or 85)
+        self.max_rss = int(os.getenv("CONCURRENCY_MAX_RSS_MB") or 0) * 1024 * 1024
+        self.decrease_factor = float(os.getenv("CONCURRENCY_DECREASE_FACTOR") or 0.75)
+        self.sample_interval = float(os.getenv("CONCURRENCY_SAMPLE_INTERVAL_S") or 10)
+        initial_limit = int(os.getenv("CONCURRENCY_INITIAL") or 0) or min(4, self.max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.on_change = on_change
+
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        # Moyenne glissante (EWMA) du temps de traitement d'un message
+        self._service_time = None
+        self._service_time_at_increase = None
+        self._last_state = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def cap(self, max_limit: int):
+        """Lowers the upper bound of the limit, e.g. to the number of cores for CPU-bound worker processes."""
+        with self._lock:
+            self.max_limit = max(1, min(self.max_limit, max_limit))
+            self.min_limit = min(self.min_limit, self.max_limit)
+            self.limit = min(self.limit, self.max_limit)
+
+    def start(self):
+        # Première mesure : cpu_percent compare ensuite à cet instant
+        psutil.cpu_percent(interval=None)
+        self._thread = threading.Thread(target=self._run, name="concurrency-controller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def record_start(self):
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def record_done(self, service_time: float):
+        with self._lock:
+            self._in_flight -= 1
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+
+    def _run(self):
+        while not self._stop.wait(self.sample_interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Concurrency controller sampling failed: {e}")
+
+    def _rss(self) -> int:
+        # En mode process, la mémoire est surtout dans les workers
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def sample(self) -> dict:
+        return self.decide(psutil.cpu_percent(interval=None), self._rss())
+
+    def decide(self, cpu_percent: float, rss: int) -> dict:
+        """
+        Apply one AIMD step for the given measures and return the new state.
+        """
+        with self._lock:
+            previous_limit = self.limit
+            busy = self._peak_in_flight >= self.limit
+            self._peak_in_flight = self._in_flight
+            service_time = self._service_time
+
+            if self.max_rss and rss > self.max_rss:
+                action, reason = "decrease", "rss above limit"
+            elif cpu_percent > self.target_cpu_percent:
+                action, reason = "decrease", "cpu above target"
+            elif service_time is not None and self._service_time_at_increase is not None \
+                    and service_time > 2 * self._service_time_at_increase:
+                action, reason = "decrease", "service time doubled"
+            elif busy and self.limit < self.max_limit:
+                action, reason = "increase", "cpu below target and all slots busy"
+            else:
+                action, reason = "hold", "stable"
+
+            if action == "decrease":
+                self.limit = max(self.min_limit, math.floor(self.limit * self.decrease_factor))
+                self._service_time_at_increase = None
+            elif action == "increase":
+                self.limit += 1
+                self._service_time_at_increase = service_time
+
+            self._last_state = {
+                "limit": self.limit,
+                "minLimit": self.min_limit,
+                "maxLimit": self.max_limit,
+                "action": action,
+                "reason": reason,
+                "cpuPercent": cpu_percent,
+                "rssMb": round(rss / (1024 * 1024), 1),
+                "inFlight": self._in_flight,
+                "serviceTimeSeconds": round(service_time, 3) if service_time is not None else None
+            }
+            state = dict(self._last_state)
+
+        if self.limit != previous_limit:
+            logger.info(f"Concurrency limit {previous_limit} -> {self.limit} ({reason})")
+            if self.on_change is not None:
+                self.on_change(self.limit)
+        return state
+
+    def get_state(self) -> dict:
+        """
+        Current decision of the controller, with the measures it was based on.
+        """
+        with self._lock:
+            return dict(self._last_state) or {"limit": self.limit, "minLimit": self.min_limit,
+                                              "maxLimit": self.max_limit, "action": "initial"}
@@ -5,9 +5,11 @@ import json
 
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.data.file_dto import FileDto
+from dossierfacile_file_analysis.models.blurry_analysis_outcome import BlurryAnalysisOutcome
 from dossierfacile_file_analysis.models.blurry_result import BlurryResult
 
 
@@ -50,6 +52,17 @@ class DossierFacileDatabaseService:
         """Remettre une connexion dans le pool"""
         self.__connection_pool.putconn(conn)
 
+    _FILE_QUERY = "SELECT " \
+                  "f.id as id, " \
+                  "sf.path as path, " \
+                  "sf.content_type as content_type, " \
+                  "ek.encoded as encryption_key, " \
+                  "ek.version as encryption_key_version, " \
+                  "sf.provider as provider " \
+                  "FROM file as f " \
+                  "join storage_file as sf on f.storage_file_id = sf.id " \
+                  "left join encryption_key as ek on sf.encryption_key_id = ek.id "
+
     def get_file_by_id(self, file_id):
         start_time = time.time()
         logger.info("Retrieving file by ID from the database")
@@ -61,17 +74,7 @@ class DossierFacileDatabaseService:
             cursor = conn.cursor()
 
             # Requête SQL pour récupérer les données du fichier
-            query = "SELECT " \
-                    "f.id as id, " \
-                    "sf.path as path, " \
-                    "sf.content_type as content_type, " \
-                    "ek.encoded as encryption_key, " \
-                    "ek.version as encryption_key_version, " \
-                    "sf.provider as provider " \
-                    "FROM file as f " \
-                    "join storage_file as sf on f.storage_file_id = sf.id " \
-                    "left join encryption_key as ek on sf.encryption_key_id = ek.id " \
-                    "WHERE f.id = %s"
+            query = self._FILE_QUERY + "WHERE f.id = %s"
             cursor.execute(query, (file_id,))
 
             # Récupérer les résultats
@@ -98,6 +101,37 @@ class DossierFacileDatabaseService:
             if conn:
                 self._put_connection(conn)
 
+    def get_files_by_ids(self, file_ids: list[int]) -> dict[int, FileDto]:
+        """
+        Retrieve the files of several messages with a single query.
+        Files that do not exist are missing from the returned dict.
+        """
+        start_time = time.time()
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(self._FILE_QUERY + "WHERE f.id = ANY(%s)", (list(file_ids),))
+            column_names = [desc[0] for desc in cursor.description]
+            files = {}
+            for row in cursor.fetchall():
+                file_dto = FileDto(**dict(zip(column_names, row)))
+                files[file_dto.id] = file_dto
+            end_time = time.time()
+            logger.info(f"Database read of {len(file_ids)} files take : {end_time - start_time:.2f} seconds")
+            return files
+        except Exception as e:
+            logger.error(f"Error retrieving files {file_ids}: {e}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._put_connection(conn)
+
     def save_blurry_result(self, file_id: int, blurry_result: BlurryResult):
         conn = None
         cursor = None
@@ -145,6 +179,83 @@ class DossierFacileDatabaseService:
             if conn:
                 self._put_connection(conn)
 
+    def save_blurry_analysis_outcomes(self, outcomes: list[BlurryAnalysisOutcome]):
+        """
+        Save several analysis results with a single multi-row INSERT and a single commit.
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            query = "INSERT INTO blurry_file_analysis (file_id, blurry_results, analysis_status) VALUES %s"
+            rows = [
+                (outcome.file_id,
+                 json.dumps(outcome.blurry_result.to_dict()) if outcome.blurry_result is not None else None,
+                 outcome.analysis_status)
+                for outcome in outcomes
+            ]
+            execute_values(cursor, query, rows, page_size=len(rows))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to save a batch of {len(outcomes)} blurry results: {e}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._put_connection(conn)
+
+    def get_cached_blurry_result(self, content_hash: str) -> dict | None:
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            query = "SELECT blurry_results FROM blurry_result_cache WHERE content_hash = %s"
+            cursor.execute(query, (content_hash,))
+            row = cursor.fetchone()
+            conn.commit()
+            if row is None:
+                return None
+            # psycopg2 décode déjà les colonnes jsonb
+            return row[0] if isinstance(row[0], dict) else json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Failed to read cached blurry result for hash {content_hash}: {e}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._put_connection(conn)
+
+    def save_cached_blurry_result(self, content_hash: str, blurry_result: BlurryResult):
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            query = (
+                "INSERT INTO blurry_result_cache (content_hash, blurry_results) "
+                "VALUES (%s, %s) ON CONFLICT (content_hash) DO NOTHING"
+            )
+            cursor.execute(query, (content_hash, json.dumps(blurry_result.to_dict())))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to save cached blurry result for hash {content_hash}: {e}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._put_connection(conn)
+
     def close_all_connections(self):
         """Fermer toutes les connexions du pool (à appeler à l'arrêt de l'application)"""
         if hasattr(self, '__connection_pool'):
@@ -1,3 +1,4 @@
+import mmap
 import os
 from abc import ABC, abstractmethod
 from hashlib import sha256, md5
@@ -11,50 +12,95 @@ from dossierfacile_file_analysis.exceptions.encryption_key_is_missing import Enc
 from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
 
 
+GCM_TAG_SIZE = 16
+# update_into exige block_size - 1 octets de marge dans le buffer de sortie
+AES_BLOCK_SIZE = 16
+
+
 class FileDownloader(ABC):
 
     def __init__(self):
         self.local_file_path = os.getenv("LOCAL_FILE_PATH")
+        self.decryption_chunk_size = int(os.getenv("DECRYPTION_CHUNK_SIZE") or 1024 * 1024)
+        # Mode mémoire : aucun fichier intermédiaire n'est écrit, le contenu déchiffré reste en mémoire
+        self.in_memory = os.getenv("IN_MEMORY_PIPELINE", "false").lower() == "true"
 
     @abstractmethod
     def download_file(self, file_dto: FileDto) -> DownloadedFile | None:
         pass
 
     @staticmethod
-    def decrypt_file(encrypted_data, encryption_key, path, key_version):
+    def _create_decryptor(encryption_key, path, key_version, tag):
         """
-        Déchiffre les données chiffrées à l'aide de la clé de chiffrement et du chemin pour générer l'IV.
+        Crée le déchiffreur AES/GCM/NoPadding, l'IV étant dérivé du chemin du fichier.
         """
-
+        # Générer l'IV à partir du chemin
+        if key_version == 2:
+            iv = sha256(path.encode()).digest()
+        else:
+            iv = md5(path.encode()).digest()
+
+        # Convertir la clé de chiffrement en bytes si nécessaire
+        if isinstance(encryption_key, memoryview):
+            encryption_key = encryption_key.tobytes()  # Convertir memoryview en bytes
+        elif isinstance(encryption_key, str):
+            encryption_key = bytes.fromhex(encryption_key)  # Convertir une chaîne hexadécimale en bytes
+
+        backend = default_backend()
+        cipher = Cipher(algorithms.AES(encryption_key), modes.GCM(iv, tag), backend=backend)
+        return cipher.decryptor()
+
+    def decrypt_stream(self, encrypted_view: memoryview, encryption_key, path, key_version,
+                       destination_path: str | None = None):
+        """
+        Decrypt chunk by chunk without copying the ciphertext: the tag is read from the end of the view and each
+        chunk is decrypted with update_into.
+        When destination_path is given the plaintext is streamed to that file and None is returned, otherwise it is
+        decrypted into a single preallocated buffer and returned as a memoryview.
+        """
+        if len(encrypted_view) < GCM_TAG_SIZE:
+            raise ValueError("Encrypted data is too short to contain the authentication tag")
+        ciphertext_length = len(encrypted_view) - GCM_TAG_SIZE
         try:
-            # Générer l'IV à partir du chemin
-            if key_version == 2:
-                iv = sha256(path.encode()).digest()
-            else:
-                iv = md5(path.encode()).digest()
-
-            # Convertir la clé de chiffrement en bytes si nécessaire
-            if isinstance(encryption_key, memoryview):
-                encryption_key = encryption_key.tobytes()  # Convertir memoryview en bytes
-            elif isinstance(encryption_key, str):
-                encryption_key = bytes.fromhex(encryption_key)  # Convertir une chaîne hexadécimale en bytes
-
-            # Séparer les données chiffrées et le tag d'authentification
-            tag = encrypted_data[-16:]  # Le tag est stocké dans les 16 derniers octets
-            ciphertext = encrypted_data[:-16]  # Le reste est le texte chiffré
-
-            # Déchiffrement avec AES/GCM/NoPadding
-            backend = default_backend()
-            cipher = Cipher(algorithms.AES(encryption_key), modes.GCM(iv, tag), backend=backend)
-            decryptor = cipher.decryptor()
-
-            # Déchiffrer les données
-            decrypted_data = decryptor.update(ciphertext) + decryptor.finalize()
-            return decrypted_data
+            decryptor = self._create_decryptor(encryption_key, path, key_version,
+                                               bytes(encrypted_view[ciphertext_length:]))
+            if destination_path is None:
+                return self._decrypt_chunks_to_buffer(encrypted_view, ciphertext_length, decryptor)
+            self._decrypt_chunks_to_file(encrypted_view, ciphertext_length, decryptor, destination_path)
+            return None
         except Exception as e:
             logger.error(f"An error occurred during decryption: {e}")
             raise
 
+    def _decrypt_chunks_to_buffer(self, encrypted_view: memoryview, ciphertext_length: int, decryptor):
+        output = bytearray(ciphertext_length + AES_BLOCK_SIZE - 1)
+        output_view = memoryview(output)
+        for offset in range(0, ciphertext_length, self.decryption_chunk_size):
+            end = min(offset + self.decryption_chunk_size, ciphertext_length)
+            with encrypted_view[offset:end] as chunk, \
+                    output_view[offset:end + AES_BLOCK_SIZE - 1] as destination:
+                decryptor.update_into(chunk, destination)
+        # finalize vérifie le tag : lève InvalidTag si les données sont altérées
+        decryptor.finalize()
+        return output_view[:ciphertext_length]
+
+    def _decrypt_chunks_to_file(self, encrypted_view: memoryview, ciphertext_length: int, decryptor,
+                                destination_path: str):
+        scratch_view = memoryview(bytearray(self.decryption_chunk_size + AES_BLOCK_SIZE - 1))
+        try:
+            with open(destination_path, "wb") as decrypted_file:
+                for offset in range(0, ciphertext_length, self.decryption_chunk_size):
+                    end = min(offset + self.decryption_chunk_size, ciphertext_length)
+                    with encrypted_view[offset:end] as chunk:
+                        written = decryptor.update_into(chunk, scratch_view)
+                    decrypted_file.write(scratch_view[:written])
+            decryptor.finalize()
+        except Exception:
+            # Ne jamais laisser un fichier partiellement déchiffré ou non authentifié
+            if os.path.exists(destination_path):
+                os.remove(destination_path)
+            raise
+
     @staticmethod
     def get_file_extension_from_content_type(content_type):
         # Map des types de contenu aux extensions de fichiers
@@ -68,22 +114,39 @@ class FileDownloader(ABC):
         return content_type_map.get(content_type, None)
 
     def decrypt_file_with_key(self, file_path, file_dto: FileDto):
-        destination_path = f"{self.local_file_path}{file_dto.path}{self.get_file_extension_from_content_type(file_dto.content_type)}"
+        """
+        Decrypt a file from disk. The encrypted file is memory-mapped, so peak memory does not grow with its size.
+        """
         try:
-            # Lire le fichier chiffré
-            with open(file_path, "rb") as encrypted_file:
-                encrypted_data = encrypted_file.read()
+            if os.path.getsize(file_path) == 0:
+                raise ValueError(f"Encrypted file is empty: {file_path}")
+            # Lire le fichier chiffré via mmap, sans le charger en mémoire
+            with open(file_path, "rb") as encrypted_file, \
+                    mmap.mmap(encrypted_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file, \
+                    memoryview(mapped_file) as encrypted_view:
+                downloaded_file = self.decrypt_data_with_key(encrypted_view, file_dto)
+        except Exception as e:
+            logger.error(f"An error occurred while downloading or decrypting the file: {e}")
+            raise e
+        return downloaded_file
 
+    def decrypt_data_with_key(self, encrypted_data, file_dto: FileDto):
+        try:
             # Déchiffrer le fichier si une clé est fournie
-            if file_dto.encryption_key:
-                decrypted_data = self.decrypt_file(encrypted_data, file_dto.encryption_key, file_dto.path,
-                                                   file_dto.encryption_key_version)
-            else:
+            if not file_dto.encryption_key:
                 raise EncryptionKeyIsMissingException(file_id=file_dto.id)
 
-            # Écrire le fichier déchiffré
-            with open(destination_path, "wb") as decrypted_file:
-                decrypted_file.write(decrypted_data)
+            with memoryview(encrypted_data) as encrypted_view:
+                if self.in_memory:
+                    decrypted_data = self.decrypt_stream(encrypted_view, file_dto.encryption_key, file_dto.path,
+                                                         file_dto.encryption_key_version)
+                    return DownloadedFile(file_name=file_dto.path, file_path=None, file_type=file_dto.content_type,
+                                          file_content=decrypted_data)
+
+                # Écrire le fichier déchiffré au fil de l'eau
+                destination_path = f"{self.local_file_path}{file_dto.path}{self.get_file_extension_from_content_type(file_dto.content_type)}"
+                self.decrypt_stream(encrypted_view, file_dto.encryption_key, file_dto.path,
+                                    file_dto.encryption_key_version, destination_path=destination_path)
 
             return DownloadedFile(file_name=file_dto.path, file_path=destination_path, file_type=file_dto.content_type)
         except Exception as e:
@@ -1,15 +1,15 @@
+import io
 import os
 import time
 import uuid
 import threading
 
-import boto3
-from botocore.config import Config
-
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.data.file_dto import FileDto
 from dossierfacile_file_analysis.exceptions.retryable_exception import RetryableException
 from dossierfacile_file_analysis.services.file_downloader.file_downloader import FileDownloader
+from dossierfacile_file_analysis.services.file_downloader.ranged_downloader import RangedDownloader
+from dossierfacile_file_analysis.services.file_downloader.s3_client_manager import S3ClientManager
 
 
 class OVHFileDownloader(FileDownloader):
@@ -28,19 +28,18 @@ class OVHFileDownloader(FileDownloader):
             logger.info("Initializing OVHFileDownloader")
             super().__init__()
             self.encrypted_file_path = "/tmp/encrypted_file"
+            self.ranged_downloader = RangedDownloader() if RangedDownloader.is_enabled() else None
             # Créer le répertoire une seule fois
-            if not os.path.exists(self.encrypted_file_path):
+            if not self.in_memory and not os.path.exists(self.encrypted_file_path):
                 os.makedirs(self.encrypted_file_path, exist_ok=True)
             self._initialized = True
 
-    def _create_s3_client(self):
-        """Créer un client S3 par thread pour éviter les conflits"""
-        return boto3.client(
-            "s3",
+    def _get_s3_client(self):
+        """Client S3 partagé entre les threads et les messages (thread-safe)"""
+        return S3ClientManager().get_client(
             endpoint_url=os.getenv("OVH_S3_ENDPOINT_URL"),
-            aws_access_key_id=os.getenv("OVH_S3_ACCESS_KEY"),
-            aws_secret_access_key=os.getenv("OVH_S3_SECRET_KEY"),
-            config=Config(signature_version="s3v4"),
+            access_key=os.getenv("OVH_S3_ACCESS_KEY"),
+            secret_key=os.getenv("OVH_S3_SECRET_KEY"),
             region_name=os.getenv("OVH_S3_REGION")
         )
 
@@ -48,14 +47,23 @@ class OVHFileDownloader(FileDownloader):
         logger.info("Downloading file from OVH storage")
         start_time = time.time()
 
+        if self.in_memory:
+            downloaded_file = self._download_file_in_memory(file_dto)
+            end_time = time.time()
+            logger.info(f"download and decrypt file in memory take : {end_time - start_time:.2f} seconds")
+            return downloaded_file
+
         # Générer un nom de fichier unique pour éviter les collisions entre threads
         unique_filename = f"{uuid.uuid4()}_{os.path.basename(file_dto.path)}"
         encrypted_file_path = os.path.join(self.encrypted_file_path, unique_filename)
 
         try:
-            # Créer un client S3 par thread
-            s3_client = self._create_s3_client()
-            s3_client.download_file(os.getenv("OVH_S3_BUCKET"), file_dto.path, encrypted_file_path)
+            s3_client = self._get_s3_client()
+            if self.ranged_downloader is not None:
+                self.ranged_downloader.download_to_file(s3_client, os.getenv("OVH_S3_BUCKET"), file_dto.path,
+                                                        encrypted_file_path)
+            else:
+                s3_client.download_file(os.getenv("OVH_S3_BUCKET"), file_dto.path, encrypted_file_path)
         except Exception as e:
             raise RetryableException("Failed to download file from OVH storage") from e
 
@@ -69,3 +77,17 @@ class OVHFileDownloader(FileDownloader):
         end_time = time.time()
         logger.info(f"download and decrypt file take : {end_time - start_time:.2f} seconds")
         return downloaded_file
+
+    def _download_file_in_memory(self, file_dto: FileDto):
+        try:
+            s3_client = self._get_s3_client()
+            if self.ranged_downloader is not None:
+                encrypted_data = self.ranged_downloader.download_to_buffer(s3_client, os.getenv("OVH_S3_BUCKET"),
+                                                                           file_dto.path)
+            else:
+                encrypted_buffer = io.BytesIO()
+                s3_client.download_fileobj(os.getenv("OVH_S3_BUCKET"), file_dto.path, encrypted_buffer)
+                encrypted_data = encrypted_buffer.getbuffer()
+        except Exception as e:
+            raise RetryableException("Failed to download file from OVH storage") from e
+        return self.decrypt_data_with_key(encrypted_data, file_dto)
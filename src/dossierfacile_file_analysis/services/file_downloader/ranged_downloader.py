@@ -0,0 +1,115 @@
+import os
+import threading
+from concurrent.futures import wait, FIRST_EXCEPTION
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+
+class RangedDownloader:
+    """
+    Download strategy for S3 objects: the size is read with a HEAD request, objects up to
+    RANGED_DOWNLOAD_THRESHOLD are fetched with a single GET, larger ones with concurrent byte-range GETs
+    of RANGED_DOWNLOAD_PART_SIZE written at their offset in a preallocated buffer (or file).
+    The SSE-C parameters (extra_args) are sent with the HEAD and with every part.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("RANGED_DOWNLOAD_ENABLED", "false").lower() == "true"
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.threshold = int(os.getenv("RANGED_DOWNLOAD_THRESHOLD") or 8 * 1024 * 1024)
+            self.part_size = int(os.getenv("RANGED_DOWNLOAD_PART_SIZE") or 8 * 1024 * 1024)
+            self.concurrency = int(os.getenv("RANGED_DOWNLOAD_CONCURRENCY") or 8)
+            self.read_chunk_size = 256 * 1024
+            # Pool partagé par tous les messages : le nombre de GET simultanés du process est borné
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ranged-download")
+            self._initialized = True
+
+    def download_to_buffer(self, s3_client, bucket: str, key: str, extra_args: dict | None = None) -> memoryview:
+        """
+        Download the object into a buffer of its exact size and return a view of it.
+        """
+        size, etag = self._head(s3_client, bucket, key, extra_args or {})
+        buffer = memoryview(bytearray(size))
+
+        def _write(offset: int, data: bytes):
+            buffer[offset:offset + len(data)] = data
+
+        self._download(s3_client, bucket, key, extra_args or {}, size, etag, _write)
+        return buffer
+
+    def download_to_file(self, s3_client, bucket: str, key: str, destination_path: str, extra_args: dict | None = None):
+        """
+        Download the object into a file preallocated to its size, each part being written at its offset.
+        """
+        size, etag = self._head(s3_client, bucket, key, extra_args or {})
+        fd = os.open(destination_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._download(s3_client, bucket, key, extra_args or {}, size, etag,
+                           lambda offset, data: os.pwrite(fd, data, offset))
+        except Exception:
+            os.close(fd)
+            if os.path.exists(destination_path):
+                os.remove(destination_path)
+            raise
+        os.close(fd)
+
+    @staticmethod
+    def _head(s3_client, bucket: str, key: str, extra_args: dict):
+        response = s3_client.head_object(Bucket=bucket, Key=key, **extra_args)
+        return response["ContentLength"], response.get("ETag")
+
+    def _download(self, s3_client, bucket: str, key: str, extra_args: dict, size: int, etag: str | None, write):
+        if size <= self.threshold:
+            self._get_range(s3_client, bucket, key, extra_args, etag, 0, size, write, use_range=False)
+            return
+
+        ranges = [(start, min(start + self.part_size, size)) for start in range(0, size, self.part_size)]
+        logger.info(f"Downloading {key} ({size} bytes) with {len(ranges)} ranged requests")
+        futures = [self.executor.submit(self._get_range, s3_client, bucket, key, extra_args, etag, start, end, write)
+                   for start, end in ranges]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+        # Attendre les parts en cours avant de libérer le buffer ou le fichier
+        wait(not_done)
+        for future in futures:
+            if not future.cancelled():
+                future.result()
+
+    def _get_range(self, s3_client, bucket: str, key: str, extra_args: dict, etag: str | None, start: int, end: int,
+                   write, use_range: bool = True):
+        params = dict(Bucket=bucket, Key=key, **extra_args)
+        if use_range:
+            params["Range"] = f"bytes={start}-{end - 1}"
+        if etag:
+            # Toutes les parts doivent provenir de la même version de l'objet
+            params["IfMatch"] = etag
+        body = s3_client.get_object(**params)["Body"]
+        offset = start
+        try:
+            while True:
+                data = body.read(self.read_chunk_size)
+                if not data:
+                    break
+                if offset + len(data) > end:
+                    raise IOError(f"Received more data than requested for {key} range {start}-{end - 1}")
+                write(offset, data)
+                offset += len(data)
+        finally:
+            body.close()
+        if offset != end:
+            raise IOError(f"Incomplete download of {key}: received {offset - start} of {end - start} bytes")
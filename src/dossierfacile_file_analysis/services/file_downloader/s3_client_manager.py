@@ -0,0 +1,107 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+
+class S3ClientStats:
+    """
+    Usage of the S3 clients, shared by all the clients of the manager.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.clients_reused = 0
+        self.requests_sent = 0
+        self.requests_in_flight = 0
+        self.peak_requests_in_flight = 0
+
+    def _on_before_send(self, **kwargs):
+        with self._lock:
+            self.requests_sent += 1
+            self.requests_in_flight += 1
+            self.peak_requests_in_flight = max(self.peak_requests_in_flight, self.requests_in_flight)
+
+    def _on_response_received(self, **kwargs):
+        with self._lock:
+            self.requests_in_flight -= 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "clientsCreated": self.clients_created,
+                "clientsReused": self.clients_reused,
+                "requestsSent": self.requests_sent,
+                "requestsInFlight": self.requests_in_flight,
+                "peakRequestsInFlight": self.peak_requests_in_flight
+            }
+
+
+class S3ClientManager:
+    """
+    Creates one S3 client per endpoint configuration and shares it between messages and worker threads.
+    boto3 clients are thread-safe: reusing them avoids resolving credentials, loading the service model
+    and opening new TLS connections for every download. Each client keeps up to S3_MAX_POOL_CONNECTIONS
+    connections alive.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.max_pool_connections = int(os.getenv("S3_MAX_POOL_CONNECTIONS") or 16)
+            self.tcp_keepalive = os.getenv("S3_TCP_KEEPALIVE", "true").lower() == "true"
+            self.stats = S3ClientStats()
+            self._clients = {}
+            self._clients_lock = threading.Lock()
+            self._initialized = True
+
+    def get_client(self, endpoint_url: str | None, access_key: str | None, secret_key: str | None,
+                   region_name: str | None):
+        key = (endpoint_url, access_key, secret_key, region_name)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.stats.clients_reused += 1
+                return client
+            # La création du client n'est pas thread-safe (session boto3) : elle reste sous le verrou
+            client = self._create_client(endpoint_url, access_key, secret_key, region_name)
+            self._clients[key] = client
+            self.stats.clients_created += 1
+            logger.info(f"Created S3 client for endpoint {endpoint_url} "
+                        f"with {self.max_pool_connections} pooled connections")
+            return client
+
+    def _create_client(self, endpoint_url, access_key, secret_key, region_name):
+        client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(
+                signature_version="s3v4",
+                max_pool_connections=self.max_pool_connections,
+                tcp_keepalive=self.tcp_keepalive
+            ),
+            region_name=region_name
+        )
+        client.meta.events.register("before-send.s3", self.stats._on_before_send)
+        client.meta.events.register("response-received.s3", self.stats._on_response_received)
+        return client
+
+    def get_stats(self) -> dict:
+        stats = self.stats.to_dict()
+        stats["clients"] = len(self._clients)
+        stats["maxPoolConnections"] = self.max_pool_connections
+        return stats
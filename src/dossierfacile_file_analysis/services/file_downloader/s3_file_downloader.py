@@ -1,18 +1,18 @@
 import base64
 import hashlib
+import io
 import os
 import time
 import threading
 import uuid
 
-import boto3
-from botocore.config import Config
-
 from dossierfacile_file_analysis.custom_logging.logging_config import logger
 from dossierfacile_file_analysis.data.file_dto import FileDto
 from dossierfacile_file_analysis.exceptions.retryable_exception import RetryableException
 from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
 from dossierfacile_file_analysis.services.file_downloader.file_downloader import FileDownloader
+from dossierfacile_file_analysis.services.file_downloader.ranged_downloader import RangedDownloader
+from dossierfacile_file_analysis.services.file_downloader.s3_client_manager import S3ClientManager
 
 
 class S3FileDownloader(FileDownloader):
@@ -31,16 +31,15 @@ class S3FileDownloader(FileDownloader):
             logger.info("Initializing s3 file downloader")
             super().__init__()
             self.bucket_name = os.getenv("S3_RAW_BUCKET_NAME")
+            self.ranged_downloader = RangedDownloader() if RangedDownloader.is_enabled() else None
             self._initialized = True
 
-    def _create_s3_client(self):
-        """Créer un client S3 par thread pour éviter les conflits"""
-        return boto3.client(
-            "s3",
+    def _get_s3_client(self):
+        """Client S3 partagé entre les threads et les messages (thread-safe)"""
+        return S3ClientManager().get_client(
             endpoint_url=os.getenv("S3_ENDPOINT_URL"),
-            aws_access_key_id=os.getenv("S3_FILE_ANALYSIS_ACCESS_KEY"),
-            aws_secret_access_key=os.getenv("S3_FILE_ANALYSIS_SECRET_KEY"),
-            config=Config(signature_version="s3v4"),
+            access_key=os.getenv("S3_FILE_ANALYSIS_ACCESS_KEY"),
+            secret_key=os.getenv("S3_FILE_ANALYSIS_SECRET_KEY"),
             region_name=os.getenv("S3_REGION")
         )
 
@@ -57,23 +56,36 @@ class S3FileDownloader(FileDownloader):
             md5_hash = hashlib.md5(file_dto.encryption_key).digest()
             sse_customer_key_md5 = base64.b64encode(md5_hash).decode('utf-8')
 
-            # Créer un client S3 par thread
-            s3_client = self._create_s3_client()
+            extra_args = {
+                "SSECustomerAlgorithm": "AES256",
+                "SSECustomerKey": sse_customer_key,
+                "SSECustomerKeyMD5": sse_customer_key_md5
+            }
+
+            s3_client = self._get_s3_client()
 
-            with open(output_path, 'wb') as data:
-                s3_client.download_fileobj(
-                    self.bucket_name,
-                    file_dto.path,
-                    data,
-                    ExtraArgs={
-                        "SSECustomerAlgorithm": "AES256",
-                        "SSECustomerKey": sse_customer_key,
-                        "SSECustomerKeyMD5": sse_customer_key_md5
-                    })
+            if self.ranged_downloader is not None:
+                # HEAD puis un GET unique ou des GET par plages en parallèle, SSE-C sur chaque requête
+                if self.in_memory:
+                    content = self.ranged_downloader.download_to_buffer(s3_client, self.bucket_name, file_dto.path,
+                                                                        extra_args=extra_args)
+                else:
+                    self.ranged_downloader.download_to_file(s3_client, self.bucket_name, file_dto.path, output_path,
+                                                            extra_args=extra_args)
+            elif self.in_memory:
+                data = io.BytesIO()
+                s3_client.download_fileobj(self.bucket_name, file_dto.path, data, ExtraArgs=extra_args)
+                content = data.getbuffer()
+            else:
+                with open(output_path, 'wb') as data:
+                    s3_client.download_fileobj(self.bucket_name, file_dto.path, data, ExtraArgs=extra_args)
 
         except Exception as e:
             raise RetryableException("Failed to download file from S3 storage") from e
         end_time = time.time()
         logger.info(f"download file take : {end_time - start_time:.2f} seconds")
+        if self.in_memory:
+            return DownloadedFile(file_name=unique_filename, file_path=None, file_type=file_dto.content_type,
+                                  file_content=content)
         return DownloadedFile(file_name=unique_filename, file_path=output_path,
                               file_type=file_dto.content_type)
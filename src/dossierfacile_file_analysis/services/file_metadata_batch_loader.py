@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+from dossierfacile_file_analysis.data.file_dto import FileDto
+from dossierfacile_file_analysis.services.dossier_facile_database_service import DossierFacileDatabaseService
+
+
+class FileMetadataBatchLoader:
+    """
+    Resolves the file metadata of the messages in the prefetch window with one query.
+    The consumer registers each file id as soon as the message is delivered (prefetch); the ids registered within
+    METADATA_BATCH_WINDOW_MS of the first one (at most METADATA_BATCH_MAX_SIZE) are loaded together
+    by get_files_by_ids, and the workers read their file from the batch with get. The consumer discards the file of a
+    message once its delivery is settled, so that a redelivered message reads its file again.
+    Only useful when the messages are processed in the consumer process (thread and pipeline modes).
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("METADATA_BATCH_ENABLED", "false").lower() == "true" \
+            and (os.getenv("EXECUTOR_MODE") or "thread") != "process"
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.window = int(os.getenv("METADATA_BATCH_WINDOW_MS") or 5) / 1000
+            self.max_size = int(os.getenv("METADATA_BATCH_MAX_SIZE") or 100)
+            self.database_service = DossierFacileDatabaseService()
+            self._futures: dict[int, Future] = {}
+            # Ids à charger avec le prochain lot, avec la future de leur enregistrement
+            self._pending: list[tuple[int, Future]] = []
+            self._condition = threading.Condition()
+            self._thread = threading.Thread(target=self._run, name="file-metadata-batch-loader", daemon=True)
+            self._thread.start()
+            self._initialized = True
+
+    def prefetch(self, file_id: int) -> Future:
+        """
+        Register a file id to be loaded with the next batch, without waiting for it.
+        """
+        with self._condition:
+            future = self._futures.get(file_id)
+            if future is None:
+                future = Future()
+                self._futures[file_id] = future
+                self._pending.append((file_id, future))
+                # Réveille le loader au premier id (début de la fenêtre) et quand le lot est plein
+                if len(self._pending) == 1 or len(self._pending) >= self.max_size:
+                    self._condition.notify()
+            return future
+
+    def get(self, file_id: int) -> FileDto | None:
+        """
+        Return the file of a message, loading it with the current batch if it was not prefetched.
+        """
+        future = self.prefetch(file_id)
+        try:
+            return future.result()
+        finally:
+            with self._condition:
+                # Le résultat est consommé par un seul message : il n'est pas conservé
+                if self._futures.get(file_id) is future:
+                    del self._futures[file_id]
+
+    def discard(self, file_id: int, future: Future):
+        """
+        Forget the file registered by a message once its delivery is settled (acked, retried or requeued), when
+        the message did not read it.
+        """
+        with self._condition:
+            if self._futures.get(file_id) is future:
+                del self._futures[file_id]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                deadline = time.monotonic() + self.window
+                self._condition.wait_for(lambda: len(self._pending) >= self.max_size,
+                                         timeout=max(0.0, deadline - time.monotonic()))
+                batch = self._pending[:self.max_size]
+                self._pending = self._pending[self.max_size:]
+            self._load([file_id for file_id, _ in batch], [future for _, future in batch])
+
+    def _load(self, batch: list[int], futures: list[Future]):
+        try:
+            files = self.database_service.get_files_by_ids(batch)
+        except Exception as e:
+            logger.error(f"Error loading a batch of {len(batch)} files: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        for file_id, future in zip(batch, futures):
+            future.set_result(files.get(file_id))
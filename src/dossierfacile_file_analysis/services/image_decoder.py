@@ -0,0 +1,110 @@
+import math
+import os
+import struct
+from typing import Callable
+
+import cv2
+import numpy as np
+
+# Modes de décodage réduit : la libjpeg réduit l'image pendant la décompression (IDCT partielle)
+REDUCED_GRAYSCALE_MODES = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                           8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+# Marqueurs SOF (Start Of Frame) portant les dimensions d'un JPEG, hors DHT (C4), JPG (C8) et DAC (CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ImageDecoder:
+    """
+    Decodes the images to analyse in grayscale with at most IMAGE_ANALYSIS_MAX_MEGAPIXELS pixels.
+    The dimensions are read from the JPEG or PNG header first, so that large photos are decoded with a reduced mode
+    (1/2, 1/4 or 1/8 of the size, computed by libjpeg while decompressing) instead of at full size, then resized
+    with INTER_AREA to the target when still larger. A reduced mode giving between half the target and the target
+    is preferred to a resize.
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("IMAGE_REDUCED_DECODE_ENABLED", "false").lower() == "true"
+
+    def __init__(self):
+        self.max_pixels = float(os.getenv("IMAGE_ANALYSIS_MAX_MEGAPIXELS") or 4) * 1_000_000
+
+    def decode_gray(self, image) -> tuple[np.ndarray | None, float]:
+        """
+        Decode a file path or an encoded buffer. Return the grayscale array and its scale (analysed size / original
+        size, 1 when the image is decoded at full size).
+        """
+        size = self.read_image_size(image)
+        reduction = 1
+        if size is not None:
+            ratio = math.sqrt(size[0] * size[1] / self.max_pixels)
+            # Un facteur un peu plus fort évite le redimensionnement, tant qu'il garde la moitié des pixels visés
+            reduction = min((factor for factor in REDUCED_GRAYSCALE_MODES if ratio <= factor <= ratio * math.sqrt(2)),
+                            default=max((factor for factor in REDUCED_GRAYSCALE_MODES if factor <= ratio), default=1))
+        gray = self._decode(image, REDUCED_GRAYSCALE_MODES.get(reduction, cv2.IMREAD_GRAYSCALE))
+        if gray is None:
+            return None, 1.0
+        original_pixels = size[0] * size[1] if size is not None else gray.size
+        if gray.size > self.max_pixels:
+            ratio = math.sqrt(self.max_pixels / gray.size)
+            gray = cv2.resize(gray, (max(1, int(gray.shape[1] * ratio)), max(1, int(gray.shape[0] * ratio))),
+                              interpolation=cv2.INTER_AREA)
+        # Rapport des côtés, indépendant d'une rotation EXIF appliquée au décodage
+        return gray, min(1.0, math.sqrt(gray.size / original_pixels))
+
+    @staticmethod
+    def _decode(image, flags: int) -> np.ndarray | None:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+        return cv2.imread(image, flags)
+
+    @staticmethod
+    def read_image_size(image) -> tuple[int, int] | None:
+        """
+        Return the (width, height) of a JPEG or PNG image read from its header, None for other formats.
+        """
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                with memoryview(image) as view:
+                    # Seuls les octets lus de l'en-tête sont copiés, pas le fichier
+                    return ImageDecoder._read_header_size(lambda offset, size: bytes(view[offset:offset + size]))
+            with open(image, "rb") as image_file:
+                def _read(offset: int, size: int) -> bytes:
+                    image_file.seek(offset)
+                    return image_file.read(size)
+
+                return ImageDecoder._read_header_size(_read)
+        except (OSError, struct.error):
+            return None
+
+    @staticmethod
+    def _read_header_size(read: Callable[[int, int], bytes]) -> tuple[int, int] | None:
+        head = read(0, 24)
+        if head.startswith(_PNG_SIGNATURE):
+            # Le premier chunk d'un PNG est IHDR : largeur et hauteur sur 4 octets
+            return struct.unpack(">II", head[16:24]) if head[12:16] == b"IHDR" else None
+        if not head.startswith(b"\xff\xd8"):
+            return None
+        # Parcours des segments JPEG jusqu'au SOF, sans lire les données des segments (EXIF, vignettes)
+        offset = 2
+        while True:
+            marker = read(offset, 2)
+            offset += 2
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            while marker[1] == 0xFF:
+                # Octets de remplissage entre deux segments
+                next_byte = read(offset, 1)
+                offset += 1
+                if not next_byte:
+                    return None
+                marker = marker[1:] + next_byte
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                continue
+            # La longueur du segment compte ses deux octets
+            length, = struct.unpack(">H", read(offset, 2))
+            if marker[1] in _JPEG_SOF_MARKERS:
+                _, height, width = struct.unpack(">BHH", read(offset + 2, 5))
+                return (width, height) if width and height else None
+            offset += length
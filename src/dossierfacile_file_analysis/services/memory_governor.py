@@ -0,0 +1,163 @@
+import itertools
+import os
+import threading
+from typing import Callable
+
+import psutil
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+_MB = 1024 * 1024
+
+
+class MemoryGovernor:
+    """
+    Keeps the RSS of the consumer and of its worker processes under control instead of relying on OOM kills.
+    Every MEMORY_SAMPLE_INTERVAL_S seconds it samples the RSS:
+    - above MEMORY_HIGH_WATERMARK_MB, on_pause is called (the consumer stops receiving messages, the messages in
+      flight go on), and on_resume is called once the RSS is back under MEMORY_LOW_WATERMARK_MB;
+    - when a worker grew by more than WORKER_MAX_RSS_GROWTH_MB since it started, or when WORKER_MAX_MESSAGES
+      messages were processed (thread and pipeline modes, the worker pool applies it in process mode),
+      on_recycle is called once with the reason ("rss_growth" or "messages").
+    The peak RSS seen while each message was in flight is returned by record_done.
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("MEMORY_GOVERNOR_ENABLED", "false").lower() == "true"
+
+    def __init__(self, on_pause: Callable[[], None] | None = None, on_resume: Callable[[], None] | None = None,
+                 on_recycle: Callable[[str], None] | None = None, worker_processes: bool = False):
+        self.high_watermark = int(os.getenv("MEMORY_HIGH_WATERMARK_MB") or 0) * _MB
+        self.low_watermark = int(os.getenv("MEMORY_LOW_WATERMARK_MB") or 0) * _MB or int(self.high_watermark * 0.8)
+        self.sample_interval = float(os.getenv("MEMORY_SAMPLE_INTERVAL_S") or 1)
+        self.max_messages = int(os.getenv("WORKER_MAX_MESSAGES") or 0)
+        self.max_rss_growth = int(os.getenv("WORKER_MAX_RSS_GROWTH_MB") or 0) * _MB
+        # En mode process, la croissance est mesurée par processus worker, sinon sur le consommateur
+        self.worker_processes = worker_processes
+        self.on_pause = on_pause
+        self.on_resume = on_resume
+        self.on_recycle = on_recycle
+
+        self.paused = False
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._tokens = itertools.count()
+        # Pic de RSS observé pendant le traitement de chaque message en cours
+        self._peaks: dict[int, int] = {}
+        self._rss = 0
+        self._baselines: dict[int, int] = {}
+        self._messages = 0
+        self._recycling = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="memory-governor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def record_start(self) -> int:
+        """
+        Start following the peak RSS of a message. Return the token to give to record_done.
+        """
+        token = next(self._tokens)
+        with self._lock:
+            self._peaks[token] = self._rss
+        return token
+
+    def record_done(self, token: int) -> int:
+        """
+        Stop following a message and return the peak RSS (bytes) of the process and its workers while it was in
+        flight.
+        """
+        with self._lock:
+            self._messages += 1
+            return self._peaks.pop(token, self._rss)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._peaks)
+
+    def reset_workers(self):
+        """
+        Forget the workers after they were replaced, so that a new recycling can be requested.
+        """
+        with self._lock:
+            self._baselines.clear()
+            self._recycling = False
+
+    def _run(self):
+        while not self._stop.wait(self.sample_interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Memory governor sampling failed: {e}")
+
+    def _measure(self) -> tuple[int, dict[int, int]]:
+        own_rss = self._process.memory_info().rss
+        if not self.worker_processes:
+            return own_rss, {self._process.pid: own_rss}
+        workers = {}
+        for child in self._process.children(recursive=True):
+            try:
+                workers[child.pid] = child.memory_info().rss
+            except psutil.Error:
+                pass
+        return own_rss + sum(workers.values()), workers
+
+    def sample(self) -> dict:
+        rss, worker_rss = self._measure()
+        return self.decide(rss, worker_rss)
+
+    def decide(self, rss: int, worker_rss: dict[int, int]) -> dict:
+        """
+        Apply the watermarks and the recycling limits to the given measures (total RSS and RSS of each worker,
+        in bytes) and return the new state.
+        """
+        action, recycle_reason, recycle_detail = None, None, None
+        with self._lock:
+            self._rss = rss
+            for token, peak in self._peaks.items():
+                self._peaks[token] = max(peak, rss)
+
+            if self.high_watermark and not self.paused and rss > self.high_watermark:
+                self.paused, action = True, "pause"
+            elif self.paused and rss < self.low_watermark:
+                self.paused, action = False, "resume"
+
+            growth = 0
+            for pid, worker in worker_rss.items():
+                growth = max(growth, worker - self._baselines.setdefault(pid, worker))
+            if not self._recycling:
+                if self.max_rss_growth and growth > self.max_rss_growth:
+                    recycle_reason, recycle_detail = "rss_growth", f"a worker grew by {growth // _MB} MB"
+                elif self.max_messages and not self.worker_processes and self._messages >= self.max_messages:
+                    recycle_reason, recycle_detail = "messages", f"{self._messages} messages processed"
+                self._recycling = recycle_reason is not None
+
+            state = {
+                "rssMb": round(rss / _MB, 1),
+                "highWatermarkMb": self.high_watermark // _MB,
+                "lowWatermarkMb": self.low_watermark // _MB,
+                "paused": self.paused,
+                "maxWorkerGrowthMb": round(growth / _MB, 1),
+                "messages": self._messages,
+                "recycling": self._recycling
+            }
+
+        if action == "pause":
+            logger.warning(f"RSS {state['rssMb']} MB above {state['highWatermarkMb']} MB, pausing consumption")
+            if self.on_pause is not None:
+                self.on_pause()
+        elif action == "resume":
+            logger.info(f"RSS {state['rssMb']} MB below {state['lowWatermarkMb']} MB, resuming consumption")
+            if self.on_resume is not None:
+                self.on_resume()
+        if recycle_reason is not None:
+            logger.warning(f"Recycling workers: {recycle_detail}")
+            if self.on_recycle is not None:
+                self.on_recycle(recycle_reason)
+        return state
@@ -0,0 +1,260 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: dict | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs += [f'{name}="{_escape(value)}"' for name, value in extra.items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def drain(self) -> dict:
+        """Return the values recorded so far and reset them."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        """Add values drained from the same metric in another process."""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (),
+                 function: Callable[[], float] | None = None):
+        super().__init__(name, documentation, label_names)
+        # Valeur calculée au moment de l'export
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        if self.function is not None:
+            return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}",
+                    f"{self.name} {self.function()}"]
+        return super().render()
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Compteurs par borne, somme, nombre d'observations
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                series = self._values.get(key)
+                if series is None:
+                    series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+                series[0] = [current + added for current, added in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': bound})} "
+                                 f"{bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics of the service, exported in the Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics
+    when METRICS_ENABLED is true.
+    In process mode, the tasks run in the worker processes: each worker drains the metrics it recorded for a
+    message and returns them with its outcome, and the consumer merges them into its own registry.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self._metrics: list[_Metric] = []
+            self._server = None
+            self.task_duration = self.register(Histogram(
+                "blurry_task_duration_seconds", "Duration of a task of the analysis", ("task", "content_type")))
+            self.task_cpu = self.register(Counter(
+                "blurry_task_cpu_seconds_total", "CPU time of the thread running a task", ("task", "content_type")))
+            self.tasks = self.register(Counter(
+                "blurry_tasks_total", "Tasks by outcome (success, failure, skipped)", ("task", "content_type",
+                                                                                        "outcome")))
+            self.message_duration = self.register(Histogram(
+                "blurry_message_duration_seconds", "Duration of the analysis of a message", ("content_type",
+                                                                                             "outcome")))
+            self.messages = self.register(Counter(
+                "blurry_messages_total", "Analysed messages by outcome", ("content_type", "outcome")))
+            self.pages = self.register(Counter(
+                "blurry_pages_analysed_total", "Analysed pages", ("content_type",)))
+            self.downloaded_bytes = self.register(Counter(
+                "blurry_downloaded_bytes_total", "Size of the downloaded (decrypted) files", ("content_type",
+                                                                                              "provider")))
+            self.queue_lag = self.register(Gauge(
+                "blurry_queue_lag_seconds", "Time between the publication and the delivery of the last message"))
+            self.messages_in_flight = self.register(Gauge(
+                "blurry_messages_in_flight", "Messages delivered to this host and not processed yet"))
+            self.workers = self.register(Gauge(
+                "blurry_workers", "Messages this host can process at once"))
+            self.worker_utilisation = self.register(Gauge(
+                "blurry_worker_utilisation", "Ratio of busy workers (messages in flight / workers, at most 1)"))
+            self.message_peak_rss = self.register(Histogram(
+                "blurry_message_peak_rss_bytes", "Peak RSS of the consumer and its workers while a message was in "
+                                                 "flight", buckets=tuple(2 ** n * 1024 * 1024 for n in range(6, 14))))
+            self.consumption_paused = self.register(Gauge(
+                "blurry_consumption_paused", "1 while the consumption is paused by the memory governor"))
+            self.worker_recycles = self.register(Counter(
+                "blurry_worker_recycles_total", "Worker recycling requested by the memory governor", ("reason",)))
+            self._initialized = True
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def drain(self) -> dict:
+        """
+        Return the values recorded by this process since the last drain, by metric name, and reset them.
+        """
+        return {metric.name: values for metric in self._metrics if (values := metric.drain())}
+
+    def merge(self, observations: dict):
+        """
+        Add the values drained from the registry of a worker process.
+        """
+        metrics = {metric.name: metric for metric in self._metrics}
+        for name, values in observations.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start_server(self):
+        """
+        Serve the metrics from a daemon thread.
+        """
+        if self._server is not None:
+            return
+        host = os.getenv("METRICS_HOST") or "0.0.0.0"
+        port = int(os.getenv("METRICS_PORT") or "9100")
+        registry = self
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{self._server.server_address[1]}/metrics")
+
+    def stop_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
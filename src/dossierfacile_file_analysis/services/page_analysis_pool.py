@@ -0,0 +1,57 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+
+class PageAnalysisPool:
+    """
+    Pool shared by every message of the process, used to analyse the pages of a document concurrently.
+    The number of pages of a single document in flight is bounded, so that a long PDF can not starve the others.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            self.max_workers = int(os.getenv("PAGE_ANALYSIS_MAX_WORKERS") or 1)
+            self.max_pages_in_flight = int(os.getenv("PAGE_ANALYSIS_MAX_PAGES_IN_FLIGHT") or self.max_workers)
+            # Avec un seul worker, les pages sont analysées dans le thread appelant
+            self.executor = None
+            if self.max_workers > 1:
+                logger.info(f"Initializing PageAnalysisPool with {self.max_workers} workers")
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix="page-analysis")
+            self._initialized = True
+
+    def imap(self, function, pages):
+        """
+        Lazily apply function to every page and yield the results in page order.
+        Pages are pulled from the iterable only when a slot is free, so at most max_pages_in_flight pages of this
+        document are being analysed at once. Closing the generator cancels the pages not started yet.
+        """
+        if self.executor is None:
+            for page in pages:
+                yield function(page)
+            return
+
+        pending = deque()
+        try:
+            for page in pages:
+                pending.append(self.executor.submit(function, page))
+                if len(pending) >= self.max_pages_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,100 @@
+import os
+import threading
+
+import numpy as np
+from pytesseract import image_to_data
+
+from dossierfacile_file_analysis.custom_logging.logging_config import logger
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+class TesseractEngine:
+    """
+    Readability backend computing the average Tesseract word confidence of an image.
+    With tesserocr installed, each worker thread keeps one initialised Tesseract API (language model loaded once)
+    and gives it the pixel buffer directly. Otherwise, or if the API can not be initialised, it falls back to
+    pytesseract, which starts a tesseract process for every image.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, "_initialized"):
+            # "auto" (tesserocr si disponible), "tesserocr" ou "pytesseract"
+            self.backend = os.getenv("OCR_BACKEND") or "auto"
+            self.language = os.getenv("OCR_LANGUAGE") or "eng"
+            self.tessdata_path = os.getenv("TESSDATA_PREFIX")
+            self.use_tesserocr = self.backend != "pytesseract" and tesserocr is not None
+            if self.backend == "tesserocr" and tesserocr is None:
+                logger.warning("OCR_BACKEND is tesserocr but tesserocr is not installed, using pytesseract")
+            self._local = threading.local()
+            self._initialized = True
+
+    def average_confidence(self, gray) -> float:
+        if self.use_tesserocr:
+            api = self._get_api()
+            if api is not None:
+                return self._average_confidence_tesserocr(api, gray)
+        return self._average_confidence_pytesseract(gray)
+
+    def _get_api(self):
+        """
+        Return the Tesseract API of the current thread, created on first use.
+        """
+        api = getattr(self._local, "api", None)
+        if api is None:
+            try:
+                if self.tessdata_path:
+                    api = tesserocr.PyTessBaseAPI(path=self.tessdata_path, lang=self.language)
+                else:
+                    api = tesserocr.PyTessBaseAPI(lang=self.language)
+            except Exception as e:
+                logger.error(f"Failed to initialise Tesseract API, falling back to pytesseract: {e}")
+                self.use_tesserocr = False
+                return None
+            self._local.api = api
+        return api
+
+    @staticmethod
+    def _average_confidence_tesserocr(api, gray) -> float:
+        # Sans copie lorsque la page est déjà un tableau uint8 contigu (cas du rendu et du décodage)
+        gray = np.ascontiguousarray(gray, dtype=np.uint8)
+        try:
+            try:
+                api.SetImageBytes(gray.reshape(-1).data, gray.shape[1], gray.shape[0], 1, gray.strides[0])
+            except TypeError:
+                # Liaison n'acceptant que des bytes : copie de la page
+                api.SetImageBytes(gray.tobytes(), gray.shape[1], gray.shape[0], 1, gray.strides[0])
+            api.Recognize()
+            confidences = api.AllWordConfidences()
+        finally:
+            # Libère l'image et les résultats, le modèle de langue reste chargé
+            api.Clear()
+        if not confidences:
+            return 0
+        return sum(confidences) / len(confidences)
+
+    @staticmethod
+    def _average_confidence_pytesseract(gray) -> float:
+        data = None
+        try:
+            data = image_to_data(gray, output_type='dict')
+            confidences = [int(conf) for conf in data['conf'] if conf != '-1']
+            if not confidences:
+                return 0
+            return sum(confidences) / len(confidences)
+        finally:
+            # Libérer les données Tesseract qui peuvent être volumineuses
+            if data is not None:
+                del data
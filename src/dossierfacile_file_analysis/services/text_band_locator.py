@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+# Part du maximum de la projection au-dessus de laquelle une ligne appartient à une bande
+DEFAULT_PROJ_THRESHOLD = 0.6
+
+
+class TextBandLocator:
+    """
+    Locates the text bands of a page from the row projection of its text mask (Gaussian adaptive threshold, then
+    morphological opening). Shared by the analysis and by the two-phase PDF rendering, which locates the band on a
+    thumbnail before rendering it.
+    """
+
+    @staticmethod
+    def find_bands(gray, proj_threshold: float = DEFAULT_PROJ_THRESHOLD,
+                   blur_statistics=None) -> tuple[np.ndarray | None, np.ndarray | None]:
+        """
+        First and last rows of the continuous text bands (rows closer than 6 pixels are merged), None when no row
+        is selected. The projection is computed by blur_statistics (BlurStatisticsEngine) when given.
+        """
+        bw = None
+        kernel = None
+        proj = None
+
+        try:
+            if blur_statistics is not None:
+                proj = blur_statistics.row_projection(gray, block_size=25, c=10, kernel_size=(5, 3))
+            else:
+                bw = cv2.adaptiveThreshold(
+                    gray, 255,
+                    cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                    cv2.THRESH_BINARY,
+                    blockSize=25, C=10
+                )
+                kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 3))
+                bw = cv2.morphologyEx(bw, cv2.MORPH_OPEN, kernel)
+                proj = np.sum(bw // 255, axis=1)
+            th = proj.max() * proj_threshold
+            rows = np.flatnonzero(proj > th)
+
+            if rows.size == 0:
+                return None, None
+
+            # Une bande se termine là où l'écart avec la ligne sélectionnée suivante dépasse 5 lignes
+            breaks = np.flatnonzero(np.diff(rows) > 5)
+            starts = rows[np.concatenate(([0], breaks + 1))]
+            ends = rows[np.concatenate((breaks, [rows.size - 1]))]
+            return starts, ends
+
+        finally:
+            # Libération explicite de toutes les matrices temporaires
+            if bw is not None:
+                del bw
+            if kernel is not None:
+                del kernel
+            if proj is not None:
+                del proj
+
+    @staticmethod
+    def tallest_band(starts: np.ndarray, ends: np.ndarray, height: int, margin: int) -> tuple[int, int]:
+        """
+        Rows of the tallest band (the first one in case of a tie), widened by margin rows within the page.
+        """
+        best = int(np.argmax(ends - starts))
+        return max(0, int(starts[best]) - margin), min(height, int(ends[best]) + margin)
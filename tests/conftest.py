@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def new_singleton():
+    """
+    Build a new instance of a singleton service, reading the environment patched by the test, and forget it after
+    the test.
+    """
+    singleton_classes = []
+
+    def _create(singleton_class):
+        singleton_class._instance = None
+        singleton_classes.append(singleton_class)
+        return singleton_class()
+
+    yield _create
+    for singleton_class in singleton_classes:
+        singleton_class._instance = None
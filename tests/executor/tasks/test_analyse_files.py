@@ -1,5 +1,7 @@
+import os
 from unittest.mock import patch, MagicMock
 
+import cv2
 import numpy as np
 import pytest
 
@@ -7,8 +9,10 @@ from dossierfacile_file_analysis.executor.tasks.analyse_files import AnalyseFile
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
 from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
 from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.models.decision_stage import DecisionStage
 from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
 from dossierfacile_file_analysis.models.input_analysis_data import InputAnalysisData
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 
 
 @pytest.fixture
@@ -109,3 +113,271 @@ def test_run_pdf_with_mixed_images(analyse_files_task):
     assert mocks["imread"].call_count == 3
     assert context.blurry_result.is_blurry is True
     assert context.blurry_result.laplacian_variance == 100
+
+
+def test_run_pdf_stops_at_first_definitely_blurry_page():
+    # Given
+    with patch.dict(os.environ, {"BLUR_EARLY_EXIT_VARIANCE": "50"}):
+        task = AnalyseFiles()
+    rendered_pages = []
+
+    def pages():
+        for page_number in range(5):
+            rendered_pages.append(page_number)
+            yield f"/tmp/img{page_number}.png"
+
+    results = [
+        BlurryResult(laplacian_variance=400, is_blurry=False, is_blank=False, is_readable=True),
+        BlurryResult(laplacian_variance=-1, is_blurry=False, is_blank=True, is_readable=False),
+        BlurryResult(laplacian_variance=20, is_blurry=True, is_blank=False, is_readable=False),
+    ]
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    downloaded_file = DownloadedFile(file_name="test.pdf", file_path="/tmp/test.pdf", file_type="application/pdf")
+    context.input_analysis_data = InputAnalysisData(downloaded_file=downloaded_file)
+    context.input_analysis_data.pages = pages()
+
+    # When
+    with patch.object(task, '_is_blurry', side_effect=results) as mock_is_blurry:
+        task.run(context)
+
+    # Then
+    assert mock_is_blurry.call_count == 3
+    assert rendered_pages == [0, 1, 2]
+    assert context.blurry_result.is_blurry is True
+    assert context.blurry_result.laplacian_variance == 20
+
+
+def _text_page(height=2000, width=1500):
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for line, y in enumerate(range(200, height - 200, 60)):
+        cv2.putText(page, f"Bulletin de salaire ligne {line} montant 1234,56 EUR", (100, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    return page
+
+
+@pytest.fixture
+def cascade_task():
+    with patch.dict(os.environ, {"OCR_CASCADE_ENABLED": "true"}):
+        task = AnalyseFiles()
+    with patch.object(task.tesseract_engine, 'use_tesserocr', False), \
+            patch('dossierfacile_file_analysis.services.tesseract_engine.image_to_data',
+                  return_value={"conf": ["90", "-1"]}) as mock_image_to_data:
+        yield task, mock_image_to_data
+
+
+@pytest.mark.parametrize("image, expected_stage, expected_blurry", [
+    (_text_page(), DecisionStage.LAPLACIAN_SHARP, False),
+    (cv2.GaussianBlur(_text_page(), (0, 0), 4), DecisionStage.LAPLACIAN_BLURRY, True),
+])
+def test_cascade_decides_without_ocr(cascade_task, image, expected_stage, expected_blurry):
+    task, mock_image_to_data = cascade_task
+
+    result = task._is_blurry(image)
+
+    mock_image_to_data.assert_not_called()
+    assert result.decision_stage == expected_stage
+    assert result.is_blurry is expected_blurry
+    # La lisibilité suit le verdict de la variance
+    assert result.is_readable is not expected_blurry
+
+
+@pytest.mark.parametrize("confidence, expected_readable", [("90", True), ("10", False)])
+def test_cascade_keeps_the_ocr_verdict_of_blank_pages(cascade_task, confidence, expected_readable):
+    task, mock_image_to_data = cascade_task
+    mock_image_to_data.return_value = {"conf": [confidence, "-1"]}
+
+    result = task._is_blurry(np.full((2000, 1500), 250, dtype=np.uint8))
+
+    mock_image_to_data.assert_called_once()
+    assert result.decision_stage == DecisionStage.BLANK
+    assert result.is_blank is True
+    assert result.is_readable is expected_readable
+
+
+def test_cascade_runs_ocr_close_to_threshold(cascade_task):
+    task, mock_image_to_data = cascade_task
+    image = cv2.GaussianBlur(_text_page(), (0, 0), 1.2)
+
+    result = task._is_blurry(image)
+
+    mock_image_to_data.assert_called_once()
+    assert result.decision_stage == DecisionStage.OCR
+    assert result.is_readable is True
+    # La variance est mesurée en pleine résolution comme sans la cascade
+    assert result.laplacian_variance == pytest.approx(
+        task._detect_blur_laplacian(image, True).laplacian_variance)
+
+
+def test_native_text_pages_are_not_analysed_nor_reduced():
+    # Given
+    with patch.dict(os.environ, {"BLUR_EARLY_EXIT_VARIANCE": "50"}):
+        task = AnalyseFiles()
+    native_text = BlurryResult(laplacian_variance=-1, is_blurry=False, is_blank=False, is_readable=True,
+                               decision_stage=DecisionStage.NATIVE_TEXT)
+    scanned = BlurryResult(laplacian_variance=300, is_blurry=False, is_blank=False, is_readable=True)
+
+    # When
+    with patch.object(task, '_detect_blur_laplacian', return_value=scanned) as mock_detect, \
+            patch.object(task, 'is_readable', return_value=True):
+        results = task._analyse_pages([native_text, np.zeros((10, 10), dtype=np.uint8)])
+
+    # Then
+    assert results == [native_text, scanned]
+    mock_detect.assert_called_once()
+    assert AnalyseFiles._reduce_results(results) is scanned
+    assert AnalyseFiles._reduce_results([native_text]) is native_text
+
+
+def test_threshold_is_scaled_for_reduced_photos():
+    # Given
+    with patch.dict(os.environ, {"IMAGE_REDUCED_DECODE_ENABLED": "true", "IMAGE_REDUCED_THRESHOLD_EXPONENT": "2"}):
+        task = AnalyseFiles()
+    reduced = np.zeros((10, 10), dtype=np.uint8)
+
+    # When : photo décodée au quart, variance 1000 sous le seuil de 250 * 4 ** 2
+    with patch.object(task.image_decoder, 'decode_gray', return_value=(reduced, 0.25)), \
+            patch.object(task, 'is_readable', return_value=True), \
+            patch.object(task, '_extract_text_band', return_value=(0, 10)), \
+            patch.object(AnalyseFiles, '_band_laplacian_variance', return_value=1000.0):
+        result = task._is_blurry(b"photo")
+
+    # Then
+    assert task._scaled_threshold(0.25) == 4000
+    assert result.laplacian_variance == 1000.0
+    assert result.is_blurry
+
+
+def test_text_bands_are_segmented_like_the_tallest_band():
+    # Given : lignes sélectionnées 0-3, 20-49 et 60-61 sur une page de 100 lignes
+    task = AnalyseFiles()
+    rows = np.r_[0:4, 20:50, 60:62]
+
+    # When
+    with patch.object(task, '_find_text_bands', return_value=(rows[[0, 4, 34]], rows[[3, 33, 35]])):
+        band = task._extract_text_band(np.zeros((100, 10), dtype=np.uint8))
+        bands, tallest = task._extract_text_bands(np.zeros((100, 10), dtype=np.uint8))
+
+    # Then : la bande de 2 lignes est ignorée, la plus haute est élargie de la marge
+    assert band == (10, 59)
+    assert bands == [(10, 59)]
+    assert tallest == 0
+
+
+def test_multi_band_detects_partially_blurred_pages():
+    # Given : moitié basse de la page floue
+    page = _text_page()
+    page[1000:] = cv2.GaussianBlur(page, (0, 0), 4)[1000:]
+    with patch.dict(os.environ, {"BLUR_MULTI_BAND_ENABLED": "true"}):
+        task = AnalyseFiles()
+
+    # When
+    single_band = AnalyseFiles()._detect_blur_laplacian(page, True)
+    result = task._detect_blur_laplacian(page, True)
+
+    # Then
+    assert single_band.is_blurry is False
+    assert result.is_blurry is True
+    assert result.laplacian_variance == pytest.approx(single_band.laplacian_variance)
+    assert result.worst_band_variance == min(variance for _, _, variance in result.band_variances)
+    assert result.worst_band_variance < 250
+    assert BlurryResult.from_dict(result.to_dict()).band_variances == result.band_variances
+
+
+def test_multi_band_ignores_bands_without_contrast():
+    # Given : marges blanches au-dessus et au-dessous du texte
+    page = np.full((2000, 1500), 255, dtype=np.uint8)
+    page[800:1200] = _text_page()[800:1200]
+    with patch.dict(os.environ, {"BLUR_MULTI_BAND_ENABLED": "true"}):
+        task = AnalyseFiles()
+
+    # When
+    laplacian_var, band_variances, worst_band_variance = task._score_text_bands(page, [(0, 2000)], 0)
+
+    # Then
+    assert all(y1 > 800 and y0 < 1200 for y0, y1, _ in band_variances)
+    assert worst_band_variance > 250
+    assert laplacian_var == pytest.approx(cv2.Laplacian(page, cv2.CV_64F).var())
+
+
+def test_tile_statistics_match_a_per_tile_computation():
+    # Given : 300 x 200 pixels, tuiles de 128 (le reste de 44 lignes rejoint la dernière tuile)
+    image = np.random.default_rng(0).integers(0, 256, (300, 200), dtype=np.uint8)
+    with patch.dict(os.environ, {"BLUR_TILE_SIZE": "128"}):
+        task = AnalyseFiles()
+    laplacian = cv2.Laplacian(image, cv2.CV_64F)
+
+    # When
+    variances, contrasts = task._tile_statistics(image)
+
+    # Then
+    assert variances.shape == (2, 2)
+    for (i, y0, y1) in [(0, 0, 128), (1, 128, 300)]:
+        for (j, x0, x1) in [(0, 0, 128), (1, 128, 200)]:
+            assert variances[i, j] == pytest.approx(laplacian[y0:y1, x0:x1].var())
+            assert contrasts[i, j] == pytest.approx(image[y0:y1, x0:x1].std())
+
+
+def test_tiled_sharpness_reports_blurred_tile_fraction():
+    # Given : moitié basse de la page floue
+    page = _text_page()
+    page[1000:] = cv2.GaussianBlur(page, (0, 0), 4)[1000:]
+    with patch.dict(os.environ, {"BLUR_TILED_SHARPNESS_ENABLED": "true"}):
+        task = AnalyseFiles()
+    with patch.dict(os.environ, {"BLUR_TILED_SHARPNESS_ENABLED": "true", "BLUR_MAX_BLURRED_TILE_FRACTION": "0.3"}):
+        strict_task = AnalyseFiles()
+
+    # When
+    with patch.object(AnalyseFiles, 'is_readable', return_value=True):
+        result = task._is_blurry(page)
+        strict_result = strict_task._is_blurry(page)
+
+    # Then
+    assert 0.3 < result.blurred_tile_fraction < 0.7
+    assert result.is_blurry is False
+    assert result.to_dict()["blurredTileFraction"] == result.blurred_tile_fraction
+    assert strict_result.is_blurry is True
+
+
+def test_rendered_bands_use_the_mean_gray_level_of_the_page():
+    # Given : bande de texte claire (moyenne au-dessus du seuil de page blanche) d'une page qui ne l'est pas
+    band = np.full((200, 1500), 255, dtype=np.uint8)
+    cv2.putText(band, "DossierFacile", (100, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    task = AnalyseFiles()
+
+    # When
+    with patch.object(task, 'is_readable', return_value=True):
+        result = task._is_blurry(RenderedBand(band, page_mean_gray=230))
+        blank_result = task._is_blurry(RenderedBand(band, page_mean_gray=250))
+
+    # Then
+    assert np.mean(band) > task.mean_gray_threshold
+    assert result.is_blank is False
+    assert result.laplacian_variance > 0
+    assert blank_result.is_blank is True
+
+
+def _sparse_text_page(paragraph_end: int, line_spacing: int) -> np.ndarray:
+    page = np.full((2000, 1500), 225, dtype=np.uint8)
+    for line, y in enumerate(range(200, paragraph_end, line_spacing)):
+        cv2.putText(page, f"Bulletin de salaire ligne {line} montant 1234,56 EUR", (100, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    return page
+
+
+@pytest.mark.parametrize("page", [
+    # Lignes nettes espacées de 300 pixels
+    _sparse_text_page(1800, 300),
+    # Paragraphe suivi d'une signature : la bande de la signature contient peu d'encre
+    cv2.putText(_sparse_text_page(900, 40), "Signature", (900, 1400), cv2.FONT_HERSHEY_SIMPLEX, 0.6, 0, 2),
+])
+def test_multi_band_keeps_sharp_sparse_text_pages_sharp(page):
+    # Given
+    with patch.dict(os.environ, {"BLUR_MULTI_BAND_ENABLED": "true"}):
+        task = AnalyseFiles()
+
+    # When
+    result = task._detect_blur_laplacian(page, True)
+
+    # Then
+    assert result.is_blurry is False
+    assert result.worst_band_variance > 250
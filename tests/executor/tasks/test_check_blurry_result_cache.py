@@ -0,0 +1,58 @@
+import hashlib
+from unittest.mock import MagicMock
+
+import pytest
+
+from dossierfacile_file_analysis.executor.tasks.analyse_files import AnalyseFiles
+from dossierfacile_file_analysis.executor.tasks.check_blurry_result_cache import CheckBlurryResultCache
+from dossierfacile_file_analysis.executor.tasks.prepare_data_for_analysis import PrepareDataForAnalysis
+from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
+
+
+@pytest.fixture
+def check_cache_task():
+    task = CheckBlurryResultCache()
+    task.blurry_result_cache = MagicMock(enabled=True)
+    yield task, task.blurry_result_cache
+
+
+def test_hit_skips_preparation_and_analysis(check_cache_task, tmp_path):
+    # Given
+    task, mock_cache = check_cache_task
+    cached_result = BlurryResult(laplacian_variance=300, is_blurry=False, is_blank=False, is_readable=True)
+    mock_cache.get.return_value = cached_result
+    (tmp_path / "file.pdf").write_bytes(b"%PDF-1.7 content")
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    context.file_dto = MagicMock()
+    context.downloaded_file = DownloadedFile(file_name="file.pdf", file_path=str(tmp_path / "file.pdf"),
+                                             file_type="application/pdf")
+
+    # When
+    task.run(context)
+
+    # Then
+    mock_cache.get.assert_called_once_with(hashlib.sha256(b"%PDF-1.7 content").hexdigest())
+    assert context.blurry_result == cached_result
+    assert context.cache_hit is True
+    assert not PrepareDataForAnalysis().has_to_apply(context)
+    assert not AnalyseFiles().has_to_apply(context)
+
+
+def test_miss_keeps_the_content_hash(check_cache_task):
+    # Given
+    task, mock_cache = check_cache_task
+    mock_cache.get.return_value = None
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    context.downloaded_file = DownloadedFile(file_name="file.pdf", file_path=None, file_type="application/pdf",
+                                             file_content=memoryview(b"content"))
+
+    # When
+    task.run(context)
+
+    # Then
+    assert context.content_hash == hashlib.sha256(b"content").hexdigest()
+    assert context.blurry_result is None
+    assert context.cache_hit is False
@@ -1,14 +1,19 @@
 import os
 from unittest.mock import patch, MagicMock
 
+import cv2
+import numpy as np
+import pymupdf
 import pytest
 
 from dossierfacile_file_analysis.exceptions.invalid_mime_type import InvalidMimeTypeException
 from dossierfacile_file_analysis.executor.tasks.prepare_data_for_analysis import PrepareDataForAnalysis
 from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
 from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
+from dossierfacile_file_analysis.models.decision_stage import DecisionStage
 from dossierfacile_file_analysis.models.downloaded_file import DownloadedFile
 from dossierfacile_file_analysis.models.input_analysis_data import InputAnalysisData
+from dossierfacile_file_analysis.models.rendered_band import RenderedBand
 
 
 @pytest.fixture
@@ -88,3 +93,311 @@ def test_run_other_file_type(prepare_data_task):
     mock_pymupdf_open.assert_not_called()
     assert isinstance(context.input_analysis_data, InputAnalysisData)
     assert context.input_analysis_data.list_of_images == []
+
+
+def test_run_pdf_conversion_in_memory():
+    # Given
+    document = pymupdf.open()
+    page = document.new_page(width=200, height=100)
+    page.insert_text((20, 50), "DossierFacile")
+    pdf_content = document.tobytes()
+    document.close()
+
+    with patch.dict(os.environ, {"LOCAL_FILE_PATH": "/tmp"}):
+        task = PrepareDataForAnalysis()
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    context.downloaded_file = DownloadedFile(file_name="test.pdf", file_path=None, file_type="application/pdf",
+                                             file_content=pdf_content)
+
+    # When
+    with patch('pymupdf.Pixmap.save') as mock_save:
+        task.run(context)
+
+    # Then
+    mock_save.assert_not_called()
+    images = context.input_analysis_data.list_of_images
+    assert len(images) == 1
+    assert isinstance(images[0], np.ndarray)
+    assert images[0].shape == (200, 400)
+    assert images[0].dtype == np.uint8
+    assert images[0].min() < 128 < images[0].max()
+
+
+def test_run_pdf_streaming_renders_pages_lazily():
+    # Given
+    document = pymupdf.open()
+    for page_number in range(3):
+        document.new_page(width=200, height=100).insert_text((20, 50), f"Page {page_number}")
+    pdf_content = document.tobytes()
+    document.close()
+
+    with patch.dict(os.environ, {"LOCAL_FILE_PATH": "/tmp", "PDF_PAGE_STREAMING": "true"}):
+        task = PrepareDataForAnalysis()
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    context.downloaded_file = DownloadedFile(file_name="test.pdf", file_path=None, file_type="application/pdf",
+                                             file_content=pdf_content)
+
+    # When
+    with patch.object(PrepareDataForAnalysis, '_pixmap_to_gray', wraps=task._pixmap_to_gray) as mock_to_gray:
+        task.run(context)
+        # Then : aucune page n'est rendue avant d'être demandée
+        mock_to_gray.assert_not_called()
+        pages = context.input_analysis_data.iter_pages()
+        first_page = next(pages)
+        assert mock_to_gray.call_count == 1
+        pages.close()
+
+    assert first_page.shape == (200, 400)
+    assert context.input_analysis_data.list_of_images == []
+
+
+def _scanned_pdf(image_dpi: int) -> bytes:
+    # Page A5 (420 x 595 points) couverte par une image "scannée" à la résolution demandée
+    width, height = 420 * image_dpi // 72, 595 * image_dpi // 72
+    scan = pymupdf.Pixmap(pymupdf.csGRAY, pymupdf.IRect(0, 0, width, height), False)
+    scan.clear_with(200)
+    document = pymupdf.open()
+    page = document.new_page(width=420, height=595)
+    page.insert_image(page.rect, pixmap=scan)
+    page.insert_text((20, 50), "DossierFacile")
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+@pytest.mark.parametrize("image_dpi, expected_dpi", [(300, 200), (100, 100), (30, 72)])
+def test_adaptive_grayscale_rendering_uses_the_native_resolution(image_dpi, expected_dpi):
+    # Given
+    with patch.dict(os.environ, {"PDF_RENDER_GRAYSCALE": "true", "PDF_RENDER_ADAPTIVE_DPI": "true",
+                                 "PDF_RENDER_MIN_DPI": "72", "PDF_RENDER_MAX_DPI": "200"}):
+        task = PrepareDataForAnalysis()
+    downloaded_file = DownloadedFile(file_name="scan.pdf", file_path=None, file_type="application/pdf",
+                                     file_content=_scanned_pdf(image_dpi))
+
+    # When
+    with patch('pymupdf.Page.get_pixmap', autospec=True, side_effect=pymupdf.Page.get_pixmap) as mock_get_pixmap:
+        image, = task._pdf_to_images(downloaded_file)
+
+    # Then
+    assert mock_get_pixmap.call_args.kwargs["colorspace"] == pymupdf.csGRAY
+    assert image.shape == pytest.approx((595 * expected_dpi / 72, 420 * expected_dpi / 72), abs=1)
+
+
+def test_color_pages_are_rendered_in_rgb_then_converted():
+    # Given
+    scan = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 400, 200), False)
+    scan.clear_with(120)
+    document = pymupdf.open()
+    page = document.new_page(width=200, height=100)
+    page.insert_image(page.rect, pixmap=scan)
+    pdf_content = document.tobytes()
+    document.close()
+    with patch.dict(os.environ, {"PDF_RENDER_GRAYSCALE": "true"}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    with patch('pymupdf.Page.get_pixmap', autospec=True, side_effect=pymupdf.Page.get_pixmap) as mock_get_pixmap:
+        image, = task._pdf_to_images(DownloadedFile(file_name="test.pdf", file_path=None,
+                                                    file_type="application/pdf", file_content=pdf_content))
+
+    # Then
+    assert mock_get_pixmap.call_args.kwargs["colorspace"] == pymupdf.csRGB
+    assert image.shape == (200, 400)
+    assert image.ndim == 2
+
+
+def test_adaptive_rendering_without_images_uses_the_default_resolution():
+    # Given
+    document = pymupdf.open()
+    document.new_page(width=200, height=100).insert_text((20, 50), "DossierFacile")
+    pdf_content = document.tobytes()
+    document.close()
+    with patch.dict(os.environ, {"PDF_RENDER_ADAPTIVE_DPI": "true", "PDF_RENDER_DEFAULT_DPI": "",
+                                 "PDF_RENDER_MAX_DPI": ""}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    image, = task._pdf_to_images(DownloadedFile(file_name="test.pdf", file_path=None,
+                                                file_type="application/pdf", file_content=pdf_content))
+
+    # Then
+    assert image.shape == (200, 400)
+
+
+def test_adaptive_rendering_ignores_small_images():
+    # Given : page de texte A5 avec un petit logo basse résolution (40 x 40 pixels sur 40 x 40 points, 72 dpi)
+    logo = pymupdf.Pixmap(pymupdf.csGRAY, pymupdf.IRect(0, 0, 40, 40), False)
+    logo.clear_with(100)
+    document = pymupdf.open()
+    page = document.new_page(width=420, height=595)
+    page.insert_image(pymupdf.Rect(20, 20, 60, 60), pixmap=logo)
+    page.insert_text((20, 100), "Bulletin de salaire")
+    pdf_content = document.tobytes()
+    document.close()
+    with patch.dict(os.environ, {"PDF_RENDER_ADAPTIVE_DPI": "true", "PDF_RENDER_DEFAULT_DPI": "",
+                                 "PDF_RENDER_MAX_DPI": "", "PDF_RENDER_IMAGE_MIN_COVERAGE": ""}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    image, = task._pdf_to_images(DownloadedFile(file_name="test.pdf", file_path=None,
+                                                file_type="application/pdf", file_content=pdf_content))
+
+    # Then : résolution par défaut, pas celle du logo
+    assert image.shape == (1190, 840)
+
+
+def _jpeg_scan_pdf(add_text: bool = False) -> bytes:
+    # Scan 144 dpi d'une page A5 : 840 x 1190 pixels
+    scan = np.full((1190, 840, 3), 220, dtype=np.uint8)
+    cv2.putText(scan, "DossierFacile", (50, 300), cv2.FONT_HERSHEY_SIMPLEX, 3, (20, 20, 20), 5)
+    document = pymupdf.open()
+    page = document.new_page(width=420, height=595)
+    page.insert_image(page.rect, stream=cv2.imencode(".jpg", scan)[1].tobytes())
+    # Couche texte invisible d'un OCR, ou texte visible ajouté au scan
+    page.insert_text((20, 50), "DossierFacile", render_mode=0 if add_text else 3)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def test_single_scan_pages_are_decoded_without_rendering():
+    # Given
+    with patch.dict(os.environ, {"PDF_EMBEDDED_SCAN_FAST_PATH": "true", "PDF_RENDER_MAX_DPI": ""}):
+        task = PrepareDataForAnalysis()
+    downloaded_file = DownloadedFile(file_name="scan.pdf", file_path="/tmp/scan.pdf", file_type="application/pdf")
+
+    # When
+    with patch('pymupdf.open', return_value=pymupdf.open(stream=_jpeg_scan_pdf(), filetype="pdf")), \
+            patch('pymupdf.Page.get_pixmap') as mock_get_pixmap:
+        image, = task._pdf_to_images(downloaded_file)
+
+    # Then
+    mock_get_pixmap.assert_not_called()
+    assert isinstance(image, np.ndarray)
+    assert image.shape == (1190, 840)
+    assert image.min() < 128 < image.max()
+
+
+def test_scans_above_the_maximum_resolution_are_reduced():
+    # Given
+    with patch.dict(os.environ, {"PDF_EMBEDDED_SCAN_FAST_PATH": "true", "PDF_RENDER_MAX_DPI": "72"}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    image, = task._pdf_to_images(DownloadedFile(file_name="scan.pdf", file_path=None, file_type="application/pdf",
+                                                file_content=_jpeg_scan_pdf()))
+
+    # Then
+    assert image.shape == (595, 420)
+
+
+def test_scans_with_visible_content_are_rendered():
+    # Given
+    with patch.dict(os.environ, {"PDF_EMBEDDED_SCAN_FAST_PATH": "true"}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    with patch.object(PrepareDataForAnalysis, '_pixmap_to_gray', wraps=task._pixmap_to_gray) as mock_to_gray:
+        image, = task._pdf_to_images(DownloadedFile(file_name="scan.pdf", file_path=None,
+                                                    file_type="application/pdf",
+                                                    file_content=_jpeg_scan_pdf(add_text=True)))
+
+    # Then
+    mock_to_gray.assert_called_once()
+    assert image.shape == (1190, 840)
+
+
+def test_born_digital_pages_are_not_rendered():
+    # Given
+    document = pymupdf.open()
+    document.new_page(width=420, height=595).insert_text((20, 50), "Bulletin de salaire - net à payer 2 345,67 EUR "
+                                                                   "avant impôt sur le revenu, période de mars")
+    document.new_page(width=420, height=595).insert_text((20, 50), "Page 2")
+    pdf_content = document.tobytes()
+    document.close()
+    with patch.dict(os.environ, {"PDF_NATIVE_TEXT_FAST_PATH": "true", "PDF_NATIVE_TEXT_MIN_CHARS": ""}):
+        task = PrepareDataForAnalysis()
+
+    # When
+    with patch.object(PrepareDataForAnalysis, '_pixmap_to_gray', wraps=task._pixmap_to_gray) as mock_to_gray:
+        native_page, short_page = task._pdf_to_images(DownloadedFile(file_name="test.pdf", file_path=None,
+                                                                     file_type="application/pdf",
+                                                                     file_content=pdf_content))
+
+    # Then : la page au texte trop court est rendue
+    mock_to_gray.assert_called_once()
+    assert isinstance(short_page, np.ndarray)
+    assert native_page.decision_stage == DecisionStage.NATIVE_TEXT
+    assert native_page.is_readable and not native_page.is_blurry
+
+
+def test_scans_with_an_ocr_text_layer_are_not_native_text():
+    # Given
+    with patch.dict(os.environ, {"PDF_NATIVE_TEXT_FAST_PATH": "true", "PDF_NATIVE_TEXT_MIN_CHARS": "5"}):
+        task = PrepareDataForAnalysis()
+    scan_with_ocr_layer = pymupdf.open(stream=_jpeg_scan_pdf(), filetype="pdf")
+    scan_with_visible_text = pymupdf.open(stream=_jpeg_scan_pdf(add_text=True), filetype="pdf")
+
+    # Then : couche OCR invisible, ou texte visible sur une page couverte par une image
+    assert not task._is_native_text_page(scan_with_ocr_layer[0])
+    assert not task._is_native_text_page(scan_with_visible_text[0])
+
+
+def _payslip_pdf() -> bytes:
+    # Page A5 dont le texte n'occupe que la moitié haute
+    document = pymupdf.open()
+    page = document.new_page(width=420, height=595)
+    for line, y in enumerate(range(60, 300, 16)):
+        page.insert_text((30, y), f"Bulletin de salaire ligne {line} montant 1234,56 EUR net a payer", fontsize=11)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def test_two_phase_rendering_renders_the_text_band_only():
+    # Given
+    with patch.dict(os.environ, {"PDF_TWO_PHASE_RENDER_ENABLED": "true"}):
+        task = PrepareDataForAnalysis()
+    downloaded_file = DownloadedFile(file_name="payslip.pdf", file_path=None, file_type="application/pdf",
+                                     file_content=_payslip_pdf())
+    full_page, = PrepareDataForAnalysis()._pdf_to_images(downloaded_file)
+
+    # When
+    with patch('pymupdf.Page.get_pixmap', autospec=True, side_effect=pymupdf.Page.get_pixmap) as mock_get_pixmap:
+        band, = task._pdf_to_images(downloaded_file)
+
+    # Then : vignette puis bande, à la résolution et sur la largeur de la page entière
+    assert mock_get_pixmap.call_count == 2
+    assert mock_get_pixmap.call_args.kwargs["clip"] is not None
+    assert isinstance(band, RenderedBand)
+    assert band.image.shape[1] == full_page.shape[1]
+    assert band.image.shape[0] < full_page.shape[0]
+    assert band.page_mean_gray == pytest.approx(full_page.mean(), abs=1)
+
+
+def test_two_phase_rendering_applies_to_files_on_disk():
+    # Given
+    with patch.dict(os.environ, {"PDF_TWO_PHASE_RENDER_ENABLED": "true", "LOCAL_FILE_PATH": "/tmp"}):
+        task = PrepareDataForAnalysis()
+    downloaded_file = DownloadedFile(file_name="payslip.pdf", file_path="/tmp/payslip.pdf",
+                                     file_type="application/pdf")
+
+    # When
+    with patch('pymupdf.open', return_value=pymupdf.open(stream=_payslip_pdf(), filetype="pdf")), \
+            patch('pymupdf.Pixmap.save'), \
+            patch('pymupdf.Page.get_pixmap', autospec=True, side_effect=pymupdf.Page.get_pixmap) as mock_get_pixmap:
+        band, = task._pdf_to_images(downloaded_file)
+
+    # Then
+    assert isinstance(band, RenderedBand)
+    assert band.image == "/tmp/payslip.pdf_0.png"
+    assert RenderedBand.file_path(band) == band.image
+    assert mock_get_pixmap.call_args.kwargs["clip"] is not None
+
+
+@pytest.mark.parametrize("mode", ["BLUR_MULTI_BAND_ENABLED", "BLUR_TILED_SHARPNESS_ENABLED"])
+def test_two_phase_rendering_is_disabled_by_whole_page_measures(mode):
+    with patch.dict(os.environ, {"PDF_TWO_PHASE_RENDER_ENABLED": "true", mode: "true"}):
+        task = PrepareDataForAnalysis()
+
+    assert task.two_phase_render is False
@@ -0,0 +1,120 @@
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from dossierfacile_file_analysis.exceptions.invalid_message_body_format import InvalidMessageBodyFormat
+from dossierfacile_file_analysis.executor.blurry_pipeline import BlurryPipeline
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+
+
+class FakeTask:
+    def __init__(self, name: str, run=None):
+        self.name = name
+        self.run = run
+
+
+class FakeExecutor:
+    """
+    Stand-in for BlurryExecutor recording the stages run for its message.
+    """
+    instances = {}
+    behaviours = {}
+
+    def __init__(self, queue_message):
+        self.file_id = queue_message.file_id
+        self.stages_run = []
+        self.cleaned = False
+        self.blurry_execution_context = MagicMock(blurry_result=BlurryResult(300.0, False, False, True))
+        self.fetch_tasks = [FakeTask("fetch")]
+        self.analysis_tasks = [FakeTask("analysis")]
+        self.save_tasks = [FakeTask("save")]
+        FakeExecutor.instances[self.file_id] = self
+
+    def run_tasks(self, tasks):
+        stage = tasks[0].name
+        behaviour = FakeExecutor.behaviours.get((self.file_id, stage))
+        if behaviour:
+            behaviour()
+        self.stages_run.append(stage)
+
+    def log_completion(self):
+        pass
+
+    def record_metrics(self, outcome, duration):
+        self.outcome = outcome
+
+    def clean(self):
+        self.cleaned = True
+
+
+@pytest.fixture
+def pipeline():
+    FakeExecutor.instances = {}
+    FakeExecutor.behaviours = {}
+    with patch.dict(os.environ, {"PIPELINE_FETCH_CONCURRENCY": "2", "PIPELINE_ANALYSIS_CONCURRENCY": "1",
+                                 "PIPELINE_SAVE_CONCURRENCY": "1", "PIPELINE_QUEUE_SIZE": "2"}), \
+            patch('dossierfacile_file_analysis.executor.blurry_pipeline.BlurryExecutor', FakeExecutor), \
+            patch('dossierfacile_file_analysis.executor.blurry_pipeline.BlurryMessageProcessor.'
+                  'save_failed_analysis_if_needed') as mock_save_failed:
+        blurry_pipeline = BlurryPipeline()
+        blurry_pipeline.mock_save_failed = mock_save_failed
+        yield blurry_pipeline
+        blurry_pipeline.shutdown(wait=True)
+
+
+def test_message_runs_every_stage_in_order(pipeline):
+    outcome = pipeline.submit_message(b'{"fileId": 1}', 0).result(timeout=5)
+
+    assert outcome.file_id == 1
+    assert outcome.analysis_status == "COMPLETED"
+    assert FakeExecutor.instances[1].stages_run == ["fetch", "analysis", "save"]
+    assert FakeExecutor.instances[1].cleaned
+
+
+def test_next_message_is_fetched_while_current_one_is_analysed(pipeline):
+    analysis_started = threading.Event()
+    release_analysis = threading.Event()
+    next_fetched = threading.Event()
+
+    def _slow_analysis():
+        analysis_started.set()
+        assert release_analysis.wait(timeout=5)
+
+    FakeExecutor.behaviours[(1, "analysis")] = _slow_analysis
+    FakeExecutor.behaviours[(2, "fetch")] = next_fetched.set
+
+    first = pipeline.submit_message(b'{"fileId": 1}', 0)
+    assert analysis_started.wait(timeout=5)
+    second = pipeline.submit_message(b'{"fileId": 2}', 0)
+
+    # Le téléchargement du message suivant n'attend pas la fin de l'analyse en cours
+    assert next_fetched.wait(timeout=5)
+    release_analysis.set()
+    assert first.result(timeout=5).file_id == 1
+    assert second.result(timeout=5).file_id == 2
+
+
+def test_failed_stage_fails_the_message(pipeline):
+    def _failing_download():
+        raise ConnectionError("download failed")
+
+    FakeExecutor.behaviours[(3, "fetch")] = _failing_download
+
+    future = pipeline.submit_message(b'{"fileId": 3}', 1)
+
+    with pytest.raises(ConnectionError):
+        future.result(timeout=5)
+    assert FakeExecutor.instances[3].stages_run == []
+    assert FakeExecutor.instances[3].cleaned
+    message, exception, retry_count = pipeline.mock_save_failed.call_args[0]
+    assert message.file_id == 3
+    assert retry_count == 1
+
+
+def test_invalid_message_is_rejected(pipeline):
+    future = pipeline.submit_message(b'not json', 0)
+
+    with pytest.raises(InvalidMessageBodyFormat):
+        future.result(timeout=5)
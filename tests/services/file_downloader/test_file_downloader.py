@@ -0,0 +1,83 @@
+import os
+from hashlib import sha256
+from unittest.mock import patch
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from dossierfacile_file_analysis.data.file_dto import FileDto
+from dossierfacile_file_analysis.services.file_downloader.local_file_downloader import LocalFileDownloader
+
+ENCRYPTION_KEY = bytes(range(32))
+
+
+def _encrypt(content: bytes, path: str) -> bytes:
+    # Même format que le backend : AES/GCM avec IV dérivé du chemin et tag en fin de fichier
+    return AESGCM(ENCRYPTION_KEY).encrypt(sha256(path.encode()).digest(), content, None)
+
+
+def _env(tmp_path, in_memory: bool) -> dict:
+    return {"LOCAL_FILE_PATH": f"{tmp_path}/decrypted_", "LOCAL_FILE_PROVIDER_PATH": str(tmp_path),
+            "IN_MEMORY_PIPELINE": str(in_memory).lower(), "DECRYPTION_CHUNK_SIZE": "1000"}
+
+
+def _write_encrypted_file(tmp_path, content: bytes, path: str = "document") -> FileDto:
+    (tmp_path / path).write_bytes(_encrypt(content, path))
+    return FileDto(id=1, path=path, content_type="application/pdf", encryption_key=ENCRYPTION_KEY,
+                   encryption_key_version=2, provider="LOCAL")
+
+
+def test_decrypt_file_streams_chunks_to_disk(new_singleton, tmp_path):
+    # Given
+    content = os.urandom(10_500)  # plusieurs chunks, dont un partiel
+    file_dto = _write_encrypted_file(tmp_path, content)
+
+    with patch.dict(os.environ, _env(tmp_path, in_memory=False)):
+        file_downloader = new_singleton(LocalFileDownloader)
+
+    # When
+    downloaded_file = file_downloader.download_file(file_dto)
+
+    # Then
+    assert downloaded_file.file_path == f"{tmp_path}/decrypted_document.pdf"
+    with open(downloaded_file.file_path, "rb") as decrypted_file:
+        assert decrypted_file.read() == content
+
+
+def test_decrypt_file_into_memory_buffer(new_singleton, tmp_path):
+    # Given
+    content = os.urandom(2_345)
+    file_dto = _write_encrypted_file(tmp_path, content)
+
+    with patch.dict(os.environ, _env(tmp_path, in_memory=True)):
+        file_downloader = new_singleton(LocalFileDownloader)
+
+    # When
+    downloaded_file = file_downloader.download_file(file_dto)
+
+    # Then
+    assert downloaded_file.file_path is None
+    assert bytes(downloaded_file.file_content) == content
+
+
+def test_decrypt_file_rejects_tampered_data_and_removes_output(new_singleton, tmp_path):
+    # Given
+    file_dto = _write_encrypted_file(tmp_path, os.urandom(3_000))
+    encrypted = bytearray((tmp_path / "document").read_bytes())
+    encrypted[10] ^= 0xFF
+    (tmp_path / "document").write_bytes(bytes(encrypted))
+    with patch.dict(os.environ, _env(tmp_path, in_memory=False)):
+        file_downloader = new_singleton(LocalFileDownloader)
+
+    # When / Then
+    with pytest.raises(InvalidTag):
+        file_downloader.download_file(file_dto)
+    assert not os.path.exists(f"{tmp_path}/decrypted_document.pdf")
+
+
+def test_empty_chunk_size_falls_back_to_default(new_singleton):
+    with patch.dict(os.environ, {"DECRYPTION_CHUNK_SIZE": ""}):
+        file_downloader = new_singleton(LocalFileDownloader)
+
+    assert file_downloader.decryption_chunk_size == 1024 * 1024
@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.services.file_downloader.ranged_downloader import RangedDownloader
+
+SSE_C = {"SSECustomerAlgorithm": "AES256", "SSECustomerKey": "a2V5", "SSECustomerKeyMD5": "bWQ1"}
+
+
+class FakeS3Client:
+    def __init__(self, content: bytes, fail_range_start: int | None = None):
+        self.content = content
+        self.fail_range_start = fail_range_start
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def head_object(self, **params):
+        with self._lock:
+            self.calls.append(("head", params))
+        return {"ContentLength": len(self.content), "ETag": '"etag"'}
+
+    def get_object(self, **params):
+        with self._lock:
+            self.calls.append(("get", params))
+        if "Range" not in params:
+            return {"Body": io.BytesIO(self.content)}
+        start, end = (int(value) for value in params["Range"].removeprefix("bytes=").split("-"))
+        if start == self.fail_range_start:
+            raise ConnectionError("connection reset")
+        return {"Body": io.BytesIO(self.content[start:end + 1])}
+
+
+@pytest.fixture
+def ranged_downloader():
+    with patch.dict(os.environ, {"RANGED_DOWNLOAD_THRESHOLD": "1000", "RANGED_DOWNLOAD_PART_SIZE": "300",
+                                 "RANGED_DOWNLOAD_CONCURRENCY": "4"}):
+        RangedDownloader._instance = None
+        downloader = RangedDownloader()
+        yield downloader
+    downloader.executor.shutdown()
+    RangedDownloader._instance = None
+
+
+def test_small_object_is_fetched_with_one_get(ranged_downloader):
+    s3_client = FakeS3Client(os.urandom(800))
+
+    buffer = ranged_downloader.download_to_buffer(s3_client, "bucket", "key", extra_args=SSE_C)
+
+    assert bytes(buffer) == s3_client.content
+    assert [call for call, _ in s3_client.calls] == ["head", "get"]
+    assert "Range" not in s3_client.calls[1][1]
+
+
+def test_large_object_is_fetched_with_ranged_gets(ranged_downloader):
+    s3_client = FakeS3Client(os.urandom(2500))
+
+    buffer = ranged_downloader.download_to_buffer(s3_client, "bucket", "key", extra_args=SSE_C)
+
+    assert bytes(buffer) == s3_client.content
+    gets = [params for call, params in s3_client.calls if call == "get"]
+    assert sorted(params["Range"] for params in gets) == sorted(
+        f"bytes={start}-{min(start + 300, 2500) - 1}" for start in range(0, 2500, 300))
+    # Les en-têtes SSE-C accompagnent chaque requête
+    assert all(params.items() >= SSE_C.items() for _, params in s3_client.calls)
+    assert all(params["IfMatch"] == '"etag"' for params in gets)
+
+
+def test_large_object_is_written_to_file(ranged_downloader, tmp_path):
+    s3_client = FakeS3Client(os.urandom(2500))
+    destination_path = str(tmp_path / "encrypted")
+
+    ranged_downloader.download_to_file(s3_client, "bucket", "key", destination_path)
+
+    with open(destination_path, "rb") as downloaded_file:
+        assert downloaded_file.read() == s3_client.content
+
+
+def test_failed_part_removes_the_file(ranged_downloader, tmp_path):
+    s3_client = FakeS3Client(os.urandom(2500), fail_range_start=900)
+    destination_path = str(tmp_path / "encrypted")
+
+    with pytest.raises(ConnectionError):
+        ranged_downloader.download_to_file(s3_client, "bucket", "key", destination_path)
+
+    assert not os.path.exists(destination_path)
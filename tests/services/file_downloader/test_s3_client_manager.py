@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.services.file_downloader.s3_client_manager import S3ClientManager
+
+
+@pytest.fixture
+def client_manager():
+    with patch.dict(os.environ, {"S3_MAX_POOL_CONNECTIONS": "32"}):
+        S3ClientManager._instance = None
+        yield S3ClientManager()
+    S3ClientManager._instance = None
+
+
+def _get_client(manager: S3ClientManager, endpoint_url: str):
+    return manager.get_client(endpoint_url=endpoint_url, access_key="access", secret_key="secret",
+                              region_name="gra")
+
+
+def test_client_is_shared_by_threads(client_manager):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: _get_client(client_manager, "https://s3.example.org"), range(16)))
+
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].meta.config.max_pool_connections == 32
+    assert clients[0].meta.config.tcp_keepalive
+    stats = client_manager.get_stats()
+    assert stats["clientsCreated"] == 1
+    assert stats["clientsReused"] == 15
+
+
+def test_one_client_per_endpoint(client_manager):
+    s3_client = _get_client(client_manager, "https://s3.example.org")
+    ovh_client = _get_client(client_manager, "https://ovh.example.org")
+
+    assert s3_client is not ovh_client
+    assert client_manager.get_stats()["clients"] == 2
+
+
+def test_requests_are_counted(client_manager):
+    client_manager.stats._on_before_send()
+    client_manager.stats._on_before_send()
+    client_manager.stats._on_response_received()
+
+    stats = client_manager.get_stats()
+    assert stats["requestsSent"] == 2
+    assert stats["requestsInFlight"] == 1
+    assert stats["peakRequestsInFlight"] == 2
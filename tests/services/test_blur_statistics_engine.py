@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+import pytest
+
+from dossierfacile_file_analysis.executor.tasks.analyse_files import AnalyseFiles
+from dossierfacile_file_analysis.services.blur_statistics_engine import BlurStatisticsEngine
+
+
+def _page(seed: int, height: int = 600, width: int = 400) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 230, dtype=np.uint8)
+    for line in range(8):
+        cv2.putText(page, "DossierFacile 2025", (10, 40 + line * 60), cv2.FONT_HERSHEY_SIMPLEX, 1, 20, 2)
+    return np.clip(page + rng.normal(0, 8, page.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_statistics_match_the_reference_implementation(seed):
+    engine = BlurStatisticsEngine()
+    page = _page(seed)
+
+    assert engine.mean(page) == pytest.approx(np.mean(page))
+    assert engine.laplacian_variance(page[100:300]) == pytest.approx(cv2.Laplacian(page[100:300], cv2.CV_64F).var())
+    reference_bw = cv2.morphologyEx(
+        cv2.adaptiveThreshold(page, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, blockSize=25, C=10),
+        cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 3)))
+    np.testing.assert_array_equal(engine.row_projection(page, block_size=25, c=10, kernel_size=(5, 3)),
+                                  np.sum(reference_bw // 255, axis=1))
+
+
+def test_buffers_are_reused_between_pages(new_singleton):
+    engine = new_singleton(BlurStatisticsEngine)
+    engine.laplacian_variance(_page(0, 600, 400))
+    buffer = engine._pool[0]["laplacian"]
+
+    # Page plus petite : même mémoire ; page plus grande : nouveau tampon
+    engine.laplacian_variance(_page(1, 300, 400))
+    assert engine._pool[0]["laplacian"] is buffer
+    engine.laplacian_variance(_page(2, 800, 400))
+    assert engine._pool[0]["laplacian"].size == 800 * 400
+
+
+def test_buffer_pool_is_bounded(new_singleton):
+    engine = new_singleton(BlurStatisticsEngine)
+    engine.max_pooled_buffers = 1
+
+    # Deux calculs simultanés empruntent deux jeux, un seul est conservé
+    with engine._borrow_buffers(), engine._borrow_buffers():
+        assert engine._pool == []
+    assert len(engine._pool) == 1
+    # Les pages plus grandes qu'une page A4 ne sont pas conservées
+    engine.laplacian_variance(np.zeros((2500, 2000), dtype=np.uint8))
+    assert "laplacian" not in engine._pool[0]
+
+
+def test_analysis_results_are_unchanged():
+    reference = AnalyseFiles()
+    fused = AnalyseFiles()
+    fused.blur_statistics = BlurStatisticsEngine()
+
+    for seed in range(3):
+        page = _page(seed)
+        expected = reference._detect_blur_laplacian(page, True)
+        result = fused._detect_blur_laplacian(page, True)
+        assert result.laplacian_variance == pytest.approx(expected.laplacian_variance)
+        assert (result.is_blurry, result.is_blank) == (expected.is_blurry, expected.is_blank)
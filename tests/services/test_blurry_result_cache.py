@@ -0,0 +1,53 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.services.blurry_result_cache import BlurryResultCache
+
+
+@pytest.fixture
+def mock_db_service():
+    with patch('dossierfacile_file_analysis.services.blurry_result_cache.DossierFacileDatabaseService') as mock_db:
+        yield mock_db.return_value
+
+
+def _result(variance: float) -> BlurryResult:
+    return BlurryResult(laplacian_variance=variance, is_blurry=variance < 250, is_blank=False, is_readable=True)
+
+
+def test_lru_evicts_least_recently_used_entry(new_singleton, mock_db_service):
+    with patch.dict(os.environ, {"BLURRY_RESULT_CACHE_ENABLED": "true", "BLURRY_RESULT_CACHE_SIZE": "2"}):
+        blurry_result_cache = new_singleton(BlurryResultCache)
+    blurry_result_cache.put("a", _result(100))
+    blurry_result_cache.put("b", _result(200))
+    blurry_result_cache.get("a")
+    blurry_result_cache.put("c", _result(300))
+
+    assert blurry_result_cache.get("a").laplacian_variance == 100
+    assert blurry_result_cache.get("b") is None
+    assert blurry_result_cache.get("c").laplacian_variance == 300
+    mock_db_service.get_cached_blurry_result.assert_not_called()
+
+
+def test_database_tier_is_read_on_miss_and_promoted(new_singleton, mock_db_service):
+    with patch.dict(os.environ, {"BLURRY_RESULT_CACHE_ENABLED": "true", "BLURRY_RESULT_CACHE_DB_ENABLED": "true",
+                                 "BLURRY_RESULT_CACHE_NAMESPACE": "v2"}):
+        blurry_result_cache = new_singleton(BlurryResultCache)
+    mock_db_service.get_cached_blurry_result.return_value = _result(42).to_dict()
+
+    assert blurry_result_cache.get("hash").laplacian_variance == 42
+    assert blurry_result_cache.get("hash").is_blurry is True
+    mock_db_service.get_cached_blurry_result.assert_called_once_with("v2:hash")
+
+
+def test_database_failure_is_a_miss(new_singleton, mock_db_service):
+    with patch.dict(os.environ, {"BLURRY_RESULT_CACHE_ENABLED": "true", "BLURRY_RESULT_CACHE_DB_ENABLED": "true"}):
+        blurry_result_cache = new_singleton(BlurryResultCache)
+    mock_db_service.get_cached_blurry_result.side_effect = Exception("connection lost")
+    mock_db_service.save_cached_blurry_result.side_effect = Exception("connection lost")
+
+    assert blurry_result_cache.get("hash") is None
+    blurry_result_cache.put("hash", _result(10))
+    assert blurry_result_cache.get("hash").laplacian_variance == 10
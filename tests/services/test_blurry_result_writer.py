@@ -0,0 +1,93 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.models.blurry_analysis_outcome import BlurryAnalysisOutcome
+from dossierfacile_file_analysis.models.blurry_result import BlurryResult
+from dossierfacile_file_analysis.services.blurry_result_writer import BlurryResultWriter
+
+
+@pytest.fixture
+def mock_database_service():
+    with patch('dossierfacile_file_analysis.services.blurry_result_writer.DossierFacileDatabaseService') as mock_class:
+        yield mock_class.return_value
+
+
+def _writer(batch_size: str, flush_interval_ms: str) -> BlurryResultWriter:
+    with patch.dict('os.environ', {"RESULT_WRITER_BATCH_SIZE": batch_size,
+                                   "RESULT_WRITER_FLUSH_INTERVAL_MS": flush_interval_ms}):
+        return BlurryResultWriter()
+
+
+def _outcome(file_id: int) -> BlurryAnalysisOutcome:
+    return BlurryAnalysisOutcome.completed(file_id, BlurryResult(300.0, False, False, True))
+
+
+def test_flushes_when_batch_is_full(mock_database_service):
+    writer = _writer("3", "60000")
+    committed = threading.Semaphore(0)
+    try:
+        for file_id in range(3):
+            writer.submit(_outcome(file_id), on_committed=lambda error: committed.release())
+        for _ in range(3):
+            assert committed.acquire(timeout=5)
+    finally:
+        writer.close()
+
+    mock_database_service.save_blurry_analysis_outcomes.assert_called_once()
+    saved = mock_database_service.save_blurry_analysis_outcomes.call_args[0][0]
+    assert [outcome.file_id for outcome in saved] == [0, 1, 2]
+
+
+def test_flushes_partial_batch_after_interval(mock_database_service):
+    writer = _writer("50", "20")
+    committed = threading.Event()
+    try:
+        writer.submit(_outcome(1), on_committed=lambda error: committed.set())
+        assert committed.wait(timeout=5)
+    finally:
+        writer.close()
+
+    mock_database_service.save_blurry_analysis_outcomes.assert_called_once()
+
+
+def test_reports_database_error_to_every_result(mock_database_service):
+    mock_database_service.save_blurry_analysis_outcomes.side_effect = RuntimeError("database unavailable")
+    writer = _writer("2", "60000")
+    errors = []
+    writer.submit(_outcome(1), on_committed=errors.append)
+    writer.submit(_outcome(2), on_committed=errors.append)
+    writer.close()
+
+    assert len(errors) == 2
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_failed_batch_is_saved_row_by_row(mock_database_service):
+    def _save(outcomes):
+        # Violation de contrainte sur le fichier 2, qui fait échouer tout lot le contenant
+        if any(outcome.file_id == 2 for outcome in outcomes):
+            raise RuntimeError("constraint violation")
+
+    mock_database_service.save_blurry_analysis_outcomes.side_effect = _save
+    writer = _writer("3", "60000")
+    errors = {}
+    for file_id in range(1, 4):
+        writer.submit(_outcome(file_id), on_committed=lambda error, file_id=file_id: errors.update({file_id: error}))
+    writer.close()
+
+    assert errors[1] is None and errors[3] is None
+    assert isinstance(errors[2], RuntimeError)
+    assert mock_database_service.save_blurry_analysis_outcomes.call_count == 4
+
+
+def test_close_flushes_pending_results(mock_database_service):
+    writer = _writer("50", "60000")
+    errors = []
+    writer.submit(_outcome(1), on_committed=errors.append)
+    writer.close()
+
+    assert errors == [None]
+    with pytest.raises(RuntimeError):
+        writer.submit(_outcome(2), on_committed=errors.append)
@@ -0,0 +1,97 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from dossierfacile_file_analysis.services.concurrency_controller import ConcurrencyController
+
+
+ENV = {"CONCURRENCY_MIN": "1", "CONCURRENCY_MAX": "8", "CONCURRENCY_INITIAL": "4",
+       "CONCURRENCY_TARGET_CPU_PERCENT": "80", "CONCURRENCY_MAX_RSS_MB": "1000"}
+
+
+def _saturate(concurrency_controller: ConcurrencyController, service_time: float = 1.0):
+    for _ in range(concurrency_controller.limit):
+        concurrency_controller.record_start()
+    for _ in range(concurrency_controller.limit):
+        concurrency_controller.record_done(service_time)
+
+
+def test_limit_grows_additively_while_cpu_is_available():
+    on_change = MagicMock()
+    with patch.dict(os.environ, ENV):
+        concurrency_controller = ConcurrencyController(on_change=on_change)
+
+    _saturate(concurrency_controller)
+    state = concurrency_controller.decide(cpu_percent=50, rss=0)
+
+    assert state["action"] == "increase"
+    assert concurrency_controller.limit == 5
+    on_change.assert_called_once_with(5)
+
+
+def test_limit_holds_when_slots_are_idle():
+    on_change = MagicMock()
+    with patch.dict(os.environ, ENV):
+        concurrency_controller = ConcurrencyController(on_change=on_change)
+
+    concurrency_controller.record_start()
+    state = concurrency_controller.decide(cpu_percent=50, rss=0)
+
+    assert state["action"] == "hold"
+    assert concurrency_controller.limit == 4
+    on_change.assert_not_called()
+
+
+@pytest.mark.parametrize("cpu_percent, rss_mb, reason", [
+    (95, 100, "cpu above target"),
+    (50, 2000, "rss above limit"),
+])
+def test_limit_decreases_multiplicatively_under_pressure(cpu_percent, rss_mb, reason):
+    on_change = MagicMock()
+    with patch.dict(os.environ, ENV):
+        concurrency_controller = ConcurrencyController(on_change=on_change)
+
+    state = concurrency_controller.decide(cpu_percent=cpu_percent, rss=rss_mb * 1024 * 1024)
+
+    assert state["action"] == "decrease"
+    assert state["reason"] == reason
+    assert concurrency_controller.limit == 3
+    on_change.assert_called_once_with(3)
+
+
+def test_limit_decreases_when_service_time_doubles_after_increase():
+    with patch.dict(os.environ, ENV):
+        concurrency_controller = ConcurrencyController(on_change=MagicMock())
+    _saturate(concurrency_controller, service_time=1.0)
+    concurrency_controller.decide(cpu_percent=50, rss=0)
+
+    for _ in range(20):
+        concurrency_controller.record_start()
+        concurrency_controller.record_done(5.0)
+    state = concurrency_controller.decide(cpu_percent=50, rss=0)
+
+    assert state["reason"] == "service time doubled"
+    assert concurrency_controller.limit == 3
+
+
+def test_limit_stays_within_bounds():
+    with patch.dict(os.environ, {**ENV, "CONCURRENCY_INITIAL": "8"}):
+        concurrency_controller = ConcurrencyController(on_change=MagicMock())
+    _saturate(concurrency_controller)
+    assert concurrency_controller.decide(cpu_percent=10, rss=0)["action"] == "hold"
+
+    for _ in range(10):
+        concurrency_controller.decide(cpu_percent=99, rss=0)
+    assert concurrency_controller.limit == 1
+    assert concurrency_controller.get_state()["minLimit"] == 1
+
+
+def test_cap_lowers_the_bounds_and_the_current_limit():
+    with patch.dict(os.environ, {**ENV, "CONCURRENCY_MIN": "6", "CONCURRENCY_INITIAL": "7"}):
+        concurrency_controller = ConcurrencyController(on_change=MagicMock())
+    concurrency_controller.cap(4)
+
+    assert concurrency_controller.max_limit == 4
+    assert concurrency_controller.min_limit == 4
+    assert concurrency_controller.limit == 4
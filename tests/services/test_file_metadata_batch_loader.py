@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.data.file_dto import FileDto
+from dossierfacile_file_analysis.services.file_metadata_batch_loader import FileMetadataBatchLoader
+
+
+@pytest.fixture
+def mock_db_service():
+    with patch('dossierfacile_file_analysis.services.file_metadata_batch_loader.DossierFacileDatabaseService') as mock_db:
+        yield mock_db.return_value
+
+
+def _file(file_id: int) -> FileDto:
+    return FileDto(id=file_id, path=f"path/{file_id}.pdf", content_type="application/pdf", encryption_key=None,
+                   encryption_key_version=None, provider="S3")
+
+
+def test_prefetched_files_are_loaded_with_one_query(new_singleton, mock_db_service):
+    mock_db_service.get_files_by_ids.side_effect = lambda ids: {file_id: _file(file_id) for file_id in ids}
+    with patch.dict(os.environ, {"METADATA_BATCH_WINDOW_MS": "100"}):
+        batch_loader = new_singleton(FileMetadataBatchLoader)
+
+    for file_id in (1, 2, 3):
+        batch_loader.prefetch(file_id)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        files = list(executor.map(batch_loader.get, (1, 2, 3)))
+
+    assert [file.id for file in files] == [1, 2, 3]
+    mock_db_service.get_files_by_ids.assert_called_once_with([1, 2, 3])
+    # Les résultats consommés ne sont pas conservés
+    assert batch_loader._futures == {}
+
+
+def test_full_batch_is_loaded_without_waiting_for_the_window(new_singleton, mock_db_service):
+    loaded = threading.Event()
+
+    def _get_files_by_ids(ids):
+        loaded.set()
+        return {}
+
+    mock_db_service.get_files_by_ids.side_effect = _get_files_by_ids
+    with patch.dict(os.environ, {"METADATA_BATCH_WINDOW_MS": "60000", "METADATA_BATCH_MAX_SIZE": "2"}):
+        batch_loader = new_singleton(FileMetadataBatchLoader)
+
+    batch_loader.prefetch(1)
+    batch_loader.prefetch(2)
+
+    assert loaded.wait(timeout=5)
+    assert batch_loader.get(1) is None
+
+
+def test_database_error_is_raised_to_every_message(new_singleton, mock_db_service):
+    mock_db_service.get_files_by_ids.side_effect = RuntimeError("database unavailable")
+    with patch.dict(os.environ, {"METADATA_BATCH_WINDOW_MS": "1"}):
+        batch_loader = new_singleton(FileMetadataBatchLoader)
+
+    batch_loader.prefetch(1)
+    with pytest.raises(RuntimeError):
+        batch_loader.get(1)
+    with pytest.raises(RuntimeError):
+        batch_loader.get(2)
+
+
+def test_discarded_file_is_loaded_again_on_redelivery(new_singleton, mock_db_service):
+    mock_db_service.get_files_by_ids.side_effect = [{1: _file(1)}, {1: FileDto(
+        id=1, path="path/renamed.pdf", content_type="application/pdf", encryption_key=None,
+        encryption_key_version=None, provider="S3")}]
+    with patch.dict(os.environ, {"METADATA_BATCH_WINDOW_MS": "1"}):
+        batch_loader = new_singleton(FileMetadataBatchLoader)
+
+    # Message remis en file sans avoir lu son fichier
+    future = batch_loader.prefetch(1)
+    future.result(timeout=5)
+    batch_loader.discard(1, future)
+
+    assert batch_loader.get(1).path == "path/renamed.pdf"
+    assert mock_db_service.get_files_by_ids.call_count == 2
+
+
+def test_discard_before_the_batch_is_loaded(new_singleton, mock_db_service):
+    mock_db_service.get_files_by_ids.side_effect = lambda ids: {file_id: _file(file_id) for file_id in ids}
+    with patch.dict(os.environ, {"METADATA_BATCH_WINDOW_MS": "100"}):
+        batch_loader = new_singleton(FileMetadataBatchLoader)
+
+    future = batch_loader.prefetch(1)
+    batch_loader.discard(1, future)
+
+    # Le lot en attente est chargé sans l'entrée retirée, le loader continue de servir
+    assert future.result(timeout=5).id == 1
+    assert batch_loader.get(2).id == 2
+    assert batch_loader._futures == {}
+
+
+def test_is_disabled_in_process_mode():
+    with patch.dict(os.environ, {"METADATA_BATCH_ENABLED": "true", "EXECUTOR_MODE": "process"}):
+        assert not FileMetadataBatchLoader.is_enabled()
+    with patch.dict(os.environ, {"METADATA_BATCH_ENABLED": "true", "EXECUTOR_MODE": "thread"}):
+        assert FileMetadataBatchLoader.is_enabled()
@@ -0,0 +1,68 @@
+import os
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import pytest
+
+from dossierfacile_file_analysis.services.image_decoder import ImageDecoder
+
+
+def _photo(width: int, height: int, extension: str = ".jpg") -> bytes:
+    image = np.full((height, width, 3), 200, dtype=np.uint8)
+    cv2.putText(image, "DossierFacile", (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (30, 30, 30), 4)
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+@pytest.fixture
+def decoder():
+    with patch.dict(os.environ, {"IMAGE_ANALYSIS_MAX_MEGAPIXELS": "1"}):
+        yield ImageDecoder()
+
+
+@pytest.mark.parametrize("extension", [".jpg", ".png"])
+def test_image_size_is_read_from_the_header(extension, tmp_path):
+    content = _photo(640, 480, extension)
+    path = tmp_path / f"photo{extension}"
+    path.write_bytes(content)
+
+    assert ImageDecoder.read_image_size(content) == (640, 480)
+    assert ImageDecoder.read_image_size(str(path)) == (640, 480)
+    assert ImageDecoder.read_image_size(b"GIF89a") is None
+
+
+def test_jpeg_segments_are_skipped_in_an_in_memory_buffer():
+    content = _photo(640, 480)
+    # Segment APP1 (EXIF) de 4 ko puis octets de remplissage avant le segment suivant
+    exif = b"\xff\xe1" + (4096 + 2).to_bytes(2, "big") + os.urandom(4096) + b"\xff\xff"
+    buffer = bytearray(content[:2] + exif + content[2:])
+
+    assert ImageDecoder.read_image_size(memoryview(buffer)) == (640, 480)
+    assert ImageDecoder.read_image_size(bytes(buffer[:1000])) is None
+
+
+def test_small_images_are_decoded_at_full_size(decoder):
+    gray, scale = decoder.decode_gray(_photo(800, 600))
+
+    assert gray.shape == (600, 800)
+    assert scale == 1.0
+
+
+def test_large_jpeg_is_decoded_with_a_reduced_mode(decoder):
+    # 12 Mpx, 3.5 fois trop grand en largeur : décodage au quart sans redimensionnement
+    with patch('cv2.resize') as mock_resize, \
+            patch('cv2.imdecode', wraps=cv2.imdecode) as mock_imdecode:
+        gray, scale = decoder.decode_gray(_photo(4000, 3000))
+
+    assert mock_imdecode.call_args[0][1] == cv2.IMREAD_REDUCED_GRAYSCALE_4
+    mock_resize.assert_not_called()
+    assert gray.shape == (750, 1000)
+    assert scale == pytest.approx(0.25)
+
+
+def test_images_are_resized_to_the_target_after_a_reduced_decode(decoder):
+    gray, scale = decoder.decode_gray(_photo(2600, 1950))
+
+    assert gray.size <= 1_000_000
+    assert gray.size > 900_000
+    assert scale == pytest.approx(np.sqrt(gray.size / (2600 * 1950)))
@@ -0,0 +1,83 @@
+import os
+from unittest.mock import MagicMock, patch
+
+from dossierfacile_file_analysis.services.memory_governor import MemoryGovernor
+
+MB = 1024 * 1024
+
+
+ENV = {"MEMORY_HIGH_WATERMARK_MB": "1000", "MEMORY_LOW_WATERMARK_MB": "800", "WORKER_MAX_MESSAGES": "",
+       "WORKER_MAX_RSS_GROWTH_MB": ""}
+
+
+def test_consumption_pauses_above_high_watermark_and_resumes_below_low_watermark():
+    callbacks = MagicMock()
+    with patch.dict(os.environ, ENV):
+        memory_governor = MemoryGovernor(on_pause=callbacks.pause, on_resume=callbacks.resume,
+                                         on_recycle=callbacks.recycle)
+
+    assert memory_governor.decide(1200 * MB, {})["paused"]
+    callbacks.pause.assert_called_once()
+
+    # Entre les deux seuils : toujours en pause
+    memory_governor.decide(900 * MB, {})
+    callbacks.resume.assert_not_called()
+
+    assert not memory_governor.decide(700 * MB, {})["paused"]
+    callbacks.resume.assert_called_once()
+    callbacks.pause.assert_called_once()
+
+
+def test_peak_rss_of_a_message():
+    with patch.dict(os.environ, ENV):
+        memory_governor = MemoryGovernor()
+    memory_governor.decide(100 * MB, {})
+
+    token = memory_governor.record_start()
+    memory_governor.decide(300 * MB, {})
+    memory_governor.decide(200 * MB, {})
+
+    assert memory_governor.record_done(token) == 300 * MB
+
+
+def test_workers_are_recycled_once_after_rss_growth():
+    callbacks = MagicMock()
+    with patch.dict(os.environ, {**ENV, "WORKER_MAX_RSS_GROWTH_MB": "200"}):
+        memory_governor = MemoryGovernor(on_pause=callbacks.pause, on_resume=callbacks.resume,
+                                         on_recycle=callbacks.recycle, worker_processes=True)
+
+    memory_governor.decide(500 * MB, {1: 200 * MB, 2: 200 * MB})
+    memory_governor.decide(700 * MB, {1: 450 * MB, 2: 200 * MB})
+    memory_governor.decide(800 * MB, {1: 550 * MB, 2: 200 * MB})
+    callbacks.recycle.assert_called_once_with("rss_growth")
+
+    # Les nouveaux workers ont une nouvelle référence
+    memory_governor.reset_workers()
+    memory_governor.decide(500 * MB, {3: 300 * MB})
+    callbacks.recycle.assert_called_once()
+
+
+def test_consumer_is_recycled_after_max_messages_in_thread_mode():
+    callbacks = MagicMock()
+    with patch.dict(os.environ, {**ENV, "WORKER_MAX_MESSAGES": "2"}):
+        memory_governor = MemoryGovernor(on_pause=callbacks.pause, on_resume=callbacks.resume,
+                                         on_recycle=callbacks.recycle)
+
+    for _ in range(2):
+        memory_governor.record_done(memory_governor.record_start())
+    memory_governor.decide(100 * MB, {1: 100 * MB})
+
+    callbacks.recycle.assert_called_once_with("messages")
+
+
+def test_message_count_is_left_to_the_process_pool():
+    callbacks = MagicMock()
+    with patch.dict(os.environ, {**ENV, "WORKER_MAX_MESSAGES": "2"}):
+        memory_governor = MemoryGovernor(on_pause=callbacks.pause, on_resume=callbacks.resume,
+                                         on_recycle=callbacks.recycle, worker_processes=True)
+
+    for _ in range(3):
+        memory_governor.record_done(memory_governor.record_start())
+    memory_governor.decide(100 * MB, {1: 100 * MB})
+
+    callbacks.recycle.assert_not_called()
@@ -0,0 +1,92 @@
+import os
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from dossierfacile_file_analysis.executor.tasks.abstract_blurry_task import AbstractBlurryTask
+from dossierfacile_file_analysis.models.blurry_execution_context import BlurryExecutionContext
+from dossierfacile_file_analysis.models.blurry_queue_message import BlurryQueueMessage
+from dossierfacile_file_analysis.services.metrics_registry import Counter, Histogram, MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    MetricsRegistry._instance = None
+    metrics_registry = MetricsRegistry()
+    yield metrics_registry
+    metrics_registry.stop_server()
+    MetricsRegistry._instance = None
+
+
+class FakeTask(AbstractBlurryTask):
+    def __init__(self, error: Exception | None = None):
+        super().__init__(task_name="FakeTask")
+        self.error = error
+
+    def _internal_run(self, context: BlurryExecutionContext):
+        if self.error:
+            raise self.error
+
+
+def _context(content_type: str | None) -> BlurryExecutionContext:
+    context = BlurryExecutionContext(BlurryQueueMessage(file_id=1))
+    if content_type:
+        context.file_dto = MagicMock(content_type=content_type)
+    return context
+
+
+def test_counter_and_histogram_text_format():
+    counter = Counter("test_total", "A counter", ("kind",))
+    counter.inc(kind='a"b')
+    counter.inc(2, kind='a"b')
+    histogram = Histogram("test_seconds", "A histogram", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert counter.render() == ['# HELP test_total A counter', '# TYPE test_total counter',
+                                'test_total{kind="a\\"b"} 3']
+    assert histogram.render()[2:] == ['test_seconds_bucket{le="0.1"} 1', 'test_seconds_bucket{le="1"} 2',
+                                      'test_seconds_bucket{le="+Inf"} 3', 'test_seconds_sum 5.55',
+                                      'test_seconds_count 3']
+
+
+def test_task_run_records_duration_and_outcome(registry):
+    FakeTask().run(_context("application/pdf"))
+    with pytest.raises(ValueError):
+        FakeTask(error=ValueError("boom")).run(_context(None))
+
+    text = registry.render()
+    assert 'blurry_tasks_total{task="FakeTask",content_type="application/pdf",outcome="success"} 1' in text
+    assert 'blurry_tasks_total{task="FakeTask",content_type="unknown",outcome="failure"} 1' in text
+    assert 'blurry_task_duration_seconds_count{task="FakeTask",content_type="application/pdf"} 1' in text
+    assert 'blurry_task_cpu_seconds_total{task="FakeTask",content_type="application/pdf"}' in text
+
+
+def test_metrics_are_served_over_http(registry):
+    registry.messages.inc(content_type="image/png", outcome="success")
+    with patch.dict(os.environ, {"METRICS_HOST": "127.0.0.1", "METRICS_PORT": "0"}):
+        registry.start_server()
+    port = registry._server.server_address[1]
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        body = response.read().decode()
+
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'blurry_messages_total{content_type="image/png",outcome="success"} 1' in body
+
+
+def test_worker_observations_are_merged_into_the_consumer_registry(registry):
+    FakeTask().run(_context("application/pdf"))
+    registry.pages.inc(2, content_type="application/pdf")
+    observations = registry.drain()
+
+    assert 'blurry_pages_analysed_total{' not in registry.render()
+    registry.merge(observations)
+    registry.merge(observations)
+
+    text = registry.render()
+    assert 'blurry_pages_analysed_total{content_type="application/pdf"} 4' in text
+    assert 'blurry_tasks_total{task="FakeTask",content_type="application/pdf",outcome="success"} 2' in text
+    assert 'blurry_task_duration_seconds_count{task="FakeTask",content_type="application/pdf"} 2' in text
@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from dossierfacile_file_analysis.services.page_analysis_pool import PageAnalysisPool
+
+
+@pytest.fixture
+def page_analysis_pool():
+    with patch.dict(os.environ, {"PAGE_ANALYSIS_MAX_WORKERS": "4", "PAGE_ANALYSIS_MAX_PAGES_IN_FLIGHT": "2"}):
+        PageAnalysisPool._instance = None
+        pool = PageAnalysisPool()
+    yield pool
+    pool.executor.shutdown()
+    PageAnalysisPool._instance = None
+
+
+def test_imap_keeps_page_order(page_analysis_pool):
+    def analyse(page):
+        # Les premières pages sont les plus lentes
+        time.sleep((5 - page) * 0.01)
+        return page * 10
+
+    assert list(page_analysis_pool.imap(analyse, range(5))) == [0, 10, 20, 30, 40]
+
+
+def test_imap_bounds_pages_in_flight_per_document(page_analysis_pool):
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def analyse(page):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return page
+
+    list(page_analysis_pool.imap(analyse, range(10)))
+
+    assert max_in_flight == 2
+
+
+def test_imap_pulls_pages_lazily(page_analysis_pool):
+    pulled = []
+
+    def pages():
+        for page in range(10):
+            pulled.append(page)
+            yield page
+
+    results = page_analysis_pool.imap(lambda page: page, pages())
+    assert next(results) == 0
+    results.close()
+
+    assert len(pulled) <= 3
@@ -0,0 +1,79 @@
+import os
+import threading
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+
+from dossierfacile_file_analysis.services import tesseract_engine
+from dossierfacile_file_analysis.services.tesseract_engine import TesseractEngine
+
+
+@pytest.fixture
+def fake_tesserocr():
+    module = MagicMock()
+    module.PyTessBaseAPI.side_effect = lambda **kwargs: MagicMock(
+        AllWordConfidences=MagicMock(return_value=[90, 70]))
+    with patch.object(tesseract_engine, 'tesserocr', module):
+        yield module
+
+
+def test_tesserocr_api_is_created_once_per_thread(new_singleton, fake_tesserocr):
+    with patch.dict(os.environ, {"OCR_BACKEND": "auto", "OCR_LANGUAGE": "fra"}):
+        ocr_engine = new_singleton(TesseractEngine)
+    gray = np.zeros((20, 30), dtype=np.uint8)
+
+    assert ocr_engine.average_confidence(gray) == 80
+    assert ocr_engine.average_confidence(gray) == 80
+    fake_tesserocr.PyTessBaseAPI.assert_called_once_with(lang="fra")
+
+    api = ocr_engine._get_api()
+    image_data, *dimensions = api.SetImageBytes.call_args[0]
+    # Tampon de la page, sans copie
+    assert np.shares_memory(np.frombuffer(image_data, dtype=np.uint8), gray)
+    assert dimensions == [30, 20, 1, 30]
+    assert api.Clear.call_count == 2
+
+    other_thread = threading.Thread(target=ocr_engine.average_confidence, args=(gray,))
+    other_thread.start()
+    other_thread.join()
+    assert fake_tesserocr.PyTessBaseAPI.call_count == 2
+
+
+def test_falls_back_to_pytesseract_when_api_can_not_be_initialised(new_singleton, fake_tesserocr):
+    fake_tesserocr.PyTessBaseAPI.side_effect = RuntimeError("Failed to init API, possibly an invalid tessdata path")
+    with patch.dict(os.environ, {"OCR_BACKEND": "auto", "OCR_LANGUAGE": "fra"}):
+        ocr_engine = new_singleton(TesseractEngine)
+
+    with patch.object(tesseract_engine, 'image_to_data', return_value={"conf": ["-1", "50", "30"]}) as mock_data:
+        assert ocr_engine.average_confidence(np.zeros((20, 30), dtype=np.uint8)) == 40
+        ocr_engine.average_confidence(np.zeros((20, 30), dtype=np.uint8))
+
+    assert mock_data.call_count == 2
+    fake_tesserocr.PyTessBaseAPI.assert_called_once()
+
+
+def test_pytesseract_backend_is_used_when_requested(new_singleton, fake_tesserocr):
+    with patch.dict(os.environ, {"OCR_BACKEND": "pytesseract", "OCR_LANGUAGE": "fra"}):
+        ocr_engine = new_singleton(TesseractEngine)
+
+    with patch.object(tesseract_engine, 'image_to_data', return_value={"conf": ["-1"]}):
+        assert ocr_engine.average_confidence(np.zeros((20, 30), dtype=np.uint8)) == 0
+
+    fake_tesserocr.PyTessBaseAPI.assert_not_called()
+
+
+def test_page_is_copied_when_the_binding_only_accepts_bytes(new_singleton, fake_tesserocr):
+    with patch.dict(os.environ, {"OCR_BACKEND": "auto", "OCR_LANGUAGE": "fra"}):
+        ocr_engine = new_singleton(TesseractEngine)
+    gray = np.zeros((20, 30), dtype=np.uint8)
+    api = ocr_engine._get_api()
+
+    def _set_image_bytes(data, *args):
+        if not isinstance(data, bytes):
+            raise TypeError("expected bytes")
+
+    api.SetImageBytes.side_effect = _set_image_bytes
+
+    assert ocr_engine.average_confidence(gray) == 80
+    api.SetImageBytes.assert_called_with(gray.tobytes(), 30, 20, 1, 30)
@@ -0,0 +1,38 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from dossierfacile_file_analysis.services.text_band_locator import TextBandLocator
+
+
+def _projection(rows, height=60, width=40):
+    # Projection fournie par le moteur de statistiques : largeur pleine sur les lignes données, vide ailleurs
+    proj = np.zeros(height, dtype=np.int32)
+    proj[rows] = width
+    return MagicMock(row_projection=MagicMock(return_value=proj))
+
+
+def test_find_bands_merges_rows_closer_than_six_pixels():
+    # Given : lignes 0-9, 14-29 (écart de 4 lignes, fusionnées) et 40-49 (écart de 10 lignes)
+    blur_statistics = _projection(np.r_[0:10, 14:30, 40:50])
+
+    # When
+    starts, ends = TextBandLocator.find_bands(np.zeros((60, 40), dtype=np.uint8), blur_statistics=blur_statistics)
+
+    # Then
+    assert starts.tolist() == [0, 40]
+    assert ends.tolist() == [29, 49]
+
+
+def test_find_bands_without_selected_rows():
+    blur_statistics = _projection(np.array([], dtype=int))
+
+    assert TextBandLocator.find_bands(np.zeros((60, 40), dtype=np.uint8),
+                                      blur_statistics=blur_statistics) == (None, None)
+
+
+def test_tallest_band_keeps_the_first_one_and_stays_in_the_page():
+    starts, ends = np.array([0, 40, 80]), np.array([20, 60, 90])
+
+    assert TextBandLocator.tallest_band(starts, ends, height=95, margin=10) == (0, 30)
+    assert TextBandLocator.tallest_band(starts[1:], ends[1:], height=95, margin=10) == (30, 70)
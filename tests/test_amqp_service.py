@@ -1,8 +1,14 @@
+import pickle
+from concurrent.futures.thread import ThreadPoolExecutor
+
 import pytest
 from unittest.mock import MagicMock, patch
 
+from dossierfacile_file_analysis.exceptions.data_not_found import DataNotFoundException
 from dossierfacile_file_analysis.exceptions.retryable_exception import RetryableException
 from dossierfacile_file_analysis.services.amqp_service import AmqpService
+from dossierfacile_file_analysis.services.blurry_message_processor import BlurryMessageProcessor
+from dossierfacile_file_analysis.services.metrics_registry import MetricsRegistry
 
 
 @pytest.fixture
@@ -127,4 +133,295 @@ def test_message_callback_non_retryable_exception(amqp_service):
         # Expect ack, not retry
         amqp_service.connection.add_callback_threadsafe.assert_called_once()
         mock_channel.basic_ack.assert_called_once_with(delivery_tag=mock_method_frame.delivery_tag)
-        mock_channel.basic_publish.assert_not_called()
\ No newline at end of file
+        mock_channel.basic_publish.assert_not_called()
+
+@pytest.fixture
+def env_without_database():
+    def _with_env(env: dict):
+        return patch.dict('os.environ', {"AMQP_IP": "localhost", "AMQP_PORT": "5672", **env})
+
+    with patch('dossierfacile_file_analysis.services.amqp_service.DossierFacileDatabaseService'):
+        yield _with_env
+
+
+def test_create_executor_defaults_to_thread_pool(env_without_database):
+    with env_without_database({"EXECUTOR_MODE": "", "EXECUTOR_MAX_WORKERS": ""}):
+        service = AmqpService()
+
+    executor = service._create_executor()
+    try:
+        assert isinstance(executor, ThreadPoolExecutor)
+        assert service.max_workers == 4
+    finally:
+        executor.shutdown()
+
+
+def test_create_executor_process_mode_uses_cpu_count(env_without_database):
+    with env_without_database({"EXECUTOR_MODE": "process", "EXECUTOR_MAX_WORKERS": ""}), \
+            patch('os.cpu_count', return_value=16), \
+            patch('dossierfacile_file_analysis.services.amqp_service.ProcessPoolExecutor') as mock_pool:
+        service = AmqpService()
+        executor = service._create_executor()
+
+    assert service.max_workers == 16
+    assert executor == mock_pool.return_value
+    assert mock_pool.call_args.kwargs["max_workers"] == 16
+    assert mock_pool.call_args.kwargs["initializer"] == BlurryMessageProcessor.warm_up
+    # Every worker process is started up front
+    assert executor.submit.call_count == 16
+
+
+def test_exceptions_survive_process_boundary():
+    exception = pickle.loads(pickle.dumps(DataNotFoundException(file_id=42)))
+
+    assert isinstance(exception, RetryableException)
+    assert exception.file_id == 42
+    assert str(exception) == "RetryableException: Data not found for file_id: 42"
+
+
+def test_ack_is_deferred_until_result_is_committed(env_without_database):
+    with env_without_database({"RESULT_WRITE_BEHIND_ENABLED": "true"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.BlurryResultWriter') as mock_writer_class:
+        mock_writer_class.is_enabled.return_value = True
+        service = AmqpService()
+    service.connection = MagicMock()
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.executor = MagicMock()
+    mock_channel = MagicMock()
+
+    service._message_callback(mock_channel, MagicMock(delivery_tag=7), MagicMock(headers={}), b'{"fileId": 1}')
+    future = service.executor.submit.return_value
+    future.add_done_callback.call_args[0][0](future)
+
+    # Not acknowledged until the batch is committed
+    mock_channel.basic_ack.assert_not_called()
+    outcome, = service.result_writer.submit.call_args[0]
+    assert outcome == future.result.return_value
+    on_committed = service.result_writer.submit.call_args.kwargs["on_committed"]
+
+    on_committed(None)
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+    # Save failure: republished to the retry queue with its retry count, then acknowledged
+    on_committed(RuntimeError("database unavailable"))
+    mock_channel.basic_nack.assert_not_called()
+    assert mock_channel.basic_publish.call_args.kwargs["properties"].headers == {"x-retry-count": 1}
+    assert mock_channel.basic_ack.call_count == 2
+
+
+def test_result_save_failure_is_not_retried_forever(env_without_database):
+    with env_without_database({"RESULT_WRITE_BEHIND_ENABLED": "true"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.BlurryResultWriter') as mock_writer_class:
+        mock_writer_class.is_enabled.return_value = True
+        service = AmqpService()
+    service.connection = MagicMock()
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.executor = MagicMock()
+    mock_channel = MagicMock()
+
+    service._message_callback(mock_channel, MagicMock(delivery_tag=7), MagicMock(headers={"x-retry-count": 3}),
+                              b'{"fileId": 1}')
+    future = service.executor.submit.return_value
+    future.add_done_callback.call_args[0][0](future)
+    service.result_writer.submit.call_args.kwargs["on_committed"](RuntimeError("constraint violation"))
+
+    mock_channel.basic_publish.assert_not_called()
+    mock_channel.basic_nack.assert_not_called()
+    mock_channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+def test_stop_listening_sends_pending_acks_before_closing(env_without_database):
+    with env_without_database({"RESULT_WRITE_BEHIND_ENABLED": "true"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.BlurryResultWriter') as mock_writer_class:
+        mock_writer_class.is_enabled.return_value = True
+        service = AmqpService()
+    connection = service.connection = MagicMock(is_closed=False)
+    service.executor = MagicMock()
+
+    service.stop_listening()
+
+    calls = [call[0] for call in connection.method_calls]
+    assert calls.index("process_data_events") < calls.index("close")
+    service.result_writer.close.assert_called_once()
+
+
+def test_failed_analysis_is_written_behind(env_without_database):
+    with env_without_database({"RESULT_WRITE_BEHIND_ENABLED": "true"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.BlurryResultWriter') as mock_writer_class:
+        mock_writer_class.is_enabled.return_value = True
+        service = AmqpService()
+    service.connection = MagicMock()
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.executor = MagicMock()
+    mock_channel = MagicMock()
+
+    service._message_callback(mock_channel, MagicMock(delivery_tag=7), MagicMock(headers={}), b'{"fileId": 12}')
+    future = service.executor.submit.return_value
+    future.result.side_effect = ValueError("Non-retryable error")
+    future.add_done_callback.call_args[0][0](future)
+
+    mock_channel.basic_ack.assert_not_called()
+    outcome, = service.result_writer.submit.call_args[0]
+    assert outcome.file_id == 12
+    assert outcome.analysis_status == "FAILED"
+
+
+def test_message_metadata_is_prefetched(env_without_database):
+    with env_without_database({"METADATA_BATCH_ENABLED": "true", "EXECUTOR_MAX_WORKERS": "2",
+                               "AMQP_PREFETCH_COUNT": "16"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.FileMetadataBatchLoader') as mock_loader_class:
+        mock_loader_class.is_enabled.return_value = True
+        service = AmqpService()
+    service.executor = MagicMock()
+
+    service._message_callback(MagicMock(), MagicMock(delivery_tag=1), MagicMock(headers={}), b'{"fileId": 5}')
+
+    assert service.prefetch_count == 16
+    service.metadata_loader.prefetch.assert_called_once_with(5)
+    service.executor.submit.assert_called_once()
+
+    # L'entrée préchargée est retirée une fois le message traité, qu'il soit acquitté ou retraité
+    service.connection = MagicMock(is_closed=False)
+    future = service.executor.submit.return_value
+    future.result.side_effect = RetryableException("timeout")
+    future.add_done_callback.call_args[0][0](future)
+    service.metadata_loader.discard.assert_called_once_with(5, service.metadata_loader.prefetch.return_value)
+
+
+def test_pipeline_mode_submits_messages_to_the_pipeline(env_without_database):
+    with env_without_database({"EXECUTOR_MODE": "pipeline", "EXECUTOR_MAX_WORKERS": ""}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.BlurryPipeline') as mock_pipeline_class:
+        mock_pipeline_class.default_capacity.return_value = 20
+        service = AmqpService()
+        service.executor = service._create_executor()
+
+    service._message_callback(MagicMock(), MagicMock(delivery_tag=1), MagicMock(headers={}), b'{"fileId": 5}')
+
+    assert service.max_workers == 20
+    service.executor.submit_message.assert_called_once_with(b'{"fileId": 5}', 0)
+
+
+def test_controller_sets_the_prefetch_count(env_without_database):
+    with env_without_database({"CONCURRENCY_CONTROLLER_ENABLED": "true", "CONCURRENCY_MAX": "12",
+                               "CONCURRENCY_INITIAL": "3", "EXECUTOR_MODE": "thread"}):
+        service = AmqpService()
+    service.connection = MagicMock(is_closed=False)
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.channel = MagicMock()
+
+    assert service.max_workers == 12
+    assert service.prefetch_count == 3
+
+    service.concurrency_controller.on_change(5)
+    service.channel.basic_qos.assert_called_once_with(prefetch_count=5)
+    assert service.prefetch_count == 5
+
+
+def test_controller_is_capped_at_the_cpu_count_in_process_mode(env_without_database):
+    with env_without_database({"CONCURRENCY_CONTROLLER_ENABLED": "true", "CONCURRENCY_INITIAL": "8",
+                               "EXECUTOR_MODE": "process"}), patch("os.cpu_count", return_value=4):
+        service = AmqpService()
+
+    assert service.concurrency_controller.max_limit == 4
+    assert service.max_workers == 4
+    assert service.prefetch_count == 4
+
+
+def test_process_mode_exports_the_metrics_of_the_workers(env_without_database):
+    MetricsRegistry._instance = None
+    with env_without_database({"EXECUTOR_MODE": "process"}):
+        service = AmqpService()
+    service.connection = MagicMock(is_closed=False)
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.executor = MagicMock()
+    channel = MagicMock()
+
+    service._message_callback(channel, MagicMock(delivery_tag=1), MagicMock(headers={}), b'{"fileId": 5}')
+    service._message_callback(channel, MagicMock(delivery_tag=2), MagicMock(headers={}), b'{"fileId": 6}')
+
+    assert service.executor.submit.call_args_list[0].args == (BlurryMessageProcessor.process_in_worker,
+                                                               b'{"fileId": 5}', 0)
+    futures = [MagicMock(), MagicMock()]
+    futures[0].result.return_value = (None, None, {"blurry_pages_analysed_total": {("image/png",): 3}})
+    futures[1].result.return_value = (None, RetryableException("timeout"),
+                                      {"blurry_pages_analysed_total": {("image/png",): 1}})
+    for future, call in zip(futures, service.executor.submit.return_value.add_done_callback.call_args_list):
+        call.args[0](future)
+
+    assert 'blurry_pages_analysed_total{content_type="image/png"} 4' in service.metrics.render()
+    assert [call.kwargs["delivery_tag"] for call in channel.basic_ack.call_args_list] == [1, 2]
+    # L'exception renvoyée par le worker est traitée comme si elle avait été levée : le message est retraité
+    channel.basic_publish.assert_called_once()
+    MetricsRegistry._instance = None
+
+
+def test_memory_governor_pauses_and_resumes_consumption(env_without_database):
+    with env_without_database({"MEMORY_GOVERNOR_ENABLED": "true", "MEMORY_HIGH_WATERMARK_MB": "1000"}):
+        service = AmqpService()
+    service.connection = MagicMock(is_closed=False)
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.channel = MagicMock()
+    service.consumer_tag = "ctag"
+    service.channel.basic_cancel.return_value = [(MagicMock(delivery_tag=9), MagicMock(), b'{"fileId": 3}')]
+
+    service.memory_governor.on_pause()
+
+    service.channel.basic_cancel.assert_called_once_with("ctag")
+    # Prefetched message not handed to the callback yet: back to the queue
+    service.channel.basic_nack.assert_called_once_with(delivery_tag=9, requeue=True)
+
+    service.memory_governor.on_resume()
+    assert service.consumer_tag == service.channel.basic_consume.return_value
+
+
+def test_thread_consumer_stops_once_drained_after_recycling(env_without_database):
+    with env_without_database({"MEMORY_GOVERNOR_ENABLED": "true", "EXECUTOR_MODE": "thread"}):
+        service = AmqpService()
+    service.connection = MagicMock(is_closed=False)
+    service.connection.add_callback_threadsafe.side_effect = lambda f: f()
+    service.channel = MagicMock()
+    service.executor = MagicMock()
+    service.consumer_tag = "ctag"
+    service.channel.basic_cancel.return_value = []
+
+    service._message_callback(service.channel, MagicMock(delivery_tag=1), MagicMock(headers={}), b'{"fileId": 5}')
+    service.memory_governor.on_recycle("messages")
+    service.channel.stop_consuming.assert_not_called()
+
+    future = service.executor.submit.return_value
+    future.add_done_callback.call_args[0][0](future)
+
+    service.channel.basic_ack.assert_called_once_with(delivery_tag=1)
+    service.channel.stop_consuming.assert_called_once()
+    service.channel.basic_consume.assert_not_called()
+
+
+def test_process_pool_is_replaced_when_recycling(env_without_database):
+    with env_without_database({"MEMORY_GOVERNOR_ENABLED": "true", "EXECUTOR_MODE": "process",
+                               "EXECUTOR_MAX_WORKERS": "2", "WORKER_MAX_MESSAGES": "50"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.ProcessPoolExecutor') as mock_pool:
+        service = AmqpService()
+        service.connection = MagicMock(is_closed=False)
+        service.executor = previous_executor = MagicMock()
+        mock_pool.return_value = MagicMock()
+
+        service.memory_governor.on_recycle("rss_growth")
+        # Le remplacement attend le thread de la connexion
+        assert service.executor == previous_executor
+        service.connection.add_callback_threadsafe.call_args.args[0]()
+
+    assert service.executor == mock_pool.return_value
+    assert mock_pool.call_args.kwargs["max_tasks_per_child"] == 50
+    # Les tâches de démarrage ne sont pas décomptées de la limite de messages
+    mock_pool.return_value.submit.assert_not_called()
+    previous_executor.shutdown.assert_called_once_with(wait=False)
+
+
+def test_worker_message_limit_requires_the_memory_governor(env_without_database):
+    with env_without_database({"MEMORY_GOVERNOR_ENABLED": "false", "EXECUTOR_MODE": "process",
+                               "EXECUTOR_MAX_WORKERS": "2", "WORKER_MAX_MESSAGES": "50"}), \
+            patch('dossierfacile_file_analysis.services.amqp_service.ProcessPoolExecutor') as mock_pool:
+        executor = AmqpService()._create_executor()
+
+    assert mock_pool.call_args.kwargs["max_tasks_per_child"] is None
+    assert executor.submit.call_count == 2